@@ -0,0 +1,315 @@
+"""Offline benchmarks for bot.py against a fake Telegram Bot API.
+
+Seeds a throwaway SQLite database with ``--rows`` memes (mostly posted
+history, a pending tail), starts a local aiohttp server that answers Bot API
+calls with configurable latency, 400 errors and 429 RetryAfter floods, and
+drives bot.py's own code paths through a real python-telegram-bot ``Bot``:
+
+    ingest           ingest_memes() on bursts of new memes (duplicate checks + slot allocation)
+    scheduled_text   one compact /scheduled page
+    scheduled_media  one /scheduled page sent as an album
+    drain            pop_due_memes_and_post() over a backlog of due memes
+
+For each operation it reports throughput, p50/p99 latency and database time
+per operation (from bot.DB_SECONDS). ``--save`` writes the results as JSON;
+``--check`` compares against such a file and exits 1 on a regression, for CI:
+
+    python benchmarks/bench.py --rows 100000 --save benchmarks/baseline.json
+    python benchmarks/bench.py --check benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CHANNEL_ID", "@bench")
+os.environ.setdefault("OWNER_ID", "1")
+
+import bot  # noqa: E402
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+TOKEN = "123456:BENCH"
+SEED_CHUNK = 50_000
+
+
+class FakeBotAPI:
+    """Answers Bot API methods with canned messages after ``latency`` seconds.
+
+    ``error_rate`` of send calls fail with 400 Bad Request and ``flood_rate``
+    with 429 Too Many Requests (retry_after=``retry_after``).
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = {}
+        self._runner = None
+        self._message_id = 0
+        self.port = None
+
+    def _message(self, method: str) -> dict:
+        self._message_id += 1
+        msg = {"message_id": self._message_id, "date": int(datetime.now().timestamp()),
+               "chat": {"id": -1001, "type": "channel", "title": "bench"}}
+        file = {"file_id": f"fid-{self._message_id}", "file_unique_id": f"fu-{self._message_id}"}
+        if method == "sendPhoto":
+            msg["photo"] = [dict(file, width=1, height=1)]
+        elif method == "sendVideo":
+            msg["video"] = dict(file, width=1, height=1, duration=1)
+        elif method == "sendAnimation":
+            msg["animation"] = dict(file, width=1, height=1, duration=1)
+        elif method == "sendDocument":
+            msg["document"] = file
+        return msg
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await request.read()
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+        if method.startswith("send"):
+            roll = self.random.random()
+            if roll < self.flood_rate:
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+            if roll < self.flood_rate + self.error_rate:
+                return web.json_response({"ok": False, "error_code": 400,
+                                          "description": "Bad Request: wrong file identifier"}, status=400)
+        if method == "sendMediaGroup":
+            form = await request.post()
+            count = len(json.loads(form.get("media", "[]")))
+            return web.json_response({"ok": True, "result": [self._message("sendPhoto") for _ in range(count)]})
+        return web.json_response({"ok": True, "result": self._message(method)})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def seed_db(rows: int, pending: int):
+    """``rows`` memes: the oldest ``rows - pending`` already posted, the rest pending in future slots."""
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    history = rows - pending
+    kinds = ("photo", "video", "animation")
+    async with bot.acquire_db() as db:
+        for start in range(0, rows, SEED_CHUNK):
+            batch = []
+            for i in range(start, min(rows, start + SEED_CHUNK)):
+                posted = 1 if i < history else 0
+                ts = now_ts - (history - i) * 3600 if posted else now_ts + (i - history + 1) * 3600
+                kind = kinds[i % 3]
+                batch.append((f"seed-{i}", "video" if kind == "video" else "image", kind, f"seed-u{i}",
+                              ts, posted, now_ts, f"seed-{i}"))
+            await db.executemany(
+                "INSERT INTO memes (owner_file_id, mime_type, media_kind, file_unique_id, scheduled_ts, posted,"
+                " created_ts, preview_file_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            await db.commit()
+        await db.execute("ANALYZE")
+        await db.commit()
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(name: str, iterations: int, op, items_per_op: int = 1) -> dict:
+    """Run ``op(i)`` ``iterations`` times; throughput is in items (memes) per second."""
+    db_before = bot.DB_SECONDS.total()
+    samples = []
+    started = perf_counter()
+    for i in range(iterations):
+        t = perf_counter()
+        await op(i)
+        samples.append(perf_counter() - t)
+    wall = perf_counter() - started
+    return {
+        "op": name,
+        "n": iterations,
+        "throughput": iterations * items_per_op / wall if wall else 0.0,
+        "p50_ms": _percentile(samples, 0.5) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "db_ms": (bot.DB_SECONDS.total() - db_before) * 1000 / iterations,
+    }
+
+
+async def bench_drain(api_bot, backlog: int) -> dict:
+    """Make ``backlog`` pending memes due and drain them in one poster pass; latencies come from post_events."""
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    async with bot.acquire_db() as db:
+        await db.execute(
+            "UPDATE memes SET scheduled_ts=? - 1 WHERE id IN"
+            " (SELECT id FROM memes WHERE posted=0 ORDER BY scheduled_ts LIMIT ?)",
+            (now_ts, backlog),
+        )
+        await db.commit()
+    db_before = bot.DB_SECONDS.total()
+    started = perf_counter()
+    await bot.pop_due_memes_and_post(type("Ctx", (), {"bot": api_bot})())
+    wall = perf_counter() - started
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT latency_ms FROM post_events WHERE ts>=?", (now_ts - 1,)) as cur:
+            latencies = [row[0] for row in await cur.fetchall()] or [0]
+    return {
+        "op": "drain",
+        "n": backlog,
+        "throughput": backlog / wall if wall else 0.0,
+        "p50_ms": float(_percentile(latencies, 0.5)),
+        "p99_ms": float(_percentile(latencies, 0.99)),
+        "db_ms": (bot.DB_SECONDS.total() - db_before) * 1000 / backlog,
+    }
+
+
+async def run_benchmarks(args) -> list:
+    api = FakeBotAPI(args.latency / 1000, args.error_rate, args.flood_rate, args.retry_after, args.seed)
+    base_url = await api.start()
+    api_bot = Bot(TOKEN, base_url=base_url, request=HTTPXRequest(connection_pool_size=8))
+    workdir = tempfile.mkdtemp(prefix="memebot-bench-")
+    if not args.real_limits:
+        bot.rate_limiter = bot.PostRateLimiter(1e6, 1e8, 1e6)
+    results = []
+    try:
+        await api_bot.initialize()
+        await bot.open_db(os.path.join(workdir, "bench.db"))
+        t = perf_counter()
+        await seed_db(args.rows, max(args.backlog, int(args.rows * args.pending_fraction)))
+        print(f"seeded {args.rows} rows in {perf_counter() - t:.1f}s", file=sys.stderr)
+
+        burst = args.burst
+
+        async def ingest(i):
+            await bot.ingest_memes([
+                bot.NewMeme(f"new-{i}-{j}", "image", None, "photo", f"new-u{i}-{j}") for j in range(burst)
+            ])
+
+        pages = max(1, args.backlog // bot.SCHEDULED_TEXT_PAGE_SIZE)
+
+        async def scheduled_text(i):
+            await bot.render_scheduled_page(api_bot, -1001, 1 + i % pages, True)
+
+        async def scheduled_media(i):
+            await bot.render_scheduled_page(api_bot, -1001, 1 + i % pages, False)
+
+        results.append(await measure("ingest", args.iterations, ingest, burst))
+        results.append(await measure("scheduled_text", args.iterations, scheduled_text))
+        results.append(await measure("scheduled_media", max(1, args.iterations // 5), scheduled_media))
+        results.append(await bench_drain(api_bot, args.backlog))
+        print("fake API calls: " + ", ".join(f"{m}={n}" for m, n in sorted(api.calls.items())), file=sys.stderr)
+    finally:
+        await bot.close_db()
+        await api_bot.shutdown()
+        await api.stop()
+    return results
+
+
+def format_results(results) -> str:
+    lines = [f"{'op':<16}{'n':>8}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'db ms/op':>10}"]
+    for r in results:
+        lines.append(f"{r['op']:<16}{r['n']:>8}{r['throughput']:>12.1f}{r['p50_ms']:>10.2f}"
+                     f"{r['p99_ms']:>10.2f}{r['db_ms']:>10.2f}")
+    return "\n".join(lines)
+
+
+def find_regressions(results, baseline, tolerance: float, noise_ms: float = 5.0) -> list:
+    """Ops whose throughput fell, or whose p99 rose, by more than ``tolerance`` against ``baseline``.
+
+    Millisecond-scale ops jitter by more than 30% from run to run, so a change
+    also has to cost at least ``noise_ms`` per item (or on p99) to count.
+    """
+    base = {r["op"]: r for r in baseline["results"]}
+    problems = []
+    for r in results:
+        b = base.get(r["op"])
+        if b is None:
+            continue
+        slower_ms = 1000 / max(r["throughput"], 1e-9) - 1000 / max(b["throughput"], 1e-9)
+        if r["throughput"] < b["throughput"] * (1 - tolerance) and slower_ms > noise_ms:
+            problems.append(f"{r['op']}: throughput {r['throughput']:.1f}/s vs baseline {b['throughput']:.1f}/s")
+        if r["p99_ms"] > b["p99_ms"] * (1 + tolerance) and r["p99_ms"] - b["p99_ms"] > noise_ms:
+            problems.append(f"{r['op']}: p99 {r['p99_ms']:.2f}ms vs baseline {b['p99_ms']:.2f}ms")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, help="memes in the seeded DB, 10k-1M (default: the --check baseline's, else 10k)")
+    parser.add_argument("--pending-fraction", type=float, default=0.01, help="share of seeded rows still pending")
+    parser.add_argument("--backlog", type=int, default=200, help="due memes drained by the drain op")
+    parser.add_argument("--iterations", type=int, default=50, help="runs of each handler op")
+    parser.add_argument("--burst", type=int, default=10, help="memes per ingest call")
+    parser.add_argument("--latency", type=float, default=20.0, help="fake Bot API latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of sends failing with 400")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of sends failing with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds on injected 429s")
+    parser.add_argument("--real-limits", action="store_true", help="keep bot.py's Telegram rate limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep bot.py's per-post INFO logging")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--check", help="compare against this JSON baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--noise-ms", type=float, default=5.0, help="ignore regressions smaller than this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    baseline = None
+    if args.check:
+        with open(args.check) as fh:
+            baseline = json.load(fh)
+    if args.rows is None:
+        args.rows = baseline["rows"] if baseline else 10_000
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run_benchmarks(args))
+    finally:
+        loop.close()
+    print(format_results(results))
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump({"rows": args.rows, "latency_ms": args.latency, "results": results}, fh, indent=2)
+    if baseline:
+        problems = find_regressions(results, baseline, args.tolerance, args.noise_ms)
+        if problems:
+            print("Regressions:\n  " + "\n  ".join(problems), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,366 +1,2835 @@
-posting_log = []  # in-memory log
+from __future__ import annotations
 
+from time import perf_counter
+
+# (label, perf_counter) checkpoints for --profile-startup; see startup_mark()
+_startup_marks = [("start", perf_counter())]
 
 import asyncio
+import csv
+import functools
+import heapq
+import hmac
+import io
+import json
 import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import uuid
 import logging
+from time import monotonic
 from datetime import datetime, time, timedelta
 import aiosqlite
-from typing import Optional
-import io
-import pytz
+import httpx
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from telegram import Update, Message, InputFile
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
+# aiohttp (webhook/metrics server) and Pillow (perceptual hashes) are only
+# needed in some configurations and are imported on first use.
+if TYPE_CHECKING:  # pragma: no cover
+    from aiohttp import web
+
+_startup_marks.append(("import stdlib, aiosqlite, httpx", perf_counter()))
+
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputFile,
+    InputMediaPhoto,
+    InputMediaVideo,
+    Message,
+    Update,
+)
+from telegram.error import RetryAfter
+from telegram.ext import (
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
+
+_startup_marks.append(("import telegram", perf_counter()))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# IST timezone
-IST = pytz.timezone('Asia/Kolkata')
+# Scheduling timezone: IST unless MEMEBOT_TZ names another one
+IST = ZoneInfo(os.environ.get("MEMEBOT_TZ", "Asia/Kolkata"))
 
 DB_PATH = os.environ.get("MEMEBOT_DB", "memes.db")
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 OWNER_ID = int(os.environ.get("OWNER_ID", "0"))
 CHANNEL_ID = os.environ.get("CHANNEL_ID")  # @channelusername or -100<id>
+# CHANNEL_ID/OWNER_ID are channel 1; owners add more channels with /addchannel
+DEFAULT_CHANNEL = 1
+
+DB_POOL_SIZE = int(os.environ.get("MEMEBOT_DB_POOL_SIZE", "2"))
+
+# "polling" (default) or "webhook". Webhook mode runs our own aiohttp server;
+# Telegram is told to deliver to MEMEBOT_WEBHOOK_URL + MEMEBOT_WEBHOOK_PATH.
+BOT_MODE = os.environ.get("MEMEBOT_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("MEMEBOT_WEBHOOK_URL")
+WEBHOOK_SECRET = os.environ.get("MEMEBOT_WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.environ.get("MEMEBOT_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("MEMEBOT_WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("MEMEBOT_WEBHOOK_PATH", "/telegram")
+# Prometheus text metrics: set MEMEBOT_METRICS_PORT to serve GET /metrics on a
+# separate listener (both modes; never on the public webhook server). It binds
+# to loopback unless MEMEBOT_METRICS_LISTEN says otherwise, e.g. 0.0.0.0 inside
+# a container so Prometheus on the compose network can scrape it.
+METRICS_PORT = int(os.environ.get("MEMEBOT_METRICS_PORT", "0"))
+METRICS_LISTEN = os.environ.get("MEMEBOT_METRICS_LISTEN", "127.0.0.1")
+# updates handled at once (both modes); 1 keeps the old strictly sequential behaviour.
+# Slot allocation and posting claims are atomic in the database, so handlers may overlap.
+CONCURRENT_UPDATES = int(os.environ.get("MEMEBOT_CONCURRENT_UPDATES", "16"))
 
 SLOTS = [time(11, 0), time(16, 0), time(21, 0)]
+WEEKDAY_NAMES = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS memes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                owner_file_id TEXT NOT NULL,
-                mime_type TEXT,
-                scheduled_ts INTEGER NOT NULL,
-                posted INTEGER DEFAULT 0,
-                created_ts INTEGER NOT NULL
-            )
-            """
+# Seconds before the poster loop retries after an unexpected error, and the
+# longest it sleeps before re-reading the clock and the pending queue. The
+# resync picks up rows written by another process (e.g. a CLI import) and
+# guards against wall-clock jumps.
+POST_RETRY_DELAY = 30
+POSTER_RESYNC = int(os.environ.get("MEMEBOT_POSTER_RESYNC", "60"))
+
+# Posting pipeline: Telegram allows ~30 messages/s overall, ~20/min into
+# one group or channel and about one per second into a private chat. A meme
+# that keeps failing is retried with exponential backoff and moved to the
+# dead-letter state (posted=-1) after POST_MAX_ATTEMPTS.
+GLOBAL_RATE_PER_SECOND = float(os.environ.get("MEMEBOT_GLOBAL_RATE", "25"))
+CHAT_RATE_PER_MINUTE = float(os.environ.get("MEMEBOT_CHAT_RATE", "18"))
+CHAT_BURST = float(os.environ.get("MEMEBOT_CHAT_BURST", "3"))
+PRIVATE_RATE_PER_SECOND = float(os.environ.get("MEMEBOT_PRIVATE_RATE", "1"))
+POST_MAX_ATTEMPTS = int(os.environ.get("MEMEBOT_POST_MAX_ATTEMPTS", "5"))
+POST_BACKOFF_BASE = 30
+POST_BACKOFF_MAX = 3600
+POST_MAX_FLOOD_WAITS = 3
+POST_COMMIT_BATCH = 10
+DEAD_LETTER = -1
+# A meme being posted is claimed (posted=2) for POST_LEASE_SECONDS so the poster,
+# /postnow and other processes never send it twice; a claim left behind by a
+# crash expires and the meme is retried.
+POSTING = 2
+POST_LEASE_SECONDS = int(os.environ.get("MEMEBOT_POST_LEASE", "900"))
+# Writing a post's outcome is retried with backoff (1s, 2s, 4s...) before it is
+# parked in memory for the next poster pass; a sent meme must not lose its claim.
+POST_FLUSH_RETRIES = 4
+POST_FLUSH_RETRY_DELAY = 1.0
+
+# Catch-up after downtime: a meme more than CATCHUP_GRACE seconds past its slot
+# counts as missed. When a channel has more than CATCHUP_BURST missed memes the
+# policy decides what happens to the rest: "now" posts them all at once, "spread"
+# moves them into the channel's next free slots, "shift" pushes the whole queue
+# back slot by slot until it reaches a gap.
+CATCHUP_POLICIES = ("now", "spread", "shift")
+CATCHUP_POLICY = os.environ.get("MEMEBOT_CATCHUP", "spread").lower()
+CATCHUP_GRACE = int(os.environ.get("MEMEBOT_CATCHUP_GRACE", "900"))
+CATCHUP_BURST = int(os.environ.get("MEMEBOT_CATCHUP_BURST", "1"))
+CATCHUP_UPDATE_CHUNK = 400  # (id, ts) pairs per batched UPDATE, well under SQLite's variable limit
+# Every post attempt is recorded in post_events for /log; older events are pruned.
+POST_EVENT_RETENTION_DAYS = int(os.environ.get("MEMEBOT_LOG_RETENTION_DAYS", "90"))
+
+# Background maintenance: posted memes older than ARCHIVE_AFTER_DAYS move to
+# memes_archive (0 keeps them), then freed pages are returned to the OS and
+# planner statistics refreshed. Runs every MAINTENANCE_INTERVAL_HOURS.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("MEMEBOT_ARCHIVE_DAYS", "30"))
+MAINTENANCE_INTERVAL_HOURS = float(os.environ.get("MEMEBOT_MAINTENANCE_HOURS", "6"))
+MAINTENANCE_FIRST_DELAY = 300
+ARCHIVE_CHUNK = 500
+VACUUM_PAGES_PER_STEP = 2000
+ANALYSIS_LIMIT = 1000
+LOG_PAGE_SIZE = 15
+
+# Online snapshots with the SQLite backup API: BACKUP_PAGES_PER_STEP pages at a
+# time on a worker thread, pausing between steps so the poster's writes get in.
+# Taken every BACKUP_INTERVAL_HOURS (0 = only on /backup); the newest BACKUP_KEEP
+# are kept. Restore with `python bot.py --restore <snapshot>` while the bot is stopped.
+BACKUP_DIR = os.environ.get(
+    "MEMEBOT_BACKUP_DIR", os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "backups")
+)
+BACKUP_INTERVAL_HOURS = float(os.environ.get("MEMEBOT_BACKUP_HOURS", "24"))
+BACKUP_KEEP = int(os.environ.get("MEMEBOT_BACKUP_KEEP", "7"))
+BACKUP_FIRST_DELAY = 600
+BACKUP_PAGES_PER_STEP = 1000
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_SEND_LIMIT = 50 * 1024 * 1024  # largest document a bot may upload
+
+# Bulk import/export (/export, /import, `python bot.py export|import`): rows are
+# read, checked for duplicates and given slots IMPORT_CHUNK at a time.
+EXPORT_FIELDS = (
+    "id", "channel_id", "scheduled_ts", "posted", "owner_file_id", "mime_type", "media_kind", "caption",
+    "file_unique_id", "phash", "created_ts",
+)
+EXPORT_FORMATS = ("jsonl", "csv")
+IMPORT_CHUNK = 1000
+
+# /scheduled pages: one media-group album (Telegram allows at most 10 items)
+# per page, or a longer compact text listing.
+SCHEDULED_PAGE_SIZE = 10
+SCHEDULED_TEXT_PAGE_SIZE = 40
+
+# Download+reupload fallback cache (LRU by mtime, capped in bytes)
+MEDIA_CACHE_DIR = os.environ.get(
+    "MEMEBOT_MEDIA_CACHE", os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "media-cache")
+)
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get("MEMEBOT_MEDIA_CACHE_MB", "200")) * 1024 * 1024
+MEDIA_DOWNLOAD_TIMEOUT = 60
+# Telegram's file_unique_id is URL-safe base64. It names cache files, so any
+# other value (e.g. from an imported record) is never used as a path.
+FILE_UNIQUE_ID_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+# Preview renditions built in the background for new memes: small JPEGs for
+# photos (needs Pillow) and short silent clips for videos and animations (needs
+# ffmpeg). Each is uploaded once to the owner's chat and only its file_id kept.
+# Without the tools, previews fall back to sending the original file.
+PREVIEWS_ENABLED = os.environ.get("MEMEBOT_PREVIEWS", "1") == "1"
+PREVIEW_WORKERS = int(os.environ.get("MEMEBOT_PREVIEW_WORKERS", "1"))
+PREVIEW_MAX_SIDE = 320
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_CLIP_SECONDS = 6
+PREVIEW_CLIP_BITRATE = "250k"
+PREVIEW_RENDER_TIMEOUT = 120
+
+# What to do when the owner sends a meme we already have: reject, warn or allow.
+# MEMEBOT_PHASH=1 also matches re-encoded copies of images (needs Pillow).
+DUPLICATE_POLICIES = ("reject", "warn", "allow")
+DUPLICATE_POLICY = os.environ.get("MEMEBOT_DUPLICATE_POLICY", "reject").lower()
+PHASH_ENABLED = os.environ.get("MEMEBOT_PHASH", "0") == "1"
+
+# Memes arriving within INGEST_WINDOW seconds of each other (an album, a bulk
+# forward) are scheduled as one batch, flushed at most INGEST_MAX_WAIT after the first.
+INGEST_WINDOW = float(os.environ.get("MEMEBOT_INGEST_WINDOW", "1.5"))
+INGEST_MAX_WAIT = 10.0
+
+# Applied to every pooled connection. WAL lets the poster write while command
+# handlers read; busy_timeout covers the short window where two writers meet.
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+]
+
+# Hot queries over the pending queue. All of them filter on posted=0 and
+# order by scheduled_ts: the poster's queries across all channels use the
+# partial index idx_memes_pending, the per-channel ones idx_memes_channel_pending.
+SQL_LAST_PENDING_TS = (
+    "SELECT scheduled_ts FROM memes WHERE posted=0 AND channel_id=? ORDER BY scheduled_ts DESC LIMIT 1"
+)
+SQL_DUE_MEMES = (
+    "SELECT channel_id, id, owner_file_id, mime_type, caption, attempts, COALESCE(send_method, media_kind),"
+    " scheduled_ts FROM memes"
+    " WHERE posted=0 AND scheduled_ts<=? AND (next_attempt_ts IS NULL OR next_attempt_ts<=?)"
+    " ORDER BY scheduled_ts ASC"
+)
+SQL_PENDING_PAGE = (
+    "SELECT id, scheduled_ts, owner_file_id, mime_type, preview_file_id, caption, COALESCE(send_method, media_kind),"
+    " file_unique_id, preview_kind, (SELECT COUNT(*) FROM memes WHERE posted=0 AND channel_id=?) FROM memes"
+    " WHERE posted=0 AND channel_id=? ORDER BY scheduled_ts ASC LIMIT ? OFFSET ?"
+)
+# /postnow claims one row in a single statement; "{}" is the subquery picking
+# its id, usually SQL_NEXT_PENDING (the channel's next pending meme).
+SQL_NEXT_PENDING = "SELECT id FROM memes WHERE posted=0 AND channel_id=? ORDER BY scheduled_ts ASC LIMIT 1"
+SQL_PENDING_BY_ID = "SELECT id FROM memes WHERE posted=0 AND id=? AND channel_id=?"
+SQL_CLAIM_MEME = (
+    f"UPDATE memes SET posted={POSTING}, lease_until=? WHERE posted=0 AND id=({{}})"
+    " RETURNING id, owner_file_id, mime_type, COALESCE(send_method, media_kind)"
+)
+# Duplicate checks within one channel, over live and archived memes; "{0}" is
+# filled with one "?" per key being looked up, and the keys are bound twice.
+SQL_DUPLICATES_BY_UNIQUE_ID = (
+    "SELECT file_unique_id, id, posted, scheduled_ts FROM memes WHERE file_unique_id IN ({0}) AND channel_id=?"
+    " UNION ALL SELECT file_unique_id, id, posted, scheduled_ts FROM memes_archive"
+    " WHERE file_unique_id IN ({0}) AND channel_id=?"
+)
+SQL_DUPLICATES_BY_PHASH = (
+    "SELECT phash, id, posted, scheduled_ts FROM memes WHERE phash IN ({0}) AND channel_id=?"
+    " UNION ALL SELECT phash, id, posted, scheduled_ts FROM memes_archive WHERE phash IN ({0}) AND channel_id=?"
+)
+# Every time the poster must wake for: pending slots and retries, plus the
+# expiry of posting claims, so a meme orphaned by a crash is released and
+# posted even when nothing else is due.
+SQL_PENDING_TS = (
+    "SELECT MAX(scheduled_ts, COALESCE(next_attempt_ts, 0)) FROM memes WHERE posted=0"
+    f" UNION ALL SELECT lease_until FROM memes WHERE posted={POSTING} AND lease_until IS NOT NULL"
+)
+# Posting history, newest first, served by idx_post_events_channel_ts. "{}" takes
+# an optional "AND outcome IN (...)" filter.
+SQL_INSERT_POST_EVENT = (
+    "INSERT INTO post_events (ts, channel_id, meme_id, outcome, method, latency_ms, attempt, error_class, error)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_RECENT_POST_EVENTS = (
+    "SELECT ts, meme_id, outcome, method, latency_ms, attempt, error_class, error FROM post_events"
+    " WHERE channel_id=? AND ts>=? {} ORDER BY ts DESC, id DESC LIMIT ?"
+)
+SQL_POST_EVENT_STATS = (
+    "SELECT outcome, COUNT(*), AVG(latency_ms), MAX(latency_ms) FROM post_events"
+    " WHERE channel_id=? AND ts>=? GROUP BY outcome"
+)
+SQL_POST_EVENT_ERRORS = (
+    "SELECT error_class, COUNT(*) FROM post_events WHERE channel_id=? AND ts>=? AND error_class IS NOT NULL"
+    " GROUP BY error_class ORDER BY COUNT(*) DESC LIMIT 3"
+)
+
+
+class Metric:
+    """One metric family with optional labels, in Prometheus text exposition format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels(self, key, extra=()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{n}="{v}"' for n, v in pairs) + "}"
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{self._labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """Sum over every series matching ``labels``."""
+        return sum(v for key, v in self.values.items()
+                   if all(key[self.labelnames.index(n)] == str(val) for n, val in labels.items()))
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        series = self.values.setdefault(self._key(labels), [0] * (len(self.buckets) + 1) + [0.0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def _merged(self, labels) -> list:
+        merged = [0] * (len(self.buckets) + 1) + [0.0]
+        for key, series in self.values.items():
+            if all(key[self.labelnames.index(n)] == str(val) for n, val in labels.items()):
+                merged = [a + b for a, b in zip(merged, series)]
+        return merged
+
+    def count(self, **labels) -> int:
+        return int(self._merged(labels)[-2])
+
+    def total(self, **labels) -> float:
+        """Sum of observed values over every series matching ``labels``."""
+        return self._merged(labels)[-1]
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate the ``q`` quantile from the buckets (linear within a bucket), as Prometheus does."""
+        series = self._merged(labels)
+        total = series[-2]
+        if not total:
+            return None
+        rank, lower, below = q * total, 0.0, 0
+        for bound, cumulative in zip(self.buckets, series):
+            if cumulative >= rank:
+                in_bucket = cumulative - below
+                return lower + (bound - lower) * ((rank - below) / in_bucket if in_bucket else 0)
+            lower, below = bound, cumulative
+        return self.buckets[-1] if self.buckets else None
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            for bound, cumulative in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {series[-2]}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{self._labels(key)} {series[-2]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-local metrics. Gauges that need a query are refreshed by collectors at scrape time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=()) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    async def collect(self):
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception:
+                logger.exception("Metrics collector %s failed", collector.__name__)
+
+    async def render(self) -> str:
+        await self.collect()
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+
+class timed:
+    """Observe elapsed seconds into ``histogram``; a (sync or async) context manager, or a decorator for async functions.
+
+    ``with timed(DB_SECONDS, query="due"): ...`` or ``@timed(HANDLER_SECONDS, handler="preview")``
+    """
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._started = []
+
+    def __enter__(self):
+        self._started.append(monotonic())
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(monotonic() - self._started.pop(), **self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = monotonic()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.histogram.observe(monotonic() - started, **self.labels)
+        return wrapper
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600, 7200, 21600)
+
+metrics = MetricsRegistry()
+HANDLER_SECONDS = metrics.histogram("memebot_handler_seconds", "Time spent in command handlers", ["handler"], LATENCY_BUCKETS)
+API_SECONDS = metrics.histogram("memebot_api_seconds", "Bot API call latency", ["method"], LATENCY_BUCKETS)
+API_ERRORS = metrics.counter("memebot_api_errors_total", "Failed Bot API calls", ["method", "error"])
+DB_SECONDS = metrics.histogram("memebot_db_seconds", "Time spent in database work", ["query"], LATENCY_BUCKETS)
+FALLBACKS = metrics.counter("memebot_fallbacks_total", "Send fallbacks taken", ["kind"])
+POSTS = metrics.counter("memebot_posts_total", "Post attempts by outcome", ["outcome"])
+PREVIEWS = metrics.counter("memebot_previews_total", "Preview renditions by outcome", ["outcome"])
+POST_LAG_SECONDS = metrics.histogram(
+    "memebot_post_lag_seconds", "Delay between a meme's scheduled_ts and its post", buckets=LAG_BUCKETS
+)
+QUEUE_DEPTH = metrics.gauge("memebot_queue_depth", "Pending memes per channel", ["channel"])
+NEXT_POST_SECONDS = metrics.gauge("memebot_next_post_seconds", "Seconds until the poster next wakes up")
+
+
+class DBPool:
+    """A small pool of long-lived aiosqlite connections.
+
+    Every aiosqlite connection owns a worker thread, so handlers borrow one of
+    these instead of connecting (and re-checking the schema) on every call.
+    """
+
+    def __init__(self, path: str, size: int = 2):
+        self.path = path
+        self.size = max(1, size)
+        self._conns = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def open(self):
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path)
+            for pragma in SQLITE_PRAGMAS:
+                await conn.execute(pragma)
+            self._conns.append(conn)
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._idle is None:
+            raise RuntimeError("Database pool is not open")
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            # never hand a half-finished transaction to the next borrower
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._conns:
+            await conn.close()
+        self._conns = []
+        self._idle = None
+
+
+db_pool: Optional[DBPool] = None
+
+
+async def open_db(path: Optional[str] = None, size: Optional[int] = None) -> DBPool:
+    """Open the shared connection pool and bring the schema up to date. Called once at startup."""
+    global db_pool
+    pool = DBPool(path or DB_PATH, size or DB_POOL_SIZE)
+    await enable_incremental_vacuum(pool.path)
+    await pool.open()
+    async with pool.acquire() as db:
+        await init_db(db)
+        await channels.load(db)
+    db_pool = pool
+    return pool
+
+
+async def enable_incremental_vacuum(path: str):
+    """Switch the file to auto_vacuum=INCREMENTAL so compact_db can free pages in steps.
+
+    The switch needs one full VACUUM, which holds the write lock for its whole
+    duration, so it runs once here at startup on its own connection, before
+    the pool opens and before the poster or any handler runs. A new file is
+    empty at this point, so for fresh installs it costs nothing.
+    """
+    async with aiosqlite.connect(path) as db:
+        async with db.execute("PRAGMA auto_vacuum") as cur:
+            if (await cur.fetchone())[0] == 2:
+                return
+        async with db.execute("PRAGMA page_count") as cur:
+            if (await cur.fetchone())[0]:
+                logger.info("Switching database to incremental auto_vacuum (one-time VACUUM)")
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+
+
+async def close_db():
+    global db_pool
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+
+
+def acquire_db():
+    """Borrow a pooled connection: ``async with acquire_db() as db: ...``"""
+    if db_pool is None:
+        raise RuntimeError("Database pool is not open; call open_db() first")
+    return db_pool.acquire()
+
+
+async def _add_column(db, table: str, column: str, decl: str):
+    """ALTER TABLE ADD COLUMN unless the column already exists.
+
+    Databases created before user_version tracking may already carry columns
+    that the early migrations add, so those steps have to be idempotent.
+    """
+    async with db.execute(f"PRAGMA table_info({table})") as cur:
+        cols = [c[1] for c in await cur.fetchall()]
+    if column not in cols:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+async def _m001_create_memes(db):
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS memes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_file_id TEXT NOT NULL,
+            mime_type TEXT,
+            scheduled_ts INTEGER NOT NULL,
+            posted INTEGER DEFAULT 0,
+            created_ts INTEGER NOT NULL
         )
-        # Ensure preview_file_id column exists (migration)
-        async with db.execute("PRAGMA table_info(memes)") as cur:
-            cols = await cur.fetchall()
-        col_names = [c[1] for c in cols]
-        if 'preview_file_id' not in col_names:
-            await db.execute("ALTER TABLE memes ADD COLUMN preview_file_id TEXT")
-        # Ensure caption column exists (migration)
-        if 'caption' not in col_names:
-            await db.execute("ALTER TABLE memes ADD COLUMN caption TEXT")
-        await db.commit()
+        """
+    )
+
+
+async def _m002_preview_file_id(db):
+    await _add_column(db, "memes", "preview_file_id", "TEXT")
+
+
+async def _m003_caption(db):
+    await _add_column(db, "memes", "caption", "TEXT")
+
+
+async def _m004_pending_index(db):
+    # Posted rows are never deleted, so keep the pending queue in its own
+    # partial index instead of scanning the whole history
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memes_pending ON memes(scheduled_ts) WHERE posted=0"
+    )
+
+
+
+async def _m005_post_attempts(db):
+    await db.execute("ALTER TABLE memes ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    await db.execute("ALTER TABLE memes ADD COLUMN last_error TEXT")
+    await db.execute("ALTER TABLE memes ADD COLUMN next_attempt_ts INTEGER")
+
+
+
+async def _m006_media_kind(db):
+    # exact kind (photo/animation/video/document), Telegram's stable file id,
+    # and the send method that last worked for this row
+    await db.execute("ALTER TABLE memes ADD COLUMN media_kind TEXT")
+    await db.execute("ALTER TABLE memes ADD COLUMN file_unique_id TEXT")
+    await db.execute("ALTER TABLE memes ADD COLUMN send_method TEXT")
+    # legacy 'video' rows are unambiguous; 'image' may be a photo or an animation
+    await db.execute("UPDATE memes SET media_kind='video' WHERE mime_type LIKE 'video%'")
+
+
+
+async def _m007_duplicate_lookup(db):
+    await db.execute("ALTER TABLE memes ADD COLUMN phash TEXT")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_memes_file_unique_id ON memes(file_unique_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_memes_phash ON memes(phash)")
+
+
+async def _m008_channels(db):
+    # channel 1 stands for CHANNEL_ID from the environment, so existing rows
+    # (and anything inserted without a channel) stay on it
+    await db.execute(
+        """
+        CREATE TABLE channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT UNIQUE,
+            slots TEXT,
+            tz TEXT
+        )
+        """
+    )
+    await db.execute("INSERT INTO channels (id) VALUES (1)")
+    await db.execute(
+        "CREATE TABLE channel_owners (channel_id INTEGER NOT NULL, user_id INTEGER NOT NULL,"
+        " PRIMARY KEY (channel_id, user_id)) WITHOUT ROWID"
+    )
+    await db.execute("ALTER TABLE memes ADD COLUMN channel_id INTEGER NOT NULL DEFAULT 1")
+    await db.execute(
+        "CREATE INDEX idx_memes_channel_pending ON memes(channel_id, scheduled_ts) WHERE posted=0"
+    )
+
+
+async def _m009_post_events(db):
+    # one row per post attempt: outcome is posted, failed (will retry) or dead
+    await db.execute(
+        """
+        CREATE TABLE post_events (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            meme_id INTEGER,
+            outcome TEXT NOT NULL,
+            method TEXT,
+            latency_ms INTEGER,
+            attempt INTEGER,
+            error_class TEXT,
+            error TEXT
+        )
+        """
+    )
+    await db.execute("CREATE INDEX idx_post_events_channel_ts ON post_events(channel_id, ts)")
+
+
+# memes columns copied to memes_archive when a posted row is archived
+ARCHIVE_COLUMNS = (
+    "id, owner_file_id, mime_type, scheduled_ts, posted, created_ts, preview_file_id, caption, attempts,"
+    " last_error, next_attempt_ts, media_kind, file_unique_id, send_method, phash, channel_id"
+)
+
+
+async def _m010_memes_archive(db):
+    # same columns as memes (ids are kept), plus when the row was moved;
+    # indexed for the duplicate checks, which look at both tables
+    await db.execute(
+        """
+        CREATE TABLE memes_archive (
+            id INTEGER PRIMARY KEY,
+            owner_file_id TEXT NOT NULL,
+            mime_type TEXT,
+            scheduled_ts INTEGER NOT NULL,
+            posted INTEGER,
+            created_ts INTEGER NOT NULL,
+            preview_file_id TEXT,
+            caption TEXT,
+            attempts INTEGER,
+            last_error TEXT,
+            next_attempt_ts INTEGER,
+            media_kind TEXT,
+            file_unique_id TEXT,
+            send_method TEXT,
+            phash TEXT,
+            channel_id INTEGER NOT NULL,
+            archived_ts INTEGER NOT NULL
+        )
+        """
+    )
+    await db.execute("CREATE INDEX idx_memes_archive_file_unique_id ON memes_archive(file_unique_id)")
+    await db.execute("CREATE INDEX idx_memes_archive_phash ON memes_archive(phash)")
+
+
+async def _m011_preview_kind(db):
+    # set when preview_file_id is a rendition (a JPEG or a short clip) rather
+    # than the meme itself; previews are then sent as this kind
+    await db.execute("ALTER TABLE memes ADD COLUMN preview_kind TEXT")
+
+
+async def _m012_post_claims(db):
+    # posted=2 (POSTING) rows are claimed until lease_until; expired claims are
+    # found through a tiny partial index
+    await db.execute("ALTER TABLE memes ADD COLUMN lease_until INTEGER")
+    await db.execute("CREATE INDEX idx_memes_posting ON memes(lease_until) WHERE posted=2")
+
+
+# Ordered schema migrations; the database's PRAGMA user_version is the number
+# of steps already applied. Only ever append to this list.
+MIGRATIONS = [
+    _m001_create_memes,
+    _m002_preview_file_id,
+    _m003_caption,
+    _m004_pending_index,
+    _m005_post_attempts,
+    _m006_media_kind,
+    _m007_duplicate_lookup,
+    _m008_channels,
+    _m009_post_events,
+    _m010_memes_archive,
+    _m011_preview_kind,
+    _m012_post_claims,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def migrate(db) -> int:
+    """Apply pending migrations, each in its own transaction. Returns the resulting schema version."""
+    async with db.execute("PRAGMA user_version") as cur:
+        version = (await cur.fetchone())[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this bot supports ({SCHEMA_VERSION})"
+        )
+    for step, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        await db.execute("BEGIN")
+        try:
+            await migration(db)
+            await db.execute(f"PRAGMA user_version={step}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logger.info("Applied schema migration %d (%s)", step, migration.__name__)
+    return SCHEMA_VERSION
+
+
+async def init_db(db):
+    """Bring the schema up to date. Everything after startup assumes the latest schema."""
+    await migrate(db)
+
+def _parse_slot_list(value: str) -> list:
+    return sorted(time(*map(int, part.strip().split(":"))) for part in value.split(",") if part.strip())
+
+
+class SlotCalendar:
+    """Posting slots: times of day per weekday in one timezone, minus blackout dates.
+
+    Slots are generated day by day straight from the slot lists, so asking for
+    the next N free slots is a single pass that skips occupied timestamps
+    with a set lookup.
+    """
+
+    def __init__(self, slots=None, tz=None, weekday_slots=None, blackout_dates=()):
+        self.tz = tz or IST
+        default = sorted(slots or SLOTS)
+        # weekday (0=Monday) -> slot times; an empty list means no posts that day
+        self.weekday_slots = [sorted((weekday_slots or {}).get(d, default)) for d in range(7)]
+        self.blackout_dates = frozenset(blackout_dates)
+        if not any(self.weekday_slots):
+            raise ValueError("Slot calendar has no slots on any weekday")
+
+    @classmethod
+    def from_env(cls, env=os.environ):
+        """MEMEBOT_SLOTS=11:00,16:00,21:00, MEMEBOT_SLOTS_SAT=12:00 (or empty to skip Saturdays),
+        MEMEBOT_BLACKOUT=2025-12-25,2026-01-01."""
+        slots = _parse_slot_list(env["MEMEBOT_SLOTS"]) if env.get("MEMEBOT_SLOTS") else SLOTS
+        weekday_slots = {
+            d: _parse_slot_list(env[f"MEMEBOT_SLOTS_{name}"])
+            for d, name in enumerate(WEEKDAY_NAMES)
+            if f"MEMEBOT_SLOTS_{name}" in env
+        }
+        blackout = {
+            datetime.strptime(part.strip(), "%Y-%m-%d").date()
+            for part in env.get("MEMEBOT_BLACKOUT", "").split(",") if part.strip()
+        }
+        return cls(slots, IST, weekday_slots, blackout)
+
+    def aware(self, dt: Optional[datetime]) -> datetime:
+        if dt is None:
+            return datetime.now(self.tz)
+        if dt.tzinfo is None:
+            return dt.replace(tzinfo=self.tz)
+        return dt.astimezone(self.tz)
+
+    def slots_on(self, day) -> list:
+        """Slot datetimes on ``day`` (a date), in order."""
+        if day in self.blackout_dates:
+            return []
+        return [datetime.combine(day, t, tzinfo=self.tz) for t in self.weekday_slots[day.weekday()]]
+
+    def iter_slots(self, after: Optional[datetime] = None):
+        """Yield slot datetimes strictly after ``after`` (default: now), forever."""
+        after = self.aware(after)
+        day = after.date()
+        while True:
+            for candidate in self.slots_on(day):
+                if candidate > after:
+                    yield candidate
+            day += timedelta(days=1)
+
+    def next_slots(self, after: Optional[datetime], n: int, occupied=frozenset()) -> list:
+        """The next ``n`` slots after ``after`` whose timestamps are not in ``occupied``."""
+        found = []
+        if n <= 0:
+            return found
+        for candidate in self.iter_slots(after):
+            if int(candidate.timestamp()) not in occupied:
+                found.append(candidate)
+                if len(found) == n:
+                    return found
+
+    def next_slot(self, after: Optional[datetime] = None) -> datetime:
+        return next(self.iter_slots(after))
+
+    def describe(self) -> str:
+        times = ", ".join(t.strftime("%H:%M") for t in self.weekday_slots[0] or SLOTS)
+        return f"{times} {datetime.now(self.tz).strftime('%Z')}"
+
+
+slot_calendar = SlotCalendar.from_env()
+
 
 async def compute_next_slot(after_dt: Optional[datetime] = None) -> datetime:
     """Return the next slot datetime from after_dt (exclusive). If after_dt is None, use now() in IST.
     All calculations and returns are in IST timezone."""
-    if after_dt is None:
-        # Get current time in IST
-        after_dt = datetime.now(IST)
-    else:
-        # Ensure after_dt is timezone-aware and in IST
-        if after_dt.tzinfo is None:
-            after_dt = IST.localize(after_dt)
-        else:
-            after_dt = after_dt.astimezone(IST)
-    
-    # check same-day slots in IST
-    today = after_dt.date()
-    for slot in SLOTS:
-        candidate = IST.localize(datetime.combine(today, slot))
-        if candidate > after_dt:
-            return candidate
-    # otherwise next day's first slot
-    next_day = today + timedelta(days=1)
-    return IST.localize(datetime.combine(next_day, SLOTS[0]))
-
-async def get_last_scheduled_ts(db) -> Optional[int]:
-    async with db.execute("SELECT scheduled_ts FROM memes WHERE posted=0 ORDER BY scheduled_ts DESC LIMIT 1") as cur:
+    return slot_calendar.next_slot(after_dt)
+
+class Channel(NamedTuple):
+    id: int
+    chat_id: Optional[str]
+    slots: Optional[str] = None
+    tz: Optional[str] = None
+
+
+class ChannelRegistry:
+    """Target channels, their owners and slot calendars, cached in memory.
+
+    Loaded from the channels/channel_owners tables at startup and reloaded
+    after every change, so handlers and the poster never query them. Channel 1
+    always posts to CHANNEL_ID, and OWNER_ID may act on every channel.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.owners = {}  # user id -> owned channel ids
+        self.selected = {}  # user id -> channel picked with /channel
+        self._calendars = {}
+
+    async def load(self, db):
+        async with db.execute("SELECT id, chat_id, slots, tz FROM channels ORDER BY id") as cur:
+            rows = [Channel(*row) for row in await cur.fetchall()]
+        async with db.execute("SELECT channel_id, user_id FROM channel_owners ORDER BY channel_id") as cur:
+            owner_rows = await cur.fetchall()
+        self.channels = {c.id: c for c in rows}
+        if DEFAULT_CHANNEL in self.channels:
+            self.channels[DEFAULT_CHANNEL] = self.channels[DEFAULT_CHANNEL]._replace(chat_id=CHANNEL_ID)
+        self.owners = {}
+        for channel_id, user_id in owner_rows:
+            self.owners.setdefault(user_id, []).append(channel_id)
+        self._calendars = {}
+
+    def owned(self, user_id) -> list:
+        """Channel ids ``user_id`` may act on, in id order."""
+        if user_id == OWNER_ID:
+            return sorted(self.channels)
+        return sorted(set(self.owners.get(user_id, ())))
+
+    def current(self, user_id) -> Optional[int]:
+        """The channel ``user_id`` is working on: their /channel pick, else the first one they own."""
+        owned = self.owned(user_id)
+        if not owned:
+            return None
+        picked = self.selected.get(user_id)
+        return picked if picked in owned else owned[0]
+
+    def resolve(self, token: str) -> Optional[int]:
+        """Channel id for "2", "@name" or "-100123", if known."""
+        if token.isdigit() and int(token) in self.channels:
+            return int(token)
+        for c in self.channels.values():
+            if c.chat_id and c.chat_id.lower() == token.lower():
+                return c.id
+        return None
+
+    def owners_of(self, channel_id) -> list:
+        """Users to notify about ``channel_id``: its owners plus OWNER_ID."""
+        users = {user_id for user_id, owned in self.owners.items() if channel_id in owned}
+        if OWNER_ID:
+            users.add(OWNER_ID)
+        return sorted(users)
+
+    def chat_id(self, channel_id):
+        channel = self.channels.get(channel_id)
+        return channel.chat_id if channel else None
+
+    def label(self, channel_id) -> str:
+        return f"{channel_id}: {self.chat_id(channel_id) or '(unset)'}"
+
+    def calendar(self, channel_id) -> SlotCalendar:
+        """The channel's own slots/timezone, or the MEMEBOT_SLOTS calendar if it has none."""
+        channel = self.channels.get(channel_id)
+        if channel is None or not (channel.slots or channel.tz):
+            return slot_calendar
+        if channel_id not in self._calendars:
+            self._calendars[channel_id] = SlotCalendar(
+                _parse_slot_list(channel.slots) if channel.slots else None,
+                ZoneInfo(channel.tz) if channel.tz else slot_calendar.tz,
+                None if channel.slots else dict(enumerate(slot_calendar.weekday_slots)),
+                slot_calendar.blackout_dates,
+            )
+        return self._calendars[channel_id]
+
+
+channels = ChannelRegistry()
+
+
+async def _reload_channels(db):
+    await db.commit()
+    await channels.load(db)
+
+
+async def add_channel(chat_id: str, owner_id: int, slots: Optional[str] = None, tz: Optional[str] = None) -> int:
+    """Register a target channel owned by ``owner_id``. Raises ValueError if it is already known."""
+    if channels.resolve(chat_id) is not None or chat_id == CHANNEL_ID:
+        raise ValueError(f"{chat_id} is already a channel")
+    async with acquire_db() as db:
+        async with db.execute(
+            "INSERT INTO channels (chat_id, slots, tz) VALUES (?, ?, ?) RETURNING id", (chat_id, slots, tz)
+        ) as cur:
+            channel_id = (await cur.fetchone())[0]
+        await db.execute("INSERT INTO channel_owners (channel_id, user_id) VALUES (?, ?)", (channel_id, owner_id))
+        await _reload_channels(db)
+    return channel_id
+
+
+async def add_channel_owner(channel_id: int, user_id: int):
+    async with acquire_db() as db:
+        await db.execute(
+            "INSERT OR IGNORE INTO channel_owners (channel_id, user_id) VALUES (?, ?)", (channel_id, user_id)
+        )
+        await _reload_channels(db)
+
+
+async def set_channel_slots(channel_id: int, slots: Optional[str], tz: Optional[str]):
+    async with acquire_db() as db:
+        await db.execute("UPDATE channels SET slots=?, tz=? WHERE id=?", (slots, tz, channel_id))
+        await _reload_channels(db)
+
+
+async def get_last_scheduled_ts(db, channel_id: int = DEFAULT_CHANNEL) -> Optional[int]:
+    async with db.execute(SQL_LAST_PENDING_TS, (channel_id,)) as cur:
         row = await cur.fetchone()
         return row[0] if row else None
 
-async def schedule_meme(owner_file_id: str, mime_type: str, caption: Optional[str] = None) -> datetime:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
+class NewMeme(NamedTuple):
+    owner_file_id: str
+    mime_type: str
+    caption: Optional[str] = None
+    media_kind: Optional[str] = None
+    file_unique_id: Optional[str] = None
+    phash: Optional[str] = None
+
+
+# Serializes slot allocation so two bursts never read the same last slot.
+_slot_lock = asyncio.Lock()
+
+
+async def schedule_memes(memes, channel_id: int = DEFAULT_CHANNEL) -> list:
+    """Give ``memes`` consecutive slots after the channel's last pending one and insert them in one transaction.
+
+    Returns [(id, scheduled_dt), ...] in the same order.
+    """
+    if not memes:
+        return []
+    cal = channels.calendar(channel_id)
+    async with _slot_lock, acquire_db() as db, timed(DB_SECONDS, query="schedule"):
+        # the lock orders callers in this process; the write lock taken before
+        # reading the last slot also covers other processes (bulk imports)
+        await db.execute("BEGIN IMMEDIATE")
         # Always schedule after the latest scheduled meme, even if it's far in the future
-        last_ts = await get_last_scheduled_ts(db)
+        last_ts = await get_last_scheduled_ts(db, channel_id)
         if last_ts is None:
-            # no pending memes, schedule relative to now in IST
-            ref_dt = datetime.now(IST)
+            # no pending memes, schedule relative to now
+            ref_dt = datetime.now(cal.tz)
         else:
-            # Convert timestamp to IST-aware datetime
-            ref_dt = datetime.fromtimestamp(last_ts, tz=IST)
-        next_dt = await compute_next_slot(ref_dt)
-
-        # Try to get a preview file_id (for photo: smallest size, for video: thumbnail, for animation: itself)
-        preview_file_id = None
-        # context is not available here, so preview is best-effort: use owner_file_id for now
-        preview_file_id = owner_file_id
+            ref_dt = datetime.fromtimestamp(last_ts, tz=cal.tz)
+        slots = cal.next_slots(ref_dt, len(memes))
 
-        await db.execute(
-            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts, preview_file_id, caption) VALUES (?, ?, ?, ?, ?, ?)",
-            (owner_file_id, mime_type, int(next_dt.timestamp()), int(datetime.now(IST).timestamp()), preview_file_id, caption),
+        # previews start as the original; PreviewRenderer may swap in a rendition later
+        created_ts = int(datetime.now(IST).timestamp())
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts, preview_file_id, caption, media_kind,"
+            " file_unique_id, phash, channel_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (m.owner_file_id, m.mime_type, int(dt.timestamp()), created_ts, m.owner_file_id, m.caption,
+                 m.media_kind, m.file_unique_id, m.phash, channel_id)
+                for m, dt in zip(memes, slots)
+            ],
         )
+        # AUTOINCREMENT ids are contiguous within this single-writer transaction
+        async with db.execute("SELECT last_insert_rowid()") as cur:
+            last_id = (await cur.fetchone())[0]
         await db.commit()
+    for dt in slots:
+        post_scheduler.push(int(dt.timestamp()))
+    first_id = last_id - len(memes) + 1
+    return [(first_id + i, dt) for i, dt in enumerate(slots)]
+
+
+async def schedule_meme(owner_file_id: str, mime_type: str, caption: Optional[str] = None,
+                        media_kind: Optional[str] = None, file_unique_id: Optional[str] = None,
+                        phash: Optional[str] = None) -> datetime:
+    (_, next_dt), = await schedule_memes([NewMeme(owner_file_id, mime_type, caption, media_kind, file_unique_id, phash)])
     return next_dt
 
-async def pop_due_memes_and_post(context: ContextTypes.DEFAULT_TYPE):
-    now_ts = int(datetime.now(IST).timestamp())
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
-        # Check if caption column exists
-        async with db.execute("PRAGMA table_info(memes)") as cur:
-            cols = await cur.fetchall()
-        col_names = [c[1] for c in cols]
-        has_caption = 'caption' in col_names
-        
-        if has_caption:
-            async with db.execute("SELECT id, owner_file_id, mime_type, caption FROM memes WHERE posted=0 AND scheduled_ts<=? ORDER BY scheduled_ts ASC", (now_ts,)) as cur:
-                rows = await cur.fetchall()
-        else:
-            async with db.execute("SELECT id, owner_file_id, mime_type FROM memes WHERE posted=0 AND scheduled_ts<=? ORDER BY scheduled_ts ASC", (now_ts,)) as cur:
-                rows = await cur.fetchall()
-                
-        for row in rows:
-            if has_caption:
-                mid, file_id, mime, caption = row
-            else:
-                mid, file_id, mime = row
-                caption = None
-                
+
+_pil_image = False  # not imported yet
+
+
+def pil_image():
+    """PIL.Image, imported on first use, or None if Pillow is not installed."""
+    global _pil_image
+    if _pil_image is False:
+        try:
+            from PIL import Image
+        except ImportError:  # pragma: no cover - depends on the environment
+            Image = None
+        _pil_image = Image
+    return _pil_image
+
+
+def dhash(data: bytes, size: int = 8) -> str:
+    """64-bit difference hash of an image, as hex. Survives re-encoding and resizing."""
+    Image = pil_image()
+    img = Image.open(io.BytesIO(data)).convert("L").resize((size + 1, size), Image.LANCZOS)
+    px = img.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            bits = (bits << 1) | (px[row * (size + 1) + col] > px[row * (size + 1) + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+async def compute_phash(bot, msg: Message) -> Optional[str]:
+    """Perceptual hash of a message's smallest rendition (photo size or thumbnail), if enabled."""
+    if not PHASH_ENABLED or pil_image() is None:
+        return None
+    if msg.photo:
+        small = msg.photo[0]
+    else:
+        media = msg.video or msg.animation
+        small = media.thumbnail if media else None
+    if small is None:
+        return None
+    try:
+        data = await (await bot.get_file(small.file_id)).download_as_bytearray()
+        return await asyncio.get_running_loop().run_in_executor(None, dhash, bytes(data))
+    except Exception as e:
+        logger.warning("Could not compute perceptual hash: %s", e)
+        return None
+
+
+async def find_duplicates(memes, channel_id: int = DEFAULT_CHANNEL) -> dict:
+    """Map file_unique_id/phash keys of ``memes`` to existing (id, posted, scheduled_ts) rows
+    in the same channel, in two IN queries."""
+    found = {}
+    async with acquire_db() as db:
+        for sql, keys in (
+            (SQL_DUPLICATES_BY_UNIQUE_ID, {m.file_unique_id for m in memes if m.file_unique_id}),
+            (SQL_DUPLICATES_BY_PHASH, {m.phash for m in memes if m.phash}),
+        ):
+            if not keys:
+                continue
+            params = (tuple(keys) + (channel_id,)) * 2
+            async with db.execute(sql.format(",".join("?" * len(keys))), params) as cur:
+                for key, *row in await cur.fetchall():
+                    found.setdefault(key, tuple(row))
+    return found
+
+
+def describe_duplicate(row, tz=IST) -> str:
+    mid, posted, ts = row
+    when = datetime.fromtimestamp(ts, tz=tz).strftime('%Y-%m-%d %H:%M %Z')
+    if posted == 1:
+        return f"meme {mid}, already posted around {when}"
+    if posted == DEAD_LETTER:
+        return f"meme {mid}, which failed to post"
+    return f"meme {mid}, scheduled for {when}"
+
+
+async def ingest_memes(memes, channel_id: int = DEFAULT_CHANNEL, preview_chat=None) -> str:
+    """Apply the duplicate policy to a burst of new memes for one channel, schedule the rest, and build the reply text.
+
+    With ``preview_chat`` (the owner's chat), preview renditions of the
+    scheduled memes are built in the background afterwards.
+    """
+    skipped, warnings, keep = [], {}, []
+    if DUPLICATE_POLICY != "allow":
+        existing = await find_duplicates(memes, channel_id)
+        tz = channels.calendar(channel_id).tz
+        seen = {}
+        for i, meme in enumerate(memes):
+            dup = None
+            for key in (meme.file_unique_id, meme.phash):
+                if key and key in existing:
+                    dup = describe_duplicate(existing[key], tz)
+                elif key and key in seen:
+                    dup = f"item {seen[key] + 1} of this batch"
+                if dup:
+                    break
+            for key in (meme.file_unique_id, meme.phash):
+                if key:
+                    seen.setdefault(key, i)
+            if dup and DUPLICATE_POLICY == "reject":
+                skipped.append(dup)
+                continue
+            if dup:
+                warnings[len(keep)] = dup
+            keep.append(meme)
+    else:
+        keep = list(memes)
+
+    scheduled = await schedule_memes(keep, channel_id)
+    if preview_chat is not None:
+        previews.submit(preview_chat, [(mid, meme) for (mid, _), meme in zip(scheduled, keep)])
+    if len(memes) == 1:
+        if skipped:
+            return f"Duplicate of {skipped[0]}. Not scheduled."
+        reply = f"Scheduled for: {scheduled[0][1].strftime('%Y-%m-%d %H:%M:%S %Z')}"
+        if warnings:
+            reply += f"\nWarning: duplicate of {warnings[0]}."
+        return reply
+
+    lines = [f"Scheduled {len(scheduled)} of {len(memes)} memes:"]
+    for i, (mid, dt) in enumerate(scheduled):
+        line = f"ID {mid}: {dt.strftime('%Y-%m-%d %H:%M %Z')}"
+        if i in warnings:
+            line += f" (duplicate of {warnings[i]})"
+        lines.append(line)
+    lines += [f"Skipped duplicate of {dup}" for dup in skipped]
+    return "\n".join(lines)
+
+
+class IngestBatcher:
+    """Collects memes that arrive in a burst (an album, or many forwards at once).
+
+    Each new meme pushes the flush back by ``window`` seconds, up to
+    ``max_wait`` after the first one; the whole burst is then scheduled in one
+    transaction and answered with one summary reply per sender's chat.
+    """
+
+    def __init__(self, window: float, max_wait: float):
+        self.window = window
+        self.max_wait = max_wait
+        self._pending = []
+        self._first_at = None
+        self._timer = None
+        self._tasks = set()
+
+    def add(self, meme: NewMeme, msg: Message, channel_id: int = DEFAULT_CHANNEL):
+        now = monotonic()
+        if self._first_at is None:
+            self._first_at = now
+        self._pending.append((channel_id, meme, msg))
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = max(0.0, min(self.window, self._first_at + self.max_wait - now))
+        self._timer = asyncio.get_running_loop().call_later(delay, self._flush_soon)
+
+    def _flush_soon(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._first_at = self._pending, [], None
+        # one summary per target channel and sender: owners of several channels
+        # may switch mid-burst, and co-owners sending at once each get their own
+        by_target = {}
+        for channel_id, meme, msg in batch:
+            by_target.setdefault((channel_id, msg.chat_id), []).append((meme, msg))
+        for (channel_id, _), items in by_target.items():
+            reply_to = items[-1][1]
             try:
-                sent = False
-                # Try video first when appropriate
-                if mime and mime.startswith("video"):
-                    try:
-                        await context.bot.send_video(CHANNEL_ID, file_id, caption=caption)
-                        sent = True
-                    except Exception as e_video:
-                        logger.warning("send_video failed for id=%s: %s", mid, e_video)
-                if not sent:
-                    # try as photo/animation
-                    try:
-                        await context.bot.send_photo(CHANNEL_ID, file_id, caption=caption)
-                        sent = True
-                    except Exception as e_photo:
-                        logger.warning("send_photo failed for id=%s: %s", mid, e_photo)
-                        # fallback to sending as document
-                        try:
-                            await context.bot.send_document(CHANNEL_ID, file_id, caption=caption)
-                            sent = True
-                        except Exception as e_doc:
-                            logger.warning("send_document failed for id=%s: %s", mid, e_doc)
-                            # raise the last exception to be caught below
-                            raise e_doc
-
-                if sent:
-                    await db.execute("UPDATE memes SET posted=1 WHERE id=?", (mid,))
-                    await db.commit()
-                    logger.info("Posted meme id=%s", mid)
-                    posting_log.append(f"[SUCCESS] Posted meme id={mid} at {datetime.now(IST).isoformat(sep=' ')}")
-                    if len(posting_log) > 100:
-                        posting_log.pop(0)
+                preview_chat = reply_to.chat_id if previews.active else None
+                text = await ingest_memes([meme for meme, _ in items], channel_id, preview_chat)
             except Exception as e:
-                logger.exception("Failed to post meme id=%s: %s", mid, e)
-                posting_log.append(f"[FAIL] Meme id={mid} at {datetime.now(IST).isoformat(sep=' ')}: {type(e).__name__}: {e}")
-                if len(posting_log) > 100:
-                    posting_log.pop(0)
-async def scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
-        await update.message.reply_text("Only the owner can use this command.")
-        return
+                logger.exception("Failed to schedule a batch of %d memes", len(items))
+                text = f"Failed to schedule {len(items)} meme(s): {type(e).__name__}: {e}"
+            await reply_to.reply_text(text)
+
+    async def close(self):
+        """Schedule whatever is still waiting and let in-flight flushes finish. Called on shutdown.
+
+        Those updates were already acknowledged, so Telegram will not send them again.
+        """
+        if self._pending:
+            await self.flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+ingest_batcher = IngestBatcher(INGEST_WINDOW, INGEST_MAX_WAIT)
+
+
+class TokenBucket:
+    """Async token bucket: refills ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for ``seconds`` (Telegram asked us to back off)."""
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PostRateLimiter:
+    """Paces Bot API calls under Telegram's global and per-chat flood limits.
+
+    Channels and groups ("@name" or a negative id) get the per-minute chat
+    limit; private chats (positive user ids, e.g. the owner's /scheduled
+    pages) get their own, much looser per-second bucket.
+    """
+
+    def __init__(self, global_per_second: float, chat_per_minute: float, chat_burst: float,
+                 private_per_second: float = PRIVATE_RATE_PER_SECOND):
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.chat_per_minute = chat_per_minute
+        self.chat_burst = chat_burst
+        self.private_per_second = private_per_second
+        self._chats = {}
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_per_second, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_per_minute / 60.0, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id):
+        await self.chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def retry_after(self, chat_id, seconds: float):
+        self.chat_bucket(chat_id).pause(seconds)
+
+
+rate_limiter = PostRateLimiter(GLOBAL_RATE_PER_SECOND, CHAT_RATE_PER_MINUTE, CHAT_BURST)
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    wait = exc.retry_after
+    if isinstance(wait, timedelta):
+        return wait.total_seconds()
+    return float(wait)
+
+
+# Bot API method per media kind. A row's kind is its stored media_kind, or
+# better, the send_method that already worked for it.
+SEND_METHODS = {
+    "photo": "send_photo",
+    "animation": "send_animation",
+    "video": "send_video",
+    "document": "send_document",
+}
+
+
+def send_methods_for(kind: Optional[str], mime: Optional[str]) -> list:
+    """Send methods to try for a meme, most likely first."""
+    if kind in SEND_METHODS:
+        return [kind] if kind == "document" else [kind, "document"]
+    # legacy rows only know the coarse mime type
+    if mime and mime.startswith("video"):
+        return ["video", "photo", "document"]
+    return ["photo", "animation", "document"]
+
+
+async def send_meme(bot, chat_id, file_id: str, mime: Optional[str], caption: Optional[str] = None, mid=None,
+                    kind: Optional[str] = None) -> str:
+    """Send one meme, trying the methods from send_methods_for in order.
+
+    Returns the kind whose method succeeded so callers can remember it. Every
+    API call waits on ``rate_limiter``; RetryAfter is never treated as "wrong
+    method": it pauses the chat's bucket and is re-raised.
+    """
+    methods = send_methods_for(kind, mime)
+    for i, method in enumerate(methods):
+        await rate_limiter.acquire(chat_id)
+        try:
+            with timed(API_SECONDS, method=SEND_METHODS[method]):
+                await getattr(bot, SEND_METHODS[method])(chat_id, file_id, caption=caption)
+            return method
+        except RetryAfter as e:
+            API_ERRORS.inc(method=SEND_METHODS[method], error="RetryAfter")
+            rate_limiter.retry_after(chat_id, _retry_after_seconds(e))
+            raise
+        except Exception as e:
+            API_ERRORS.inc(method=SEND_METHODS[method], error=type(e).__name__)
+            # the last method's error is the one reported
+            if i == len(methods) - 1:
+                raise
+            FALLBACKS.inc(kind="send_method")
+            logger.warning("%s failed for id=%s: %s", SEND_METHODS[method], mid, e)
+
+
+async def remember_send_method(mid: int, method: str):
+    async with acquire_db() as db:
+        await db.execute("UPDATE memes SET send_method=? WHERE id=?", (method, mid))
+        await db.commit()
+
+
+async def post_meme(bot, chat_id, file_id: str, mime: Optional[str], caption: Optional[str] = None, mid=None,
+                    kind: Optional[str] = None) -> str:
+    """send_meme, waiting out up to POST_MAX_FLOOD_WAITS RetryAfter responses."""
+    for flood_wait in range(POST_MAX_FLOOD_WAITS + 1):
+        try:
+            return await send_meme(bot, chat_id, file_id, mime, caption, mid, kind)
+        except RetryAfter as e:
+            if flood_wait == POST_MAX_FLOOD_WAITS:
+                raise
+            logger.warning("Flood limit posting id=%s, waiting %.0fs", mid, _retry_after_seconds(e))
+
+
+def post_backoff(attempts: int) -> int:
+    """Seconds to wait before retry number ``attempts`` (exponential, capped)."""
+    return min(POST_BACKOFF_BASE * 2 ** (attempts - 1), POST_BACKOFF_MAX)
+
+
+class PostEvent(NamedTuple):
+    ts: int
+    channel_id: int
+    meme_id: int
+    outcome: str  # posted, failed or dead
+    method: Optional[str] = None
+    latency_ms: Optional[int] = None
+    attempt: Optional[int] = None
+    error_class: Optional[str] = None
+    error: Optional[str] = None
+
+
+async def _flush_post_results(posted_ids, failures, events=None, prune_channel: Optional[int] = None):
+    """Write a batch of outcomes and their post_events in one transaction.
+
+    With ``prune_channel``, also drop that channel's events older than the retention window.
+    """
+    events = events if events is not None else []
+    if not posted_ids and not failures and not events and prune_channel is None:
+        return
+    async with acquire_db() as db, timed(DB_SECONDS, query="post_results"):
+        if posted_ids:
+            await db.executemany("UPDATE memes SET posted=1, send_method=?, lease_until=NULL WHERE id=?", posted_ids)
+        if failures:
+            await db.executemany(
+                "UPDATE memes SET attempts=?, last_error=?, next_attempt_ts=?, posted=?, lease_until=NULL WHERE id=?",
+                failures,
+            )
+        if events:
+            await db.executemany(SQL_INSERT_POST_EVENT, events)
+        if prune_channel is not None:
+            cutoff = int(datetime.now(IST).timestamp()) - POST_EVENT_RETENTION_DAYS * 86400
+            await db.execute("DELETE FROM post_events WHERE channel_id=? AND ts<?", (prune_channel, cutoff))
+        await db.commit()
+    posted_ids.clear()
+    failures.clear()
+    events.clear()
+
+
+# Outcomes whose write kept failing: (posted_ids, failures, events) batches,
+# written again before any expired claim is released.
+_unflushed_results = []
+
+
+async def record_post_results(posted_ids, failures, events, prune_channel: Optional[int] = None):
+    """_flush_post_results, retried with backoff.
+
+    If the write still fails the outcomes are parked in _unflushed_results
+    and the error is re-raised; flush_parked_results writes them on the next
+    poster pass, so a meme that was sent keeps its claim in the meantime.
+    """
+    delay = POST_FLUSH_RETRY_DELAY
+    for attempt in range(1, POST_FLUSH_RETRIES + 1):
+        try:
+            await _flush_post_results(posted_ids, failures, events, prune_channel)
+            return
+        except Exception as e:
+            if attempt == POST_FLUSH_RETRIES:
+                _unflushed_results.append((list(posted_ids), list(failures), list(events)))
+                posted_ids.clear()
+                failures.clear()
+                events.clear()
+                logger.error("Could not record post results (ids=%s); kept for the next pass",
+                             [mid for _, mid in _unflushed_results[-1][0]])
+                raise
+            logger.warning("Recording post results failed (attempt %d): %s: %s", attempt, type(e).__name__, e)
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def flush_parked_results():
+    """Write outcomes parked by record_post_results. Raises if the database is still failing."""
+    while _unflushed_results:
+        await _flush_post_results(*_unflushed_results[0])
+        _unflushed_results.pop(0)
+
+
+async def claim_memes(ids) -> set:
+    """Claim pending ``ids`` for posting in one UPDATE ... RETURNING. Returns the ids this caller got.
+
+    Rows already claimed by someone else (the poster, /postnow, another
+    process) are left out; a claim ends with the post's result or when its
+    lease expires.
+    """
+    if not ids:
+        return set()
+    lease_until = int(datetime.now(IST).timestamp()) + POST_LEASE_SECONDS
+    async with acquire_db() as db, timed(DB_SECONDS, query="claim"):
+        async with db.execute(
+            f"UPDATE memes SET posted={POSTING}, lease_until=? WHERE posted=0 AND id IN ({','.join('?' * len(ids))})"
+            " RETURNING id",
+            [lease_until] + list(ids),
+        ) as cur:
+            claimed = {row[0] for row in await cur.fetchall()}
+        await db.commit()
+    return claimed
+
+
+async def release_claims(ids):
+    """Hand claimed memes back to the queue unchanged (the post was not attempted or is retried later)."""
+    if not ids:
+        return
+    async with acquire_db() as db:
+        await db.executemany(
+            f"UPDATE memes SET posted=0, lease_until=NULL WHERE posted={POSTING} AND id=?", [(mid,) for mid in ids]
+        )
+        await db.commit()
+
+
+async def release_expired_claims(now_ts: int) -> int:
+    """Return memes whose posting claim has expired (a crash mid-post) to the queue."""
+    async with acquire_db() as db:
+        async with db.execute(
+            f"UPDATE memes SET posted=0, lease_until=NULL WHERE posted={POSTING} AND lease_until<=? RETURNING id",
+            (now_ts,),
+        ) as cur:
+            ids = [row[0] for row in await cur.fetchall()]
+        await db.commit()
+    if ids:
+        logger.warning("Posting claims expired for ids=%s; they will be posted again", ids)
+    return len(ids)
+
+
+async def _drain_chat(bot, channel_id, rows) -> Optional[int]:
+    """Post ``rows`` to one channel in order. Returns the earliest retry timestamp, if any.
+
+    Rows are claimed POST_COMMIT_BATCH at a time just before they are sent;
+    rows someone else already claimed are skipped.
+    """
+    chat_id = channels.chat_id(channel_id)
+    posted_ids, failures, events = [], [], []
+    next_retry = None
+    for start in range(0, len(rows), POST_COMMIT_BATCH):
+        batch = rows[start:start + POST_COMMIT_BATCH]
+        claimed = await claim_memes([row[0] for row in batch])
+        for mid, file_id, mime, caption, attempts, kind, scheduled_ts in batch:
+            if mid not in claimed:
+                continue
+            started = monotonic()
+            try:
+                method = await post_meme(bot, chat_id, file_id, mime, caption, mid, kind)
+                latency_ms = int((monotonic() - started) * 1000)
+                now_ts = int(datetime.now(IST).timestamp())
+                posted_ids.append((method, mid))
+                events.append(PostEvent(now_ts, channel_id, mid, "posted", method, latency_ms, attempts + 1))
+                POSTS.inc(outcome="posted")
+                POST_LAG_SECONDS.observe(max(0, now_ts - scheduled_ts))
+                logger.info("Posted meme id=%s", mid)
+            except Exception as e:
+                latency_ms = int((monotonic() - started) * 1000)
+                attempts += 1
+                now_ts = int(datetime.now(IST).timestamp())
+                error = f"{type(e).__name__}: {e}"
+                if attempts >= POST_MAX_ATTEMPTS:
+                    failures.append((attempts, error, None, DEAD_LETTER, mid))
+                    outcome = "dead"
+                    logger.error("Giving up on meme id=%s after %d attempts: %s", mid, attempts, error)
+                else:
+                    retry_ts = now_ts + post_backoff(attempts)
+                    failures.append((attempts, error, retry_ts, 0, mid))
+                    next_retry = retry_ts if next_retry is None else min(next_retry, retry_ts)
+                    outcome = "failed"
+                    logger.warning("Failed to post meme id=%s (attempt %d): %s", mid, attempts, error)
+                events.append(PostEvent(now_ts, channel_id, mid, outcome, kind, latency_ms, attempts,
+                                        type(e).__name__, str(e)))
+                POSTS.inc(outcome=outcome)
+        await record_post_results(posted_ids, failures, events)
+    await record_post_results(posted_ids, failures, events, prune_channel=channel_id)
+    return next_retry
+
+
+class CatchUpPlan(NamedTuple):
+    channel_id: int
+    policy: str
+    missed: int
+    post_now: list  # ids posted in this pass
+    moves: list  # (id, old_ts, new_ts), in new_ts order
+
+
+def plan_catch_up(channel_id: int, missed: list, pending_ts: list, policy: str = None,
+                  now_ts: Optional[int] = None) -> CatchUpPlan:
+    """Decide what to do with ``missed`` [(id, scheduled_ts), ...] (oldest first).
+
+    ``pending_ts`` is the channel's other pending [(id, scheduled_ts), ...] after
+    now, in order; "spread" avoids their slots and "shift" moves them too.
+    """
+    policy = policy or CATCHUP_POLICY
+    if now_ts is None:
+        now_ts = int(datetime.now(IST).timestamp())
+    keep = max(CATCHUP_BURST, 0)
+    post_now = [mid for mid, _ in missed[:keep]]
+    late = missed[keep:]
+    if policy == "now" or not late:
+        return CatchUpPlan(channel_id, policy, len(missed), [mid for mid, _ in missed], [])
+
+    cal = channels.calendar(channel_id)
+    now_dt = datetime.fromtimestamp(now_ts, tz=cal.tz)
+    moves = []
+    if policy == "spread":
+        occupied = {ts for _, ts in pending_ts}
+        for (mid, old_ts), dt in zip(late, cal.next_slots(now_dt, len(late), occupied)):
+            moves.append((mid, old_ts, int(dt.timestamp())))
+    else:  # shift
+        prev_ts = now_ts
+        for mid, old_ts in late + pending_ts:
+            if old_ts > prev_ts:
+                break  # the queue has a gap here; everything after it keeps its slot
+            prev_ts = int(cal.next_slot(datetime.fromtimestamp(prev_ts, tz=cal.tz)).timestamp())
+            moves.append((mid, old_ts, prev_ts))
+    return CatchUpPlan(channel_id, policy, len(missed), post_now, moves)
+
+
+def describe_catch_up(plan: CatchUpPlan, limit: int = 10) -> str:
+    cal = channels.calendar(plan.channel_id)
+    lines = [
+        f"Catching up on {channels.label(plan.channel_id)} after downtime ({plan.policy}): "
+        f"{plan.missed} meme(s) missed their slot.",
+    ]
+    if plan.post_now:
+        lines.append(f"Posting now: IDs {format_ids(plan.post_now)}.")
+    if plan.moves:
+        lines.append(f"Moving {len(plan.moves)} meme(s):")
+        for mid, old_ts, new_ts in plan.moves[:limit]:
+            old = datetime.fromtimestamp(old_ts, tz=cal.tz).strftime("%a %d %b %H:%M")
+            new = datetime.fromtimestamp(new_ts, tz=cal.tz).strftime("%a %d %b %H:%M")
+            lines.append(f"ID {mid}: {old} -> {new}")
+        if len(plan.moves) > limit:
+            lines.append(f"...and {len(plan.moves) - limit} more.")
+    return "\n".join(lines)
+
+
+async def apply_catch_up(db, plan: CatchUpPlan):
+    """Write ``plan.moves`` with one batched UPDATE per CATCHUP_UPDATE_CHUNK rows, in one transaction."""
+    for start in range(0, len(plan.moves), CATCHUP_UPDATE_CHUNK):
+        chunk = plan.moves[start:start + CATCHUP_UPDATE_CHUNK]
+        values = ",".join("(?,?)" for _ in chunk)
+        await db.execute(
+            f"WITH moved(id, ts) AS (VALUES {values})"
+            " UPDATE memes SET scheduled_ts=(SELECT ts FROM moved WHERE moved.id=memes.id)"
+            " WHERE id IN (SELECT id FROM moved) AND posted=0",
+            [v for mid, _, new_ts in chunk for v in (mid, new_ts)],
+        )
+    await db.commit()
+
+
+async def catch_up_channel(bot, channel_id: int, rows: list, now_ts: int) -> list:
+    """Apply the catch-up policy to one channel's due ``rows``; returns the rows to post now."""
+    missed = [(row[0], row[-1]) for row in rows if row[4] == 0 and row[-1] < now_ts - CATCHUP_GRACE]
+    if len(missed) <= CATCHUP_BURST or CATCHUP_POLICY == "now":
+        return rows
+    async with _slot_lock:
+        async with acquire_db() as db, timed(DB_SECONDS, query="catch_up"):
+            async with db.execute(
+                "SELECT id, scheduled_ts FROM memes WHERE posted=0 AND channel_id=? AND scheduled_ts>?"
+                " ORDER BY scheduled_ts",
+                (channel_id, now_ts),
+            ) as cur:
+                pending_ts = await cur.fetchall()
+        plan = plan_catch_up(channel_id, missed, pending_ts, now_ts=now_ts)
+        report = describe_catch_up(plan)
+        async with acquire_db() as db, timed(DB_SECONDS, query="catch_up"):
+            await db.execute("BEGIN IMMEDIATE")
+            await apply_catch_up(db, plan)
+    post_scheduler.invalidate()
+    logger.info(report)
+    # sent outside _slot_lock: a slow send or a flood wait must not hold up ingest
+    for user_id in channels.owners_of(channel_id):
+        try:
+            await bot.send_message(user_id, report)
+        except Exception as exc:
+            logger.warning("Could not send the catch-up plan to %s: %s", user_id, exc)
+    moved = {mid for mid, _, _ in plan.moves}
+    return [row for row in rows if row[0] not in moved]
+
+
+async def pop_due_memes_and_post(context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    """Post every due meme. Returns when the earliest failed one should be retried, or None."""
+    now_ts = int(datetime.now(IST).timestamp())
+    # outcomes of memes already sent go in first, so their claims are never released
+    await flush_parked_results()
+    await release_expired_claims(now_ts)
+    async with acquire_db() as db, timed(DB_SECONDS, query="due_memes"):
+        async with db.execute(SQL_DUE_MEMES, (now_ts, now_ts)) as cur:
+            rows = await cur.fetchall()
+    if not rows:
+        return None
+
+    # one in-order worker per channel queue; channels drain concurrently
+    by_channel = {}
+    for channel_id, *row in rows:
+        by_channel.setdefault(channel_id, []).append(row)
+    if CATCHUP_POLICY != "now":
+        for channel_id, channel_rows in list(by_channel.items()):
+            by_channel[channel_id] = await catch_up_channel(context.bot, channel_id, channel_rows, now_ts)
+    results = await asyncio.gather(*(
+        _drain_chat(context.bot, channel_id, channel_rows) for channel_id, channel_rows in by_channel.items()
+    ))
+    retries = [ts for ts in results if ts is not None]
+    return min(retries) if retries else None
+
+class MediaCache:
+    """On-disk LRU cache of downloaded Telegram files, keyed by file_unique_id.
+
+    Used only by the download+reupload fallback. Files are streamed to disk,
+    a hit refreshes the file's mtime, and the oldest files are evicted once
+    the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def valid_key(key: Optional[str]) -> bool:
+        return bool(key) and FILE_UNIQUE_ID_RE.fullmatch(key) is not None
+
+    def _path(self, key: str) -> str:
+        if not self.valid_key(key):
+            raise ValueError(f"not a file_unique_id: {key!r}")
+        return os.path.join(self.directory, key)
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if not self.valid_key(key):
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    async def fetch(self, bot, file_id: str, key: Optional[str] = None) -> str:
+        """Return a local path for ``file_id``, downloading it on a miss.
+
+        A key that is not a valid file_unique_id is ignored. If Telegram's own
+        id is not valid either, the download goes under a random name: it is
+        not reused, and eviction removes it like any other entry.
+        """
+        path = self.get(key)
+        if path:
+            return path
+        file = await bot.get_file(file_id)
+        key = next((k for k in (key, file.file_unique_id) if self.valid_key(k)), None)
+        if key is None:
+            logger.warning("Not caching file_id=%s: no usable file_unique_id", file_id)
+            key = uuid.uuid4().hex
+        path = self.get(key)
+        if path:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # unique per download: two fetches of the same file must not share a temp file
+        fd, tmp = tempfile.mkstemp(prefix=key + ".", suffix=".part", dir=self.directory)
+        os.close(fd)
+        try:
+            await self._download(file, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+        return path
+
+    async def _download(self, file, dest: str):
+        url = file.file_path or ""
+        if not url.startswith(("http://", "https://")):
+            # local Bot API server: the file is already on disk
+            await file.download_to_drive(dest)
+            return
+        async with httpx.AsyncClient(timeout=MEDIA_DOWNLOAD_TIMEOUT) as client:
+            async with client.stream("GET", url) as resp:
+                resp.raise_for_status()
+                with open(dest, "wb") as out:
+                    async for chunk in resp.aiter_bytes(64 * 1024):
+                        out.write(chunk)
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+
+UPLOAD_EXTENSIONS = {"photo": ".jpg", "video": ".mp4", "animation": ".mp4", "document": ""}
+
+
+def _message_file_id(msg) -> Optional[str]:
+    """file_id of the media in a message we just sent."""
+    if msg is None:
+        return None
+    if getattr(msg, "photo", None):
+        return msg.photo[-1].file_id
+    for attr in ("video", "animation", "document"):
+        media = getattr(msg, attr, None)
+        if media is not None:
+            return media.file_id
+    return None
+
+
+async def reupload_meme(bot, chat_id, mid, file_id: str, file_unique_id: Optional[str], mime: Optional[str],
+                        kind: Optional[str], caption: Optional[str]) -> str:
+    """Download ``file_id`` through the media cache and upload it again.
+
+    The file_id Telegram returns for the upload becomes the row's
+    preview_file_id, so the next preview is a plain direct send. Returns the
+    method that worked; raises the last error if none did.
+    """
+    FALLBACKS.inc(kind="reupload")
+    path = await media_cache.fetch(bot, file_id, file_unique_id)
+    methods = send_methods_for(kind, mime)
+    for i, method in enumerate(methods):
+        await rate_limiter.acquire(chat_id)
+        try:
+            with open(path, "rb") as fh:
+                msg = await getattr(bot, SEND_METHODS[method])(
+                    chat_id, InputFile(fh, filename=f"meme_{mid}{UPLOAD_EXTENSIONS[method]}"), caption=caption
+                )
+        except RetryAfter as e:
+            rate_limiter.retry_after(chat_id, _retry_after_seconds(e))
+            raise
+        except Exception as e:
+            if i == len(methods) - 1:
+                raise
+            logger.debug("reupload via %s failed for id=%s: %s", SEND_METHODS[method], mid, e)
+            continue
+        new_file_id = _message_file_id(msg)
+        async with acquire_db() as db:
+            await db.execute(
+                # the upload is the meme itself, not a rendition, so preview_kind is cleared with it
+                "UPDATE memes SET preview_file_id=COALESCE(?1, preview_file_id),"
+                " preview_kind=CASE WHEN ?1 IS NULL THEN preview_kind END, send_method=?2 WHERE id=?3",
+                (new_file_id, method, mid),
+            )
+            await db.commit()
+        return method
+
+
+def preview_tool_available(kind: Optional[str]) -> bool:
+    """Whether render_preview has what it needs for ``kind``: Pillow for photos, ffmpeg for clips."""
+    if kind in (None, "photo"):
+        return pil_image() is not None
+    return shutil.which("ffmpeg") is not None
+
+
+def render_preview(path: str, kind: Optional[str]) -> Optional[tuple]:
+    """Build a preview rendition of the file at ``path``. Runs in a PreviewRenderer worker process.
+
+    Returns (data, preview kind), or None when the tool it needs is missing
+    or the rendition would not be smaller than the original.
+    """
+    if kind in (None, "photo"):
+        Image = pil_image()
+        if Image is None:
+            return None
+        with Image.open(path) as img:
+            img.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE))
+            out = io.BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=PREVIEW_JPEG_QUALITY, optimize=True)
+        data, preview_kind = out.getvalue(), "photo"
+    else:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, "preview.mp4")
+            subprocess.run(
+                [ffmpeg, "-v", "error", "-y", "-i", path, "-t", str(PREVIEW_CLIP_SECONDS), "-an",
+                 "-vf", f"scale='min({PREVIEW_MAX_SIDE},iw)':-2", "-c:v", "libx264", "-preset", "veryfast",
+                 "-b:v", PREVIEW_CLIP_BITRATE, "-pix_fmt", "yuv420p", "-movflags", "+faststart", dest],
+                check=True, capture_output=True, timeout=PREVIEW_RENDER_TIMEOUT,
+            )
+            with open(dest, "rb") as fh:
+                data, preview_kind = fh.read(), "video"
+    if len(data) >= os.path.getsize(path):
+        return None
+    return data, preview_kind
+
+
+class PreviewRenderer:
+    """Builds preview renditions for newly scheduled memes in the background.
+
+    The original is streamed to disk through the media cache, rendered in a
+    process pool (created on first use) so image and video work never runs on
+    the event loop, then uploaded silently to the owner's chat and deleted
+    again; the row keeps the upload's file_id as preview_file_id.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.bot = None
+        self._executor = None
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks = set()
+
+    @property
+    def active(self) -> bool:
+        return PREVIEWS_ENABLED and self.bot is not None
+
+    def start(self, bot):
+        self.bot = bot
+
+    def executor(self):
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn, not fork: the parent has aiosqlite threads running
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, chat_id, scheduled):
+        """Queue renditions for [(id, NewMeme), ...] that were just scheduled. Returns at once."""
+        if not self.active:
+            return
+        for mid, meme in scheduled:
+            if not preview_tool_available(meme.media_kind):
+                # checked here so an image without Pillow/ffmpeg is never downloaded
+                PREVIEWS.inc(outcome="skipped")
+                continue
+            task = asyncio.ensure_future(self.build(chat_id, mid, meme))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def build(self, chat_id, mid: int, meme: NewMeme) -> Optional[str]:
+        """Render, upload and record one preview. Returns its file_id, or None if the original is kept."""
+        async with self._slots:
+            try:
+                path = await media_cache.fetch(self.bot, meme.owner_file_id, meme.file_unique_id)
+                rendition = await asyncio.get_running_loop().run_in_executor(
+                    self.executor(), render_preview, path, meme.media_kind
+                )
+                if rendition is None:
+                    PREVIEWS.inc(outcome="skipped")
+                    return None
+                data, kind = rendition
+                await rate_limiter.acquire(chat_id)
+                with timed(API_SECONDS, method=SEND_METHODS[kind]):
+                    msg = await getattr(self.bot, SEND_METHODS[kind])(
+                        chat_id, InputFile(io.BytesIO(data), filename=f"preview_{mid}{UPLOAD_EXTENSIONS[kind]}"),
+                        disable_notification=True,
+                    )
+                file_id = _message_file_id(msg)
+                try:
+                    await self.bot.delete_message(chat_id, msg.message_id)
+                except Exception as e:
+                    logger.debug("Could not delete the preview upload for id=%s: %s", mid, e)
+                async with acquire_db() as db:
+                    await db.execute("UPDATE memes SET preview_file_id=?, preview_kind=? WHERE id=?", (file_id, kind, mid))
+                    await db.commit()
+                PREVIEWS.inc(outcome="built")
+                return file_id
+            except Exception as e:
+                PREVIEWS.inc(outcome="failed")
+                logger.warning("Could not build a preview for id=%s: %s: %s", mid, type(e).__name__, e)
+                return None
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+previews = PreviewRenderer(PREVIEW_WORKERS)
+
+
+def _scheduled_caption(mid, ts, mtype, user_caption, tz=IST) -> str:
+    # Build caption with ID, time (in the channel's timezone), type and user's caption if present
+    caption_parts = [f"ID: {mid}", f"Time: {datetime.fromtimestamp(ts, tz=tz).strftime('%Y-%m-%d %H:%M:%S %Z')}", f"Type: {mtype}"]
+    if user_caption:
+        caption_parts.append(f"Caption: {user_caption}")
+    return ", ".join(caption_parts)
+
+
+def _album_kind(kind: Optional[str], mime: Optional[str]) -> Optional[str]:
+    """Kind to use inside a media group, or None if the item must go out alone.
+
+    Albums accept photos and videos but not animations; legacy 'image' rows
+    are guessed as photos and corrected by the per-item fallback.
+    """
+    if kind in ("photo", "video"):
+        return kind
+    if kind is None and mime:
+        return "video" if mime.startswith("video") else "photo"
+    return None
+
+
+async def _send_scheduled_item(bot, chat_id, mid, file_id, mtype, caption, kind, file_unique_id=None) -> bool:
+    """Preview one item robustly (direct send, then download+reupload). Returns whether it was sent."""
+    if not file_id:
+        return False
+    try:
+        method = await send_meme(bot, chat_id, file_id, mtype, caption, mid, kind)
+        if method != kind:
+            await remember_send_method(mid, method)
+        return True
+    except Exception as e:
+        logger.debug("scheduled: direct send failed for id=%s: %s", mid, e)
+
+    # Attempt download + reupload
+    try:
+        await reupload_meme(bot, chat_id, mid, file_id, file_unique_id, mtype, kind, caption)
+        return True
+    except Exception as e:
+        logger.debug("scheduled: download+reupload failed for id=%s: %s", mid, e)
+    return False
+
+
+async def _send_rendition(bot, chat_id, mid, file_id, kind, caption) -> bool:
+    """Send a preview rendition. Nothing is learned or reuploaded; on failure the caller sends the original."""
+    try:
+        await send_meme(bot, chat_id, file_id, None, caption, mid, kind)
+        return True
+    except Exception as e:
+        logger.debug("preview rendition of id=%s failed: %s", mid, e)
+        return False
+
+
+async def _send_album(bot, chat_id, items) -> bool:
+    """Send (mid, file_id, kind, caption) items as one media group. Returns whether it was sent."""
+    media = [
+        (InputMediaVideo if kind == "video" else InputMediaPhoto)(media=file_id, caption=caption)
+        for _, file_id, kind, caption in items
+    ]
+    await rate_limiter.acquire(chat_id)
+    try:
+        with timed(API_SECONDS, method="send_media_group"):
+            await bot.send_media_group(chat_id, media)
+        return True
+    except RetryAfter as e:
+        API_ERRORS.inc(method="send_media_group", error="RetryAfter")
+        rate_limiter.retry_after(chat_id, _retry_after_seconds(e))
+    except Exception as e:
+        API_ERRORS.inc(method="send_media_group", error=type(e).__name__)
+        logger.debug("scheduled: album of ids=%s failed: %s", [i[0] for i in items], e)
+    FALLBACKS.inc(kind="album")
+    return False
+
+
+def _scheduled_keyboard(page: int, pages: int, compact: bool) -> Optional[InlineKeyboardMarkup]:
+    mode = "text" if compact else "media"
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton("« Prev", callback_data=f"scheduled:{page - 1}:{mode}"))
+    if page < pages:
+        buttons.append(InlineKeyboardButton("Next »", callback_data=f"scheduled:{page + 1}:{mode}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def fetch_scheduled_page(page: int, page_size: int, channel_id: int = DEFAULT_CHANNEL):
+    """One query for a page of a channel's pending memes. Returns (rows, total_pending)."""
+    async with acquire_db() as db, timed(DB_SECONDS, query="pending_page"):
+        async with db.execute(SQL_PENDING_PAGE, (channel_id, channel_id, page_size, (page - 1) * page_size)) as cur:
+            rows = await cur.fetchall()
+    total = rows[0][-1] if rows else 0
+    return [row[:-1] for row in rows], total
+
+
+async def render_scheduled_page(bot, chat_id, page: int, compact: bool, channel_id: int = DEFAULT_CHANNEL):
+    """Send one page of /scheduled. Returns (text, keyboard) for the trailing summary message."""
+    page_size = SCHEDULED_TEXT_PAGE_SIZE if compact else SCHEDULED_PAGE_SIZE
+    rows, total = await fetch_scheduled_page(page, page_size, channel_id)
+    if not rows and page > 1:
+        # ran past the end (e.g. memes were posted meanwhile); show the last page
+        async with acquire_db() as db:
+            async with db.execute("SELECT COUNT(*) FROM memes WHERE posted=0 AND channel_id=?", (channel_id,)) as cur:
+                total = (await cur.fetchone())[0]
+        page = max(1, -(-total // page_size))
+        rows, total = await fetch_scheduled_page(page, page_size, channel_id)
+    if not rows:
+        return "No scheduled memes.", None
+
+    pages = -(-total // page_size)
+    tz = channels.calendar(channel_id).tz
+    header = f"Scheduled memes: page {page}/{pages} ({total} pending)"
+    keyboard = _scheduled_keyboard(page, pages, compact)
+    if compact:
+        lines = [
+            f"{mid}. {datetime.fromtimestamp(ts, tz=tz).strftime('%Y-%m-%d %H:%M')} · {kind or mtype}"
+            + (f" · {user_caption[:40]}" if user_caption else "")
+            for mid, ts, _, mtype, _, user_caption, kind, _, _ in rows
+        ]
+        return header + "\n" + "\n".join(lines), keyboard
+
+    items = []
+    for mid, ts, owner_file_id, mtype, preview_id, user_caption, kind, unique_id, preview_kind in rows:
+        caption = _scheduled_caption(mid, ts, mtype, user_caption, tz)
+        if preview_id and preview_kind:
+            # a rendition goes out as its own kind; the original is the fallback
+            original = (owner_file_id, mtype, kind, unique_id)
+            rendition_mime = "video" if preview_kind == "video" else "image"
+            items.append((mid, preview_id, rendition_mime, caption, preview_kind, None, original))
+        else:
+            # Fallback: if preview_id is missing/null, use owner_file_id
+            file_id = preview_id if preview_id else owner_file_id
+            items.append((mid, file_id, mtype, caption, kind, unique_id, None))
+
+    # photos and videos go out as one album; everything else (and the whole
+    # album, if Telegram rejects it) falls back to one send per item
+    album = [item for item in items if item[1] and _album_kind(item[4], item[2])]
+    singles = items
+    if len(album) > 1:
+        sent = await _send_album(bot, chat_id, [
+            (mid, file_id, _album_kind(kind, mtype), caption) for mid, file_id, mtype, caption, kind, _, _ in album
+        ])
+        if sent:
+            singles = [item for item in items if item not in album]
+
+    for mid, file_id, mtype, caption, kind, unique_id, original in singles:
+        if original is not None:
+            if await _send_rendition(bot, chat_id, mid, file_id, kind, caption):
+                continue
+            file_id, mtype, kind, unique_id = original
+        if not await _send_scheduled_item(bot, chat_id, mid, file_id, mtype, caption, kind, unique_id):
+            # If all attempts fail, send a text placeholder
+            await bot.send_message(chat_id, caption)
+    return header, keyboard
+
+
+def _parse_scheduled_args(args):
+    page, compact = 1, False
+    for arg in args or []:
+        if arg.isdigit():
+            page = max(1, int(arg))
+        elif arg.lower() in ("text", "compact"):
+            compact = True
+    return page, compact
+
+
+async def owner_channel(update: Update) -> Optional[int]:
+    """The channel the sender is working on. Replies and returns None if they own no channel."""
+    channel_id = channels.current(update.effective_user.id)
+    if channel_id is None:
+        await update.message.reply_text("Only the owner can use this command.")
+    return channel_id
+
+
+@timed(HANDLER_SECONDS, handler="scheduled")
+async def scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/scheduled [page] [text]: one page of previews sent as albums, or a compact text list."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    page, compact = _parse_scheduled_args(context.args)
+    text, keyboard = await render_scheduled_page(context.bot, update.effective_chat.id, page, compact, channel_id)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+@timed(HANDLER_SECONDS, handler="scheduled_page")
+async def scheduled_page_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Prev/next buttons under a /scheduled page."""
+    query = update.callback_query
+    channel_id = channels.current(query.from_user.id)
+    if channel_id is None:
+        await query.answer("Only the owner can use this command.")
+        return
+    await query.answer()
+    _, page, mode = query.data.split(":")
+    compact = mode == "text"
+    text, keyboard = await render_scheduled_page(context.bot, query.message.chat_id, int(page), compact, channel_id)
+    if compact:
+        # text pages are edited in place
+        await query.edit_message_text(text, reply_markup=keyboard)
+    else:
+        await query.edit_message_reply_markup(None)
+        await context.bot.send_message(query.message.chat_id, text, reply_markup=keyboard)
+
+# Media kind of a row; legacy rows without media_kind fall back to the learned
+# send method, then to their coarse mime type.
+KIND_EXPR = "COALESCE(media_kind, send_method, CASE WHEN mime_type LIKE 'video%' THEN 'video' ELSE 'photo' END)"
+KIND_ALIASES = {
+    "photo": "photo", "photos": "photo", "image": "photo", "images": "photo",
+    "video": "video", "videos": "video",
+    "animation": "animation", "animations": "animation", "gif": "animation", "gifs": "animation",
+    "document": "document", "documents": "document",
+}
+
+
+def parse_selection(tokens) -> tuple:
+    """Parse IDs, ranges and kind filters ("3 5,7 10-400 videos", or "all") into a SQL predicate.
+
+    Returns (where_sql, params). Raises ValueError on anything unrecognised or
+    an empty selection.
+    """
+    ids, ranges, kinds, everything = [], [], set(), False
+    for token in tokens:
+        for part in token.lower().split(","):
+            m = re.fullmatch(r"(\d+)-(\d+)", part)
+            if not part:
+                continue
+            elif part.isdigit():
+                ids.append(int(part))
+            elif m:
+                lo, hi = sorted((int(m.group(1)), int(m.group(2))))
+                ranges.append((lo, hi))
+            elif part in KIND_ALIASES:
+                kinds.add(KIND_ALIASES[part])
+            elif part == "all":
+                everything = True
+            else:
+                raise ValueError(f"Don't understand {part!r}")
+    if not (ids or ranges or kinds or everything):
+        raise ValueError("Nothing selected")
+
+    clauses, params = [], []
+    id_terms = []
+    if ids:
+        id_terms.append(f"id IN ({','.join('?' * len(ids))})")
+        params += ids
+    for lo, hi in ranges:
+        id_terms.append("id BETWEEN ? AND ?")
+        params += [lo, hi]
+    if id_terms:
+        clauses.append("(" + " OR ".join(id_terms) + ")")
+    if kinds:
+        clauses.append(f"{KIND_EXPR} IN ({','.join('?' * len(kinds))})")
+        params += sorted(kinds)
+    return " AND ".join(clauses) or "1", params
+
+
+def format_ids(ids, limit: int = 50) -> str:
+    """Compact "1-5, 8, 10-12" rendering of sorted ids."""
+    runs = []
+    for mid in sorted(ids):
+        if runs and mid == runs[-1][1] + 1:
+            runs[-1][1] = mid
+        else:
+            runs.append([mid, mid])
+    parts = [str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in runs]
+    if len(parts) > limit:
+        parts = parts[:limit] + [f"... ({len(parts) - limit} more)"]
+    return ", ".join(parts)
+
+
+async def unschedule_selection(where: str, params, channel_id: int = DEFAULT_CHANNEL) -> list:
+    """Delete the selected pending memes of one channel in one statement. Returns the deleted ids."""
+    async with acquire_db() as db, timed(DB_SECONDS, query="unschedule"):
+        async with db.execute(
+            f"DELETE FROM memes WHERE posted=0 AND channel_id=? AND {where} RETURNING id", [channel_id] + list(params)
+        ) as cur:
+            deleted = [row[0] for row in await cur.fetchall()]
+        await db.commit()
+    if deleted:
+        post_scheduler.invalidate()
+    return deleted
+
+
+@timed(HANDLER_SECONDS, handler="unschedule")
+async def unschedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/unschedule 3 5 10-400 videos: remove the selected pending memes."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    try:
+        where, params = parse_selection(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"{e}. Usage: /unschedule <id|start-end|videos|photos|gifs|all> ...")
+        return
+    deleted = await unschedule_selection(where, params, channel_id)
+    if not deleted:
+        await update.message.reply_text("No matching scheduled memes.")
+        return
+    await update.message.reply_text(f"Unscheduled {len(deleted)} meme(s): IDs {format_ids(deleted)}.")
+
+
+@timed(HANDLER_SECONDS, handler="preview")
+async def preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Preview a scheduled meme by id. Tries direct send, then downloads (via the media cache) and reuploads."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Usage: /preview <id>")
+        return
+    meme_id = int(context.args[0])
+    # immediate ack so owner knows the command was received
+    try:
+        await update.message.reply_text(f"Previewing meme {meme_id}...")
+    except Exception:
+        logger.debug("Could not send ack reply for preview %s", meme_id)
+    async with acquire_db() as db:
+        async with db.execute(
+            "SELECT COALESCE(preview_file_id, owner_file_id), mime_type, COALESCE(send_method, media_kind), file_unique_id,"
+            " preview_kind, owner_file_id FROM memes WHERE id=? AND channel_id=?",
+            (meme_id, channel_id),
+        ) as cur:
+            row = await cur.fetchone()
+    if not row:
+        await update.message.reply_text(f"No meme found with ID {meme_id}.")
+        return
+    file_id, mime, kind, unique_id, preview_kind, owner_file_id = row
+    chat_id = update.effective_chat.id
+    if preview_kind:
+        if await _send_rendition(context.bot, chat_id, meme_id, file_id, preview_kind, f"Preview ID {meme_id}"):
+            return
+        file_id = owner_file_id
+    # Try direct sends, starting with the method learned for this row
+    try:
+        try:
+            method = await send_meme(context.bot, chat_id, file_id, mime, f"Preview ID {meme_id}", meme_id, kind)
+            if method != kind:
+                await remember_send_method(meme_id, method)
+            return
+        except Exception as e_direct:
+            logger.debug("Direct send failed for preview id=%s: %s", meme_id, e_direct)
+        # If direct fails, download and reupload
+        await reupload_meme(context.bot, chat_id, meme_id, file_id, unique_id, mime, kind, f"Preview ID {meme_id}")
+    except Exception as e:
+        logger.exception("Preview failed for id=%s: %s", meme_id, e)
+        await update.message.reply_text(f"Failed to preview meme {meme_id}: {type(e).__name__}: {e}")
+
+LOG_OUTCOMES = {
+    "failed": ("failed", "dead"), "fail": ("failed", "dead"), "failures": ("failed", "dead"), "errors": ("failed", "dead"),
+    "dead": ("dead",),
+    "posted": ("posted",), "ok": ("posted",), "success": ("posted",),
+}
+LOG_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_log_args(args) -> tuple:
+    """``["failed", "24h", "stats"]`` -> (outcomes or None, window seconds or None, stats). Raises ValueError."""
+    outcomes, window, stats = None, None, False
+    for arg in args or []:
+        arg = arg.lower()
+        m = re.fullmatch(r"(\d+)([mhd])", arg)
+        if m:
+            window = int(m.group(1)) * LOG_UNITS[m.group(2)]
+        elif arg in LOG_OUTCOMES:
+            outcomes = LOG_OUTCOMES[arg]
+        elif arg == "stats":
+            stats = True
+        else:
+            raise ValueError(f"Don't understand {arg!r}")
+    return outcomes, window, stats
+
+
+def format_post_event(row, tz=IST) -> str:
+    ts, mid, outcome, method, latency_ms, attempt, error_class, error = row
+    when = datetime.fromtimestamp(ts, tz=tz).strftime("%Y-%m-%d %H:%M:%S")
+    line = f"{when} [{outcome.upper()}] id={mid}"
+    if method:
+        line += f" via {method}"
+    if attempt:
+        line += f" attempt {attempt}"
+    if latency_ms is not None:
+        line += f" {latency_ms}ms"
+    if error_class:
+        line += f": {error_class}: {error}"[:200]
+    return line
+
+
+async def fetch_post_events(channel_id: int, outcomes=None, since_ts: int = 0, limit: int = LOG_PAGE_SIZE) -> list:
+    """The channel's newest post events (optionally only some outcomes), newest first."""
+    params = [channel_id, since_ts]
+    extra = ""
+    if outcomes:
+        extra = f"AND outcome IN ({','.join('?' * len(outcomes))})"
+        params += list(outcomes)
+    async with acquire_db() as db:
+        async with db.execute(SQL_RECENT_POST_EVENTS.format(extra), params + [limit]) as cur:
+            return await cur.fetchall()
+
+
+async def post_event_stats(channel_id: int, since_ts: int) -> str:
+    """Counts and latency per outcome plus the top error classes since ``since_ts``, as text."""
+    async with acquire_db() as db:
+        async with db.execute(SQL_POST_EVENT_STATS, (channel_id, since_ts)) as cur:
+            by_outcome = {row[0]: row[1:] for row in await cur.fetchall()}
+        async with db.execute(SQL_POST_EVENT_ERRORS, (channel_id, since_ts)) as cur:
+            errors = await cur.fetchall()
+    total = sum(count for count, _, _ in by_outcome.values())
+    if not total:
+        return "No posting events in that window."
+    lines = [f"{total} attempt(s):"]
+    for outcome in ("posted", "failed", "dead"):
+        if outcome in by_outcome:
+            count, avg_ms, max_ms = by_outcome[outcome]
+            lines.append(f"  {outcome}: {count} ({count * 100 // total}%), avg {avg_ms or 0:.0f}ms, max {max_ms or 0}ms")
+    if errors:
+        lines.append("Top errors: " + ", ".join(f"{name} ×{count}" for name, count in errors))
+    return "\n".join(lines)
+
+
+@timed(HANDLER_SECONDS, handler="log")
+async def logcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/log [failed|dead|posted] [90m|24h|7d] [stats]: recent posting events of the current channel."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    try:
+        outcomes, window, stats = parse_log_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"{e}. Usage: /log [failed|dead|posted] [90m|24h|7d] [stats]")
+        return
+    now_ts = int(datetime.now(IST).timestamp())
+    if stats:
+        window = window or 86400
+        text = await post_event_stats(channel_id, now_ts - window)
+        unit = next(u for u in ("d", "h", "m") if window % LOG_UNITS[u] == 0)
+        await update.message.reply_text(f"Posting stats, last {window // LOG_UNITS[unit]}{unit}:\n{text}")
+        return
+    rows = await fetch_post_events(channel_id, outcomes, now_ts - window if window else 0)
+    if not rows:
+        await update.message.reply_text("No posting events yet." if not (outcomes or window) else "No matching posting events.")
+        return
+    tz = channels.calendar(channel_id).tz
+    await update.message.reply_text("Last posting events:\n" + "\n".join(format_post_event(r, tz) for r in rows))
+
+class PostScheduler:
+    """Sleeps until the next pending ``scheduled_ts`` instead of polling.
+
+    Keeps a min-heap of upcoming timestamps. ``push`` adds a newly scheduled
+    time; ``invalidate`` tells the loop the queue changed in some other way
+    (unschedule, reschedule, manual post) so the heap is rebuilt from the DB.
+    Every timed wake-up rebuilds it too, at least once per POSTER_RESYNC, so
+    memes imported by another process are posted without a restart.
+
+    At boot, memes that fell due while the bot was down are posted straight
+    from the due index before the heap is restored, and a failing first
+    attempt is retried after 1s, 2s, 4s... rather than a flat POST_RETRY_DELAY.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._dirty = True
+        self._wakeup = asyncio.Event()
+
+    def push(self, ts: int):
+        heapq.heappush(self._heap, ts)
+        self._wakeup.set()
+
+    def invalidate(self):
+        self._dirty = True
+        self._wakeup.set()
+
+    def next_due(self) -> Optional[int]:
+        return self._heap[0] if self._heap else None
+
+    async def reload(self):
+        async with acquire_db() as db:
+            async with db.execute(SQL_PENDING_TS) as cur:
+                rows = await cur.fetchall()
+        self._heap = [r[0] for r in rows]
+        heapq.heapify(self._heap)
+        self._dirty = False
+
+    async def catch_up(self, application):
+        """Post whatever is already due, without waiting for the heap to be rebuilt."""
+        retry_ts = await pop_due_memes_and_post(application)
+        if retry_ts is not None:
+            heapq.heappush(self._heap, retry_ts)
+
+    async def run(self, application):
+        retry_delay = 1
+        while True:
+            try:
+                await self.catch_up(application)
+                break
+            except Exception:
+                logger.exception("Error posting overdue memes at startup")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, POST_RETRY_DELAY)
+        while True:
+            self._wakeup.clear()
+            try:
+                if self._dirty:
+                    await self.reload()
+                now_ts = int(datetime.now(IST).timestamp())
+                if self._heap and self._heap[0] <= now_ts:
+                    while self._heap and self._heap[0] <= now_ts:
+                        heapq.heappop(self._heap)
+                    retry_ts = await pop_due_memes_and_post(application)
+                    if retry_ts is not None:
+                        # failed rows stay pending until their backoff expires
+                        heapq.heappush(self._heap, retry_ts)
+                    continue
+            except Exception:
+                logger.exception("Error in poster loop")
+                self._dirty = True
+                await asyncio.sleep(POST_RETRY_DELAY)
+                continue
+            timeout = POSTER_RESYNC
+            if self._heap:
+                timeout = min(timeout, max(0, self._heap[0] - now_ts))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                # nothing told us about changes made outside this process
+                self._dirty = True
+
+
+post_scheduler = PostScheduler()
+
+
+async def _collect_queue_metrics():
+    """Queue depth per channel (one covered GROUP BY) and time until the poster's next wakeup."""
+    if db_pool is None:
+        return
+    async with acquire_db() as db:
+        async with db.execute("SELECT channel_id, COUNT(*) FROM memes WHERE posted=0 GROUP BY channel_id") as cur:
+            depths = dict(await cur.fetchall())
+    QUEUE_DEPTH.values.clear()
+    for channel_id in channels.channels:
+        QUEUE_DEPTH.set(depths.get(channel_id, 0), channel=channels.chat_id(channel_id) or channel_id)
+    next_due = post_scheduler.next_due()
+    if next_due is not None:
+        NEXT_POST_SECONDS.set(max(0, next_due - int(datetime.now(IST).timestamp())))
+
+
+metrics.collectors.append(_collect_queue_metrics)
+
+
+async def archive_posted_memes(older_than_ts: int, chunk: int = ARCHIVE_CHUNK) -> int:
+    """Move posted memes scheduled before ``older_than_ts`` into memes_archive. Returns how many moved.
+
+    Works in short ``chunk``-row transactions and yields between them, so the
+    poster and command handlers never wait behind one long write.
+    """
+    moved = 0
+    while True:
+        async with acquire_db() as db, timed(DB_SECONDS, query="archive"):
+            async with db.execute(
+                "SELECT id FROM memes WHERE posted=1 AND scheduled_ts<? ORDER BY id LIMIT ?", (older_than_ts, chunk)
+            ) as cur:
+                ids = [row[0] for row in await cur.fetchall()]
+            if not ids:
+                return moved
+            marks = ",".join("?" * len(ids))
+            await db.execute(
+                f"INSERT INTO memes_archive ({ARCHIVE_COLUMNS}, archived_ts)"
+                f" SELECT {ARCHIVE_COLUMNS}, ? FROM memes WHERE id IN ({marks})",
+                [int(datetime.now(IST).timestamp())] + ids,
+            )
+            await db.execute(f"DELETE FROM memes WHERE id IN ({marks})", ids)
+            await db.commit()
+        moved += len(ids)
+        await asyncio.sleep(0)
+
+
+async def compact_db(max_pages: Optional[int] = None) -> int:
+    """Return free pages to the filesystem and refresh planner statistics. Returns pages freed.
+
+    Pages are freed in steps with ``incremental_vacuum``; this never runs a
+    full VACUUM (open_db switches auto_vacuum once at startup), so a file
+    that is somehow still in another mode only gets its statistics refreshed.
+    """
+    async with acquire_db() as db, timed(DB_SECONDS, query="compact"):
+        async with db.execute("PRAGMA auto_vacuum") as cur:
+            mode = (await cur.fetchone())[0]
+        async with db.execute("PRAGMA freelist_count") as cur:
+            free_before = (await cur.fetchone())[0]
+        if mode == 2:
+            remaining = free_before if max_pages is None else min(free_before, max_pages)
+            while remaining > 0:
+                step = min(remaining, VACUUM_PAGES_PER_STEP)
+                await (await db.execute(f"PRAGMA incremental_vacuum({step})")).close()
+                remaining -= step
+                await asyncio.sleep(0)
+        await db.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        await db.execute("ANALYZE")
+        await db.commit()
+        async with db.execute("PRAGMA freelist_count") as cur:
+            free_after = (await cur.fetchone())[0]
+    return free_before - free_after
+
+
+async def table_sizes() -> list:
+    """[(table, rows, bytes or None), ...] for the bot's tables; bytes need SQLite's dbstat."""
+    tables = ["memes", "memes_archive", "post_events"]
+    sizes = {}
+    async with acquire_db() as db:
+        try:
+            async with db.execute(
+                "SELECT COALESCE(i.tbl_name, d.name), SUM(d.pgsize) FROM dbstat d"
+                " LEFT JOIN sqlite_schema i ON i.name=d.name AND i.type='index' GROUP BY 1"
+            ) as cur:
+                sizes = dict(await cur.fetchall())
+        except Exception:
+            pass  # dbstat not compiled in
+        rows = []
+        for table in tables:
+            async with db.execute(f"SELECT COUNT(*) FROM {table}") as cur:
+                rows.append((table, (await cur.fetchone())[0], sizes.get(table)))
+    return rows
+
+
+class MaintenanceJob:
+    """Archives old posted memes and compacts the database every ``interval`` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_run = None
+        self.last_result = None
+
+    async def run_once(self) -> dict:
+        archived = 0
+        if ARCHIVE_AFTER_DAYS > 0:
+            cutoff = int(datetime.now(IST).timestamp()) - ARCHIVE_AFTER_DAYS * 86400
+            archived = await archive_posted_memes(cutoff)
+        freed = await compact_db()
+        self.last_run = datetime.now(IST)
+        self.last_result = {"archived": archived, "freed_pages": freed}
+        logger.info("Maintenance: archived %d memes, freed %d pages", archived, freed)
+        return self.last_result
+
+    async def run(self):
+        # let startup (and any overdue posts) finish before the first pass
+        await asyncio.sleep(MAINTENANCE_FIRST_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Maintenance run failed")
+            await asyncio.sleep(self.interval)
+
+
+maintenance = MaintenanceJob(MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+class Snapshot(NamedTuple):
+    path: str
+    size: int
+    seconds: float
+
+
+def copy_db(src_path: str, dest_path: str, pages: int = -1, sleep: float = 0.0):
+    """Online copy of the database at ``src_path`` into a new file at ``dest_path``.
+
+    Blocking (run it in a thread). The copy is written next to the target and
+    renamed into place only after it passes ``PRAGMA quick_check``.
+    """
+    tmp = dest_path + ".part"
+    src = sqlite3.connect(src_path)
+    try:
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages, sleep=sleep)
+            check = dst.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            dst.close()
+        if check != "ok":
+            raise RuntimeError(f"Snapshot failed its integrity check: {check}")
+        os.replace(tmp, dest_path)
+    finally:
+        src.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def list_snapshots(directory: str) -> list:
+    """[(path, size, mtime), ...] of the snapshots in ``directory``, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    entries = [
+        (entry.path, entry.stat().st_size, entry.stat().st_mtime)
+        for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.startswith("memes-") and entry.name.endswith(".db")
+    ]
+    return sorted(entries, key=lambda e: (e[2], e[0]), reverse=True)
+
+
+class BackupJob:
+    """Takes online snapshots of the database every ``interval`` seconds and on /backup.
+
+    The backup itself runs on a worker thread, so the event loop keeps serving
+    the poster and handlers; between page batches the source is unlocked so
+    their writes are never held up for long.
+    """
+
+    def __init__(self, interval: float, directory: str, keep: int):
+        self.interval = interval
+        self.directory = directory
+        self.keep = keep
+        self.last_run = None
+        self.last_result = None
+        self._lock = asyncio.Lock()
+
+    async def run_once(self) -> Snapshot:
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now(IST).strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(self.directory, f"memes-{stamp}.db")
+            n = 1
+            while os.path.exists(path):
+                n += 1
+                path = os.path.join(self.directory, f"memes-{stamp}-{n}.db")
+            src = db_pool.path if db_pool is not None else DB_PATH
+            started = perf_counter()
+            with timed(DB_SECONDS, query="backup"):
+                await asyncio.to_thread(copy_db, src, path, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP)
+            snapshot = Snapshot(path, os.path.getsize(path), perf_counter() - started)
+            for old, _, _ in list_snapshots(self.directory)[max(self.keep, 1):]:
+                os.remove(old)
+            self.last_run = datetime.now(IST)
+            self.last_result = snapshot
+        logger.info("Backup: wrote %s (%d bytes) in %.1fs", path, snapshot.size, snapshot.seconds)
+        return snapshot
+
+    async def run(self):
+        if self.interval <= 0:
+            return
+        await asyncio.sleep(BACKUP_FIRST_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Backup failed")
+            await asyncio.sleep(self.interval)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
-        # Check if preview_file_id and caption columns exist to avoid sqlite errors on older DBs
-        async with db.execute("PRAGMA table_info(memes)") as pcur:
-            cols = await pcur.fetchall()
-        col_names = [c[1] for c in cols]
-        has_preview = 'preview_file_id' in col_names
-        has_caption = 'caption' in col_names
-        
-        if has_preview and has_caption:
-            query = "SELECT id, scheduled_ts, mime_type, preview_file_id, caption FROM memes WHERE posted=0 ORDER BY scheduled_ts ASC"
-        elif has_preview:
-            query = "SELECT id, scheduled_ts, mime_type, preview_file_id FROM memes WHERE posted=0 ORDER BY scheduled_ts ASC"
-        else:
-            query = "SELECT id, scheduled_ts, mime_type FROM memes WHERE posted=0 ORDER BY scheduled_ts ASC"
-            
-        async with db.execute(query) as cur:
-            rows = await cur.fetchall()
 
-    if not rows:
-        await update.message.reply_text("No scheduled memes.")
-        return
+backups = BackupJob(BACKUP_INTERVAL_HOURS * 3600, BACKUP_DIR, BACKUP_KEEP)
 
-    # For each scheduled item, try to send a preview robustly (direct send, then download+reupload)
-    for row in rows:
-        if has_preview and has_caption:
-            mid, ts, mtype, preview_id, user_caption = row
-        elif has_preview:
-            mid, ts, mtype, preview_id = row
-            user_caption = None
-        else:
-            mid, ts, mtype = row
-            preview_id = None
-            user_caption = None
-
-        # Fallback: if preview_id is missing/null, use owner_file_id
-        async with aiosqlite.connect(DB_PATH) as db:
-            await init_db()
-            async with db.execute("SELECT owner_file_id FROM memes WHERE id=?", (mid,)) as cur:
-                owner_row = await cur.fetchone()
-        owner_file_id = owner_row[0] if owner_row else None
-        file_id = preview_id if preview_id else owner_file_id
-
-        # Build caption with ID, time, type and user's caption if present
-        caption_parts = [f"ID: {mid}", f"Time: {datetime.fromtimestamp(ts, tz=IST).strftime('%Y-%m-%d %H:%M:%S IST')}", f"Type: {mtype}"]
-        if user_caption:
-            caption_parts.append(f"Caption: {user_caption}")
-        caption = ", ".join(caption_parts)
-
-        sent = False
-        # Try direct sends with fallbacks
+
+def restore_snapshot(snapshot: str, db_path: Optional[str] = None) -> Optional[str]:
+    """Replace the database with ``snapshot``. Only while the bot is stopped.
+
+    The current database is first copied aside; returns that copy's path (None
+    if there was no database). Older snapshots are migrated on the next start.
+    """
+    db_path = db_path or DB_PATH
+    src = sqlite3.connect(snapshot)
+    try:
+        check = src.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise ValueError(f"{snapshot} failed its integrity check: {check}")
+        version = src.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"{snapshot} has schema version {version}, newer than this bot supports ({SCHEMA_VERSION})")
+        saved = None
+        if os.path.exists(db_path):
+            saved = f"{db_path}.before-restore-{datetime.now(IST).strftime('%Y%m%d-%H%M%S')}"
+            copy_db(db_path, saved)
+        dst = sqlite3.connect(db_path)
         try:
-            if mtype and mtype.startswith('video'):
-                try:
-                    if file_id:
-                        await context.bot.send_video(update.effective_chat.id, file_id, caption=caption)
-                        sent = True
-                except Exception as e:  # direct video failed
-                    logger.debug("scheduled: direct send_video failed for id=%s: %s", mid, e)
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return saved
 
-            if not sent and file_id:
-                try:
-                    await context.bot.send_photo(update.effective_chat.id, file_id, caption=caption)
-                    sent = True
-                except Exception as e:
-                    logger.debug("scheduled: direct send_photo failed for id=%s: %s", mid, e)
-                    try:
-                        await context.bot.send_document(update.effective_chat.id, file_id, caption=caption)
-                        sent = True
-                    except Exception as e2:
-                        logger.debug("scheduled: direct send_document failed for id=%s: %s", mid, e2)
-
-            if not sent and file_id:
-                # Attempt download + reupload
-                try:
-                    file = await context.bot.get_file(file_id)
-                    bio = io.BytesIO()
-                    await file.download(out=bio)
-                    bio.seek(0)
-                    if mtype and mtype.startswith('video'):
-                        await context.bot.send_video(update.effective_chat.id, InputFile(bio, filename=f"meme_{mid}.mp4"), caption=caption)
-                    else:
-                        try:
-                            await context.bot.send_photo(update.effective_chat.id, InputFile(bio, filename=f"meme_{mid}.jpg"), caption=caption)
-                        except Exception:
-                            bio.seek(0)
-                            await context.bot.send_document(update.effective_chat.id, InputFile(bio, filename=f"meme_{mid}"), caption=caption)
-                    sent = True
-                except Exception as e:
-                    logger.debug("scheduled: download+reupload failed for id=%s: %s", mid, e)
 
-        except Exception as e:
-            logger.exception("Unexpected error while previewing scheduled id=%s: %s", mid, e)
+def _fmt_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "?"
+    if n < 1024 * 1024:
+        return f"{n / 1024:.0f}KB"
+    return f"{n / (1024 * 1024):.1f}MB"
 
-        if not sent:
-            # If all attempts fail, send a text placeholder
-            await update.message.reply_text(caption)
-async def unschedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
-        await update.message.reply_text("Only the owner can use this command.")
-        return
-    if not context.args or not all(arg.isdigit() for arg in context.args):
-        await update.message.reply_text("Usage: /unschedule <id1> <id2> ...")
-        return
-    meme_ids = [int(arg) for arg in context.args]
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
-        for meme_id in meme_ids:
-            await db.execute("DELETE FROM memes WHERE id=? AND posted=0", (meme_id,))
-        await db.commit()
-    await update.message.reply_text(f"Unscheduled memes with IDs: {', '.join(str(mid) for mid in meme_ids)} (if they existed and were not posted yet).")
 
+def _fmt_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "n/a"
+    if value < 1:
+        return f"{value * 1000:.0f}ms"
+    if value < 120:
+        return f"{value:.1f}s"
+    return f"{value / 60:.0f}m"
 
-async def preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Preview a scheduled meme by id. Tries direct send, then downloads and reuploads as a document if needed."""
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
+
+async def render_stats(channel_id: int) -> str:
+    """Owner-facing summary of the metrics since the process started."""
+    await metrics.collect()
+    depth = QUEUE_DEPTH.values.get((str(channels.chat_id(channel_id) or channel_id),), 0)
+    next_due = post_scheduler.next_due()
+    api_calls = API_SECONDS.count() + API_ERRORS.total()
+    fallbacks = FALLBACKS.total()
+    lines = [
+        f"Queue: {depth:g} pending on {channels.label(channel_id)}"
+        + (f", poster wakes in {_fmt_seconds(NEXT_POST_SECONDS.values.get((), 0))}" if next_due else ""),
+        f"Posts since start: {POSTS.total(outcome='posted'):g} posted, {POSTS.total(outcome='failed'):g} failed,"
+        f" {POSTS.total(outcome='dead'):g} dead-lettered",
+        f"Posting lag: p50 {_fmt_seconds(POST_LAG_SECONDS.quantile(0.5))},"
+        f" p95 {_fmt_seconds(POST_LAG_SECONDS.quantile(0.95))}",
+        f"Bot API: {api_calls:g} calls, p50 {_fmt_seconds(API_SECONDS.quantile(0.5))},"
+        f" p95 {_fmt_seconds(API_SECONDS.quantile(0.95))}, {API_ERRORS.total():g} errors",
+        f"Fallbacks: {fallbacks:g}" + (f" ({fallbacks * 100 / api_calls:.1f}% of calls)" if api_calls else ""),
+        f"DB: p50 {_fmt_seconds(DB_SECONDS.quantile(0.5))}, p95 {_fmt_seconds(DB_SECONDS.quantile(0.95))}",
+        f"Handlers: p95 {_fmt_seconds(HANDLER_SECONDS.quantile(0.95))} over {HANDLER_SECONDS.count()} updates",
+        "Tables: " + ", ".join(f"{name} {rows} rows/{_fmt_bytes(size)}" for name, rows, size in await table_sizes()),
+    ]
+    if maintenance.last_run is not None:
+        lines.append(
+            f"Last maintenance: {maintenance.last_run.strftime('%Y-%m-%d %H:%M %Z')}, archived"
+            f" {maintenance.last_result['archived']}, freed {maintenance.last_result['freed_pages']} pages"
+        )
+    if backups.last_run is not None:
+        lines.append(
+            f"Last backup: {backups.last_run.strftime('%Y-%m-%d %H:%M %Z')},"
+            f" {_fmt_bytes(backups.last_result.size)} in {_fmt_seconds(backups.last_result.seconds)}"
+        )
+    return "\n".join(lines)
+
+
+async def backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/backup [list|send]: snapshot the database now, list snapshots, or snapshot and send it (OWNER_ID only)."""
+    if update.effective_user.id != OWNER_ID:
         await update.message.reply_text("Only the owner can use this command.")
         return
-    if not context.args or not context.args[0].isdigit():
-        await update.message.reply_text("Usage: /preview <id>")
+    arg = context.args[0].lower() if context.args else ""
+    if arg == "list":
+        snapshots = list_snapshots(backups.directory)
+        if not snapshots:
+            await update.message.reply_text("No snapshots yet.")
+            return
+        lines = [f"{len(snapshots)} snapshot(s) in {backups.directory}:"] + [
+            f"{os.path.basename(path)} · {_fmt_bytes(size)}" for path, size, _ in snapshots
+        ]
+        await update.message.reply_text("\n".join(lines))
         return
-    meme_id = int(context.args[0])
-    # immediate ack so owner knows the command was received
-    try:
-        await update.message.reply_text(f"Previewing meme {meme_id}...")
-    except Exception:
-        logger.debug("Could not send ack reply for preview %s", meme_id)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
-        async with db.execute("SELECT owner_file_id, mime_type FROM memes WHERE id=?", (meme_id,)) as cur:
-            row = await cur.fetchone()
-    if not row:
-        await update.message.reply_text(f"No meme found with ID {meme_id}.")
+    if arg not in ("", "send"):
+        await update.message.reply_text("Usage: /backup [list|send]")
         return
-    file_id, mime = row
-    chat_id = update.effective_chat.id
-    # Try direct sends with fallbacks
     try:
-        if mime and mime.startswith("video"):
-            await context.bot.send_video(chat_id, file_id, caption=f"Preview ID {meme_id}")
-            return
-        try:
-            await context.bot.send_photo(chat_id, file_id, caption=f"Preview ID {meme_id}")
-            return
-        except Exception as e_photo:
-            logger.debug("Direct send_photo failed for preview id=%s: %s", meme_id, e_photo)
-            # try send_document quick fallback
-            try:
-                await context.bot.send_document(chat_id, file_id, caption=f"Preview ID {meme_id}")
-                return
-            except Exception as e_doc:
-                logger.debug("Direct send_document failed for preview id=%s: %s", meme_id, e_doc)
-        # If direct fails, download and reupload
-        file = await context.bot.get_file(file_id)
-        bio = io.BytesIO()
-        await file.download(out=bio)
-        bio.seek(0)
-        # pick send method based on mime
-        if mime and mime.startswith("video"):
-            await context.bot.send_video(chat_id, InputFile(bio, filename=f"meme_{meme_id}.mp4"), caption=f"Preview ID {meme_id}")
-        else:
-            # try as photo first, then document
-            try:
-                await context.bot.send_photo(chat_id, InputFile(bio, filename=f"meme_{meme_id}.jpg"), caption=f"Preview ID {meme_id}")
-            except Exception:
-                bio.seek(0)
-                await context.bot.send_document(chat_id, InputFile(bio, filename=f"meme_{meme_id}"), caption=f"Preview ID {meme_id}")
+        snapshot = await backups.run_once()
     except Exception as e:
-        logger.exception("Preview failed for id=%s: %s", meme_id, e)
-        await update.message.reply_text(f"Failed to preview meme {meme_id}: {type(e).__name__}: {e}")
-
-async def logcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
-        await update.message.reply_text("Only the owner can use this command.")
-        return
-    if not posting_log:
-        await update.message.reply_text("No posting events yet.")
+        logger.exception("Backup failed")
+        await update.message.reply_text(f"Backup failed: {type(e).__name__}: {e}")
         return
-    await update.message.reply_text("Last posting events:\n" + "\n".join(posting_log[-10:]))
+    name = os.path.basename(snapshot.path)
+    text = f"Snapshot saved: {name} ({_fmt_bytes(snapshot.size)}, {_fmt_seconds(snapshot.seconds)}). Keeping the last {backups.keep}."
+    if arg == "send":
+        if snapshot.size > BACKUP_SEND_LIMIT:
+            text += " Too big to send through Telegram; copy it from the backups directory."
+        else:
+            with open(snapshot.path, "rb") as fh:
+                await context.bot.send_document(update.effective_chat.id, InputFile(fh, filename=name), caption=text)
+            return
+    await update.message.reply_text(text)
 
-async def periodic_poster(application):
-    while True:
-        try:
-            await pop_due_memes_and_post(application)
-        except Exception:
-            logger.exception("Error in poster loop")
-        await asyncio.sleep(30)
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats: queue depth, posting lag, API/DB latency and fallbacks since start."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    await update.message.reply_text(await render_stats(channel_id))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Hi! I schedule memes to the configured channel.")
@@ -368,7 +2837,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def helpcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a detailed help message with all commands."""
     help_text = (
-        """
+        f"""
 <b>🤖 <u>Meme Wrangler Bot Command Reference</u> 🤖</b>
 
 <b>General:</b>
@@ -377,14 +2846,15 @@ async def helpcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 <b>Scheduling Memes:</b>
   <b>Send a photo/video/animation</b> (as a DM to the bot):
-    Schedules it for the next available slot (11:00, 16:00, 21:00 IST).
+    Schedules it for the next available slot ({slot_calendar.describe()}).
     Add a caption to include it with the post.
     <i>Example:</i> Send a meme to the bot in DM with or without caption.
 
-  <b>/scheduled</b> — List all scheduled memes with previews and their IDs, times, and types.
+  <b>/scheduled [page] [text]</b> — List scheduled memes with previews (10 per page, as albums) and their IDs, times, and types. Add <code>text</code> for a compact list.
+    <i>Example:</i> <code>/scheduled 2</code> or <code>/scheduled text</code>
 
-  <b>/unschedule &lt;id1&gt; [&lt;id2&gt; ...]</b> — Remove one or more memes from the schedule (by ID).
-    <i>Example:</i> <code>/unschedule 3 5 7</code>
+  <b>/unschedule &lt;selection&gt;</b> — Remove memes from the schedule. A selection is any mix of IDs, ranges and kinds (photos, videos, gifs), or <code>all</code>.
+    <i>Example:</i> <code>/unschedule 3 5 7</code> or <code>/unschedule 10-400 videos</code>
 
   <b>/postnow [id]</b> — Immediately post the next scheduled meme, or a specific meme by ID.
     <i>Example:</i> <code>/postnow</code> or <code>/postnow 6</code>
@@ -392,18 +2862,33 @@ async def helpcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
   <b>/preview &lt;id&gt;</b> — Preview a scheduled meme by its ID.
     <i>Example:</i> <code>/preview 4</code>
 
-  <b>/log</b> — Show the last 10 posting events (success/failure log).
+  <b>/export [pending|archived] [csv]</b> — Download the current channel's memes as a JSONL (default) or CSV file.
+  <b>/import</b> — Reply to an exported file with this to schedule its memes on the current channel (duplicates are skipped).
+  <b>/backup [list|send]</b> — Snapshot the database now (OWNER_ID only); <code>list</code> shows snapshots, <code>send</code> also sends the file. Restore with <code>python bot.py --restore &lt;file&gt;</code> while the bot is stopped.
+  <b>/stats</b> — Queue depth, posting lag, Bot API and database latency, and fallback counts since the bot started.
+
+  <b>/log [failed|dead|posted] [24h] [stats]</b> — Recent posting events (method, latency, errors), filtered by outcome and time window; <code>stats</code> shows totals and top errors.
+    <i>Example:</i> <code>/log failed 24h</code> or <code>/log stats 7d</code>
 
 <b>Advanced Scheduling:</b>
-  <b>/scheduleat id: &lt;id&gt; &lt;HH:MM&gt;</b> — Reschedule a single meme to a specific time (24h, IST).
+  <b>/scheduleat id: &lt;id&gt; &lt;HH:MM&gt;</b> — Reschedule a single meme to a specific time today (24h, {IST.key}).
     <i>Example:</i> <code>/scheduleat id: 6 16:20</code>
 
-  <b>/scheduleat ids: &lt;start&gt;-&lt;end&gt; &lt;YYYY-MM-DD&gt;</b> — Reschedule a range of memes to a date, assigning slots (11:00, 16:00, 21:00 IST) in order.
-    <i>Example:</i> <code>/scheduleat ids: 5-10 2025-10-19</code>
+  <b>/scheduleat ids: &lt;selection&gt; &lt;YYYY-MM-DD&gt;</b> — Reschedule the selected memes, in ID order, into the free slots from that date on (continuing onto later days).
+    <i>Example:</i> <code>/scheduleat ids: 5-10 2025-10-19</code> or <code>/scheduleat ids: 5-10 gifs 2025-10-19</code>
+
+<b>Channels:</b>
+  <b>/channels</b> — List the channels you can schedule to; new memes and all commands above apply to the one marked *.
+  <b>/channel &lt;number|@name&gt;</b> — Switch to another of your channels.
+    <i>Example:</i> <code>/channel 2</code>
+  <b>/addchannel &lt;@name|-100id&gt; [HH:MM,...] [timezone]</b> — Add a target channel (OWNER_ID only).
+    <i>Example:</i> <code>/addchannel @morememes 10:00,20:00 Europe/Berlin</code>
+  <b>/addowner &lt;user id&gt;</b> — Let another user schedule to the current channel.
+  <b>/setslots &lt;HH:MM,...&gt; [timezone]</b> — Posting times for the current channel (<code>default</code> reverts).
 
 <b>Notes:</b>
-• <b>Only the owner</b> (set by OWNER_ID) can use admin commands.
-• All times are in <b>IST (Asia/Kolkata)</b>.
+• <b>Only owners</b> can use admin commands: OWNER_ID on every channel, others on channels they were added to.
+• All times are in <b>{IST.key}</b> time.
 • Meme IDs are shown in <b>/scheduled</b> previews.
 • Use <b>/preview</b> to check a meme before posting.
 
@@ -412,41 +2897,44 @@ async def helpcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text, parse_mode="HTML", disable_web_page_preview=True)
 
+@timed(HANDLER_SECONDS, handler="handle_media")
 async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg: Message = update.message
-    user_id = msg.from_user.id
-    if user_id != OWNER_ID:
+    channel_id = channels.current(msg.from_user.id)
+    if channel_id is None:
         await msg.reply_text("Sorry, only the owner can send memes to schedule.")
         return
 
-    # Determine the best file id and mime
-    file_id = None
-    mime = None
+    # Determine the best file id, exact media kind and coarse mime
     caption = msg.caption  # Get caption if present
     
     if msg.photo:
         # highest resolution
-        file = msg.photo[-1]
-        file_id = file.file_id
+        media = msg.photo[-1]
+        kind = 'photo'
         mime = 'image'
     elif msg.video:
-        file_id = msg.video.file_id
+        media = msg.video
+        kind = 'video'
         mime = 'video'
     elif msg.animation:
-        file_id = msg.animation.file_id
+        media = msg.animation
+        kind = 'animation'
         mime = 'image'  # gifs treated as image
     else:
         await msg.reply_text("Please send a photo, animation (GIF) or video.")
         return
+    phash = None
+    if DUPLICATE_POLICY != "allow":
+        phash = await compute_phash(context.bot, msg)
 
-    scheduled_dt = await schedule_meme(file_id, mime, caption)
-    # scheduled_dt is already in IST timezone
-    await msg.reply_text(f"Scheduled for: {scheduled_dt.strftime('%Y-%m-%d %H:%M:%S IST')}")
+    # albums and bulk forwards are scheduled together with one summary reply
+    ingest_batcher.add(NewMeme(media.file_id, mime, caption, kind, media.file_unique_id, phash), msg, channel_id)
 
+@timed(HANDLER_SECONDS, handler="postnow")
 async def postnow(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
-        await update.message.reply_text("Only the owner can use this command.")
+    channel_id = await owner_channel(update)
+    if channel_id is None:
         return
 
     # If an ID is provided, post that meme; else, post the next scheduled meme
@@ -454,48 +2942,89 @@ async def postnow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.args and context.args[0].isdigit():
         meme_id = int(context.args[0])
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await init_db()
+    # claim the row first, so the poster (or a second /postnow) cannot send it too;
+    # no connection is held while posting
+    if meme_id is not None:
+        target, params = SQL_PENDING_BY_ID, (meme_id, channel_id)
+    else:
+        target, params = SQL_NEXT_PENDING, (channel_id,)
+    async with acquire_db() as db:
+        async with db.execute(
+            SQL_CLAIM_MEME.format(target), (int(datetime.now(IST).timestamp()) + POST_LEASE_SECONDS,) + params,
+        ) as cur:
+            row = await cur.fetchone()
+        await db.commit()
+    if not row:
         if meme_id is not None:
-            async with db.execute("SELECT id, owner_file_id, mime_type FROM memes WHERE posted=0 AND id=?", (meme_id,)) as cur:
-                row = await cur.fetchone()
-            if not row:
-                await update.message.reply_text(f"No scheduled meme with ID {meme_id} to post.")
-                return
+            await update.message.reply_text(f"No scheduled meme with ID {meme_id} to post.")
         else:
-            async with db.execute("SELECT id, owner_file_id, mime_type FROM memes WHERE posted=0 ORDER BY scheduled_ts ASC LIMIT 1") as cur:
-                row = await cur.fetchone()
-            if not row:
-                await update.message.reply_text("No scheduled memes to post.")
-                return
-        mid, file_id, mime = row
-        try:
-            if mime and mime.startswith("video"):
-                await context.bot.send_video(CHANNEL_ID, file_id)
-            else:
-                await context.bot.send_photo(CHANNEL_ID, file_id)
-            await db.execute("UPDATE memes SET posted=1 WHERE id=?", (mid,))
+            await update.message.reply_text("No scheduled memes to post.")
+        return
+    mid, file_id, mime, kind = row
+    started = monotonic()
+    try:
+        method = await post_meme(context.bot, channels.chat_id(channel_id), file_id, mime, mid=mid, kind=kind)
+    except Exception as e:
+        await release_claims([mid])
+        async with acquire_db() as db:
+            await db.execute(SQL_INSERT_POST_EVENT, PostEvent(
+                int(datetime.now(IST).timestamp()), channel_id, mid, "failed", kind,
+                int((monotonic() - started) * 1000), None, type(e).__name__, str(e),
+            ))
             await db.commit()
-            await update.message.reply_text(f"Posted meme with ID {mid} to channel.")
-        except Exception as e:
-            await update.message.reply_text(f"Failed to post meme: {e}")
+        await update.message.reply_text(f"Failed to post meme: {e}")
+        return
+    await record_post_results([(method, mid)], [], [PostEvent(
+        int(datetime.now(IST).timestamp()), channel_id, mid, "posted", method, int((monotonic() - started) * 1000),
+    )])
+    post_scheduler.invalidate()
+    await update.message.reply_text(f"Posted meme with ID {mid} to channel.")
+
+async def reschedule_selection(where: str, params, from_day: datetime, channel_id: int = DEFAULT_CHANNEL) -> list:
+    """Move the selected pending memes of a channel, in id order, into its first free slots from ``from_day`` on.
+
+    Two queries (selection, occupied slots), one pass over the calendar and one
+    executemany. Returns [(id, new_slot_dt), ...].
+    """
+    cal = channels.calendar(channel_id)
+    start = cal.aware(from_day)
+    async with _slot_lock, acquire_db() as db, timed(DB_SECONDS, query="reschedule"):
+        await db.execute("BEGIN IMMEDIATE")
+        async with db.execute(
+            f"SELECT id FROM memes WHERE posted=0 AND channel_id=? AND {where} ORDER BY id", [channel_id] + list(params)
+        ) as cur:
+            ids = [row[0] for row in await cur.fetchall()]
+        async with db.execute(
+            f"SELECT scheduled_ts FROM memes WHERE posted=0 AND channel_id=? AND scheduled_ts>=? AND NOT ({where})",
+            [channel_id, int(start.timestamp())] + list(params),
+        ) as cur:
+            occupied = {row[0] for row in await cur.fetchall()}
+        # "after" is exclusive, so start just before midnight
+        slots = cal.next_slots(start - timedelta(seconds=1), len(ids), occupied)
+        await db.executemany(
+            "UPDATE memes SET scheduled_ts=? WHERE id=? AND posted=0",
+            [(int(dt.timestamp()), mid) for mid, dt in zip(ids, slots)],
+        )
+        await db.commit()
+    if ids:
+        post_scheduler.invalidate()
+    return list(zip(ids, slots))
 
-import re
 
+@timed(HANDLER_SECONDS, handler="scheduleat")
 async def scheduleat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != OWNER_ID:
-        await update.message.reply_text("Only the owner can use this command.")
+    channel_id = await owner_channel(update)
+    if channel_id is None:
         return
     if not context.args or len(context.args) < 2:
-        await update.message.reply_text("Usage: /scheduleat id: <id> <HH:MM> or /scheduleat ids: <start>-<end> <YYYY-MM-DD>")
+        await update.message.reply_text("Usage: /scheduleat id: <id> <HH:MM> or /scheduleat ids: <selection> <YYYY-MM-DD>")
         return
 
     argstr = ' '.join(context.args)
     # Single ID mode: /scheduleat id: 6 16:20
     m_single = re.match(r'id:\s*(\d+)\s+(\d{2}):(\d{2})$', argstr)
-    # Range mode: /scheduleat ids: 5-10 2025-10-19
-    m_range = re.match(r'ids:\s*(\d+)-(\d+)\s+(\d{4}-\d{2}-\d{2})$', argstr)
+    # Range mode: /scheduleat ids: 5-10 2025-10-19 (any /unschedule-style selection works)
+    m_range = re.match(r'ids:\s*(.+?)\s+(\d{4}-\d{2}-\d{2})$', argstr)
 
     if m_single:
         meme_id = int(m_single.group(1))
@@ -505,77 +3034,631 @@ async def scheduleat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not (0 <= hour < 24 and 0 <= minute < 60):
             await update.message.reply_text("Invalid time format. Use 24h HH:MM.")
             return
-        # Schedule meme at specified time today (IST)
-        now_ist = datetime.now(IST)
-        sched_dt = IST.localize(datetime(now_ist.year, now_ist.month, now_ist.day, hour, minute))
+        # Schedule meme at specified time today, in the channel's timezone
+        cal = channels.calendar(channel_id)
+        sched_dt = cal.aware(datetime.combine(datetime.now(cal.tz).date(), time(hour, minute)))
         sched_ts = int(sched_dt.timestamp())
-        async with aiosqlite.connect(DB_PATH) as db:
-            await init_db()
-            await db.execute("UPDATE memes SET scheduled_ts=? WHERE id=? AND posted=0", (sched_ts, meme_id))
+        async with acquire_db() as db:
+            cur = await db.execute(
+                "UPDATE memes SET scheduled_ts=? WHERE id=? AND posted=0 AND channel_id=?", (sched_ts, meme_id, channel_id)
+            )
+            changed = cur.rowcount
             await db.commit()
-        await update.message.reply_text(f"Rescheduled meme ID {meme_id} for {sched_dt.strftime('%Y-%m-%d %H:%M')} IST.")
+        if not changed:
+            await update.message.reply_text(f"No scheduled meme with ID {meme_id}.")
+            return
+        post_scheduler.invalidate()
+        await update.message.reply_text(f"Rescheduled meme ID {meme_id} for {sched_dt.strftime('%Y-%m-%d %H:%M %Z')}.")
         return
 
     elif m_range:
-        start_id = int(m_range.group(1))
-        end_id = int(m_range.group(2))
-        date_str = m_range.group(3)
-        from datetime import time as dtime
-        base_date = IST.localize(datetime.strptime(date_str, '%Y-%m-%d'))
-        # Assign slots in order: 11:00, 16:00, 21:00, repeat
-        slot_times = [dtime(11,0), dtime(16,0), dtime(21,0)]
-        ids = list(range(start_id, end_id+1))
-        updates = []
-        for idx, meme_id in enumerate(ids):
-            slot = slot_times[idx % len(slot_times)]
-            sched_dt = base_date.replace(hour=slot.hour, minute=slot.minute, second=0, microsecond=0)
-            sched_ts = int(sched_dt.timestamp())
-            updates.append((sched_ts, meme_id))
-        async with aiosqlite.connect(DB_PATH) as db:
-            await init_db()
-            for sched_ts, meme_id in updates:
-                await db.execute("UPDATE memes SET scheduled_ts=? WHERE id=? AND posted=0", (sched_ts, meme_id))
-            await db.commit()
-        await update.message.reply_text(f"Rescheduled memes IDs {start_id}-{end_id} for {date_str} in slots 11:00, 16:00, 21:00 IST (cycled).")
+        date_str = m_range.group(2)
+        try:
+            where, params = parse_selection(m_range.group(1).split())
+            base_date = datetime.strptime(date_str, '%Y-%m-%d')
+        except ValueError as e:
+            await update.message.reply_text(f"Invalid selection or date: {e}")
+            return
+        moved = await reschedule_selection(where, params, base_date, channel_id)
+        if not moved:
+            await update.message.reply_text("No matching scheduled memes.")
+            return
+        await update.message.reply_text(
+            f"Rescheduled {len(moved)} meme(s) (IDs {format_ids(mid for mid, _ in moved)}) into free slots from "
+            f"{moved[0][1].strftime('%Y-%m-%d %H:%M')} to {moved[-1][1].strftime('%Y-%m-%d %H:%M %Z')}."
+        )
         return
 
     else:
-        await update.message.reply_text("Invalid format. Use /scheduleat id: <id> <HH:MM> or /scheduleat ids: <start>-<end> <YYYY-MM-DD>")
+        await update.message.reply_text("Invalid format. Use /scheduleat id: <id> <HH:MM> or /scheduleat ids: <selection> <YYYY-MM-DD>")
 
-def main():
-    if not BOT_TOKEN:
-        raise SystemExit("Please set TELEGRAM_BOT_TOKEN environment variable")
-    if not OWNER_ID or OWNER_ID == 0:
-        raise SystemExit("Please set OWNER_ID environment variable to your Telegram user id")
-    if not CHANNEL_ID:
-        raise SystemExit("Please set CHANNEL_ID to target channel (username or id)")
 
-    # Initialize DB first
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(init_db())
+def _parse_channel_schedule(args) -> tuple:
+    """``["11:00,18:30", "Europe/Berlin"]`` -> (normalised slot list or None, tz name or None). Raises ValueError."""
+    slots = tz = None
+    for arg in args:
+        if re.fullmatch(r"[\d:,]+", arg):
+            try:
+                parsed = _parse_slot_list(arg)
+            except (TypeError, ValueError):
+                raise ValueError(f"Bad slot list {arg!r}")
+            if not parsed:
+                raise ValueError("Empty slot list")
+            slots = ",".join(t.strftime("%H:%M") for t in parsed)
+        else:
+            try:
+                tz = ZoneInfo(arg).key
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone {arg!r}")
+    return slots, tz
+
+
+async def channelscmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/channels: the channels you can schedule to; the one marked * receives new memes."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    lines = []
+    for cid in channels.owned(update.effective_user.id):
+        mark = "*" if cid == channel_id else " "
+        lines.append(f"{mark} {channels.label(cid)} — {channels.calendar(cid).describe()}")
+    await update.message.reply_text("Your channels:\n" + "\n".join(lines) + "\nSwitch with /channel <number|@name>.")
+
+
+async def channelcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/channel <number|@name>: pick the channel your memes and commands apply to."""
+    user_id = update.effective_user.id
+    if await owner_channel(update) is None:
+        return
+    wanted = channels.resolve(context.args[0]) if context.args else None
+    if wanted is None or wanted not in channels.owned(user_id):
+        await update.message.reply_text("Usage: /channel <number|@name> (see /channels)")
+        return
+    channels.selected[user_id] = wanted
+    await update.message.reply_text(f"Now working on channel {channels.label(wanted)}.")
+
+
+async def addchannel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/addchannel <@name|-100id> [HH:MM,...] [timezone]: register another target channel (OWNER_ID only)."""
+    user_id = update.effective_user.id
+    if user_id != OWNER_ID:
+        await update.message.reply_text("Only the owner can use this command.")
+        return
+    if not context.args:
+        await update.message.reply_text("Usage: /addchannel <@name|-100id> [HH:MM,HH:MM,...] [timezone]")
+        return
+    try:
+        slots, tz = _parse_channel_schedule(context.args[1:])
+        channel_id = await add_channel(context.args[0], user_id, slots, tz)
+    except ValueError as e:
+        await update.message.reply_text(f"{e}.")
+        return
+    await update.message.reply_text(
+        f"Added channel {channels.label(channel_id)} ({channels.calendar(channel_id).describe()}). "
+        f"Make the bot an admin there, then /channel {channel_id} to start scheduling to it."
+    )
+
+
+async def addowner(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/addowner <user id>: let another Telegram user schedule to your current channel."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Usage: /addowner <telegram user id>")
+        return
+    await add_channel_owner(channel_id, int(context.args[0]))
+    await update.message.reply_text(f"User {context.args[0]} can now schedule to {channels.label(channel_id)}.")
+
+
+async def setslots(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/setslots <HH:MM,...> [timezone]: posting times for your current channel; /setslots default reverts."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    if not context.args:
+        await update.message.reply_text("Usage: /setslots <HH:MM,HH:MM,...> [timezone] or /setslots default")
+        return
+    if context.args[0].lower() == "default":
+        slots = tz = None
+    else:
+        try:
+            slots, tz = _parse_channel_schedule(context.args)
+        except ValueError as e:
+            await update.message.reply_text(f"{e}.")
+            return
+    await set_channel_slots(channel_id, slots, tz)
+    await update.message.reply_text(
+        f"Slots for {channels.label(channel_id)}: {channels.calendar(channel_id).describe()}. "
+        "Already scheduled memes keep their times; use /scheduleat ids: to move them."
+    )
+
+def file_format(name: Optional[str], default: str = "jsonl") -> str:
+    """"csv" for *.csv, "jsonl" for *.jsonl/*.json, else ``default``."""
+    ext = os.path.splitext(name or "")[1].lower().lstrip(".")
+    if ext == "csv":
+        return "csv"
+    if ext in ("jsonl", "json", "ndjson"):
+        return "jsonl"
+    return default
+
+
+async def iter_export_rows(what: str = "pending", channel_id: Optional[int] = None):
+    """Yield pending (in slot order) or archived (in id order) memes as dicts, IMPORT_CHUNK rows per query.
+
+    Pages are keyset-paginated and the pooled connection is returned between
+    them, so a long export never holds one away from the poster.
+    """
+    columns = ", ".join(EXPORT_FIELDS)
+    if what == "archived":
+        table, where, order, key = "memes_archive", "id>?", "id", (0,)
+    else:
+        table, where, order, key = "memes", "posted=0 AND (scheduled_ts, id)>(?, ?)", "scheduled_ts, id", (-1, 0)
+    if channel_id is not None:
+        where += " AND channel_id=?"
+    sql = f"SELECT {columns} FROM {table} WHERE {where} ORDER BY {order} LIMIT ?"
+    while True:
+        params = key + ((channel_id,) if channel_id is not None else ()) + (IMPORT_CHUNK,)
+        async with acquire_db() as db, timed(DB_SECONDS, query="export"):
+            async with db.execute(sql, params) as cur:
+                rows = await cur.fetchall()
+        for row in rows:
+            yield dict(zip(EXPORT_FIELDS, row))
+        if len(rows) < IMPORT_CHUNK:
+            return
+        last = dict(zip(EXPORT_FIELDS, rows[-1]))
+        key = (last["id"],) if what == "archived" else (last["scheduled_ts"], last["id"])
+
+
+async def export_memes(fh, fmt: str = "jsonl", what: str = "pending", channel_id: Optional[int] = None) -> int:
+    """Stream memes to the text file ``fh`` as JSON lines or CSV. Returns how many were written."""
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(fh, EXPORT_FIELDS)
+        writer.writeheader()
+    count = 0
+    async for row in iter_export_rows(what, channel_id):
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def read_import_records(fh, fmt: str = "jsonl"):
+    """Yield one dict per record of ``fh`` (None for a line that is not valid JSON), reading lazily."""
+    if fmt == "csv":
+        yield from csv.DictReader(fh)
+        return
+    for line in fh:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def meme_from_record(record) -> Optional[NewMeme]:
+    """A NewMeme for an exported row, or None if it is unusable. Empty CSV cells count as missing.
+
+    Rows without a file id are unusable, and so are rows whose file_unique_id
+    is not one Telegram could have issued (it names media cache files).
+    """
+    if not record:
+        return None
+
+    def field(name):
+        value = record.get(name)
+        return None if value in ("", None) else str(value)
+
+    file_id = field("owner_file_id")
+    if file_id is None:
+        return None
+    unique_id = field("file_unique_id")
+    if unique_id is not None and not FILE_UNIQUE_ID_RE.fullmatch(unique_id):
+        logger.error("Skipping imported record %s: invalid file_unique_id %r", file_id, unique_id)
+        return None
+    kind = field("media_kind")
+    mime = field("mime_type") or ("video" if kind == "video" else "image")
+    return NewMeme(file_id, mime, field("caption"), kind, unique_id, field("phash"))
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    duplicates: int
+    invalid: int
+    first: Optional[datetime]
+    last: Optional[datetime]
+
+
+async def import_memes(fh, fmt: str = "jsonl", channel_id: int = DEFAULT_CHANNEL,
+                       skip_duplicates: bool = True) -> ImportResult:
+    """Schedule every meme in ``fh`` on ``channel_id``, IMPORT_CHUNK at a time.
+
+    Each chunk is checked against the channel's memes (pending, posted and
+    archived) and against earlier rows of the file, then given consecutive
+    slots after the channel's last pending meme in one transaction, exactly
+    like a burst sent to the bot.
+    """
+    imported = duplicates = invalid = 0
+    first = last = None
+    seen = set()
+
+    async def flush(chunk):
+        nonlocal imported, duplicates, first, last
+        if skip_duplicates and chunk:
+            existing = await find_duplicates(chunk, channel_id)
+            keep = []
+            for meme in chunk:
+                keys = {k for k in (meme.file_unique_id, meme.phash) if k}
+                if keys & seen or any(k in existing for k in keys):
+                    duplicates += 1
+                    continue
+                seen.update(keys)
+                keep.append(meme)
+            chunk = keep
+        scheduled = await schedule_memes(chunk, channel_id)
+        if scheduled:
+            first = first or scheduled[0][1]
+            last = scheduled[-1][1]
+            imported += len(scheduled)
+
+    chunk = []
+    for record in read_import_records(fh, fmt):
+        meme = meme_from_record(record)
+        if meme is None:
+            invalid += 1
+            continue
+        chunk.append(meme)
+        if len(chunk) >= IMPORT_CHUNK:
+            await flush(chunk)
+            chunk = []
+    await flush(chunk)
+    return ImportResult(imported, duplicates, invalid, first, last)
+
+
+def describe_import(result: ImportResult) -> str:
+    text = f"Imported {result.imported} meme(s)"
+    if result.imported:
+        text += (
+            f", scheduled {result.first.strftime('%Y-%m-%d %H:%M')} to {result.last.strftime('%Y-%m-%d %H:%M %Z')}"
+        )
+    text += "."
+    if result.duplicates:
+        text += f" Skipped {result.duplicates} duplicate(s)."
+    if result.invalid:
+        text += f" Ignored {result.invalid} invalid row(s) (no file id or a bad file_unique_id)."
+    return text
+
+
+async def exportcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [pending|archived] [csv]: send the current channel's memes as a JSONL or CSV file."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    what, fmt = "pending", "jsonl"
+    for arg in (a.lower() for a in context.args or []):
+        if arg in ("pending", "archived"):
+            what = arg
+        elif arg in EXPORT_FORMATS:
+            fmt = arg
+        else:
+            await update.message.reply_text("Usage: /export [pending|archived] [csv]")
+            return
+    name = f"memes-{what}-{channel_id}.{fmt}"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, name)
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            count = await export_memes(fh, fmt, what, channel_id)
+        if not count:
+            await update.message.reply_text(f"No {what} memes to export.")
+            return
+        with open(path, "rb") as fh:
+            await context.bot.send_document(
+                update.effective_chat.id, InputFile(fh, filename=name), caption=f"{count} {what} meme(s)"
+            )
+
+
+async def importcmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/import, as a reply to a .jsonl or .csv export: schedule its memes on the current channel."""
+    channel_id = await owner_channel(update)
+    if channel_id is None:
+        return
+    replied = update.message.reply_to_message
+    document = getattr(replied, "document", None) if replied else None
+    if document is None:
+        await update.message.reply_text("Reply to a .jsonl or .csv file made by /export with /import.")
+        return
+    await update.message.reply_text(f"Importing {document.file_name or 'file'}...")
+    try:
+        file = await context.bot.get_file(document.file_id)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "import")
+            await file.download_to_drive(path)
+            with open(path, newline="", encoding="utf-8") as fh:
+                result = await import_memes(fh, file_format(document.file_name), channel_id)
+    except Exception as e:
+        logger.exception("Import failed")
+        await update.message.reply_text(f"Import failed: {type(e).__name__}: {e}")
+        return
+    await update.message.reply_text(describe_import(result))
+
+
+def build_webhook_app(application, secret: str, path: str = "/telegram") -> web.Application:
+    """aiohttp app that feeds Telegram webhook POSTs into ``application.update_queue``.
+
+    Also serves GET /healthz (process is up) and GET /readyz (DB open and the
+    bot is processing updates). Recorded Update JSON can be POSTed at ``path``
+    locally with the X-Telegram-Bot-Api-Secret-Token header to test handlers.
+    """
+
+    async def receive_update(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, secret):
+            return web.Response(status=403, text="forbidden")
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="invalid json")
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return web.Response(status=400, text="not an update")
+        await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def readyz(request: web.Request) -> web.Response:
+        if db_pool is None or not application.running:
+            return web.Response(status=503, text="starting")
+        return web.Response(text="ready")
+
+    from aiohttp import web
+
+    webapp = web.Application()
+    webapp.router.add_post(path, receive_update)
+    webapp.router.add_get("/healthz", healthz)
+    webapp.router.add_get("/readyz", readyz)
+    return webapp
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    from aiohttp import web
+
+    return web.Response(text=await metrics.render(), content_type="text/plain")
+
+
+async def start_metrics_server(port: int, host: Optional[str] = None) -> web.AppRunner:
+    """Serve GET /metrics on ``host`` (METRICS_LISTEN by default):``port``, never on the webhook listener."""
+    from aiohttp import web
+
+    webapp = web.Application()
+    webapp.router.add_get("/metrics", metrics_endpoint)
+    runner = web.AppRunner(webapp)
+    await runner.setup()
+    await web.TCPSite(runner, host or METRICS_LISTEN, port).start()
+    return runner
+
+
+async def run_webhook(application):
+    """Run the bot behind our own aiohttp server instead of long polling. Stops on SIGINT/SIGTERM."""
+    from aiohttp import web
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # pragma: no cover - Windows
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    runner = web.AppRunner(build_webhook_app(application, WEBHOOK_SECRET, WEBHOOK_PATH))
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        await application.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def startup_mark(label: str):
+    """Record a startup checkpoint for --profile-startup and the "ready" log line."""
+    _startup_marks.append((label, perf_counter()))
+
+
+def format_startup_profile(marks) -> str:
+    """One line per checkpoint: time since the previous one and since the process began importing."""
+    start = marks[0][1]
+    lines = ["Startup profile:"]
+    for (_, prev), (label, ts) in zip(marks, marks[1:]):
+        lines.append(f"{label:<32} {(ts - prev) * 1000:8.1f} ms {(ts - start) * 1000:9.1f} ms")
+    lazy = [name for name in ("aiohttp", "PIL") if name not in sys.modules]
+    if lazy:
+        lines.append("Not loaded (imported on first use): " + ", ".join(lazy))
+    return "\n".join(lines)
+
+
+async def profile_startup(path: Optional[str] = None) -> str:
+    """Run the same init as a real start (app, DB, migrations, scheduler heap) without talking to Telegram."""
+    build_application(BOT_TOKEN or "0:profile")
+    startup_mark("build application")
+    await open_db(path)
+    startup_mark("open db, migrate, load channels")
+    try:
+        async with acquire_db() as db:
+            now_ts = int(datetime.now(IST).timestamp())
+            async with db.execute(SQL_DUE_MEMES, (now_ts, now_ts)) as cur:
+                due = len(await cur.fetchall())
+        startup_mark(f"due query ({due} overdue)")
+        await post_scheduler.reload()
+        startup_mark(f"restore scheduler heap ({len(post_scheduler._heap)})")
+    finally:
+        await close_db()
+    return format_startup_profile(_startup_marks)
+
+
+async def _run_cli(args) -> int:
+    await open_db()
+    try:
+        if args.command == "export":
+            fmt = args.format or file_format(args.output)
+            if args.output == "-":
+                count = await export_memes(sys.stdout, fmt, args.what, args.channel)
+            else:
+                with open(args.output, "w", newline="", encoding="utf-8") as fh:
+                    count = await export_memes(fh, fmt, args.what, args.channel)
+            print(f"Exported {count} {args.what} meme(s)", file=sys.stderr)
+            return 0
+        if args.channel not in channels.channels:
+            print(f"Unknown channel {args.channel}; see /channels", file=sys.stderr)
+            return 1
+        fmt = args.format or file_format(args.input)
+        if args.input == "-":
+            result = await import_memes(sys.stdin, fmt, args.channel, not args.allow_duplicates)
+        else:
+            with open(args.input, newline="", encoding="utf-8") as fh:
+                result = await import_memes(fh, fmt, args.channel, not args.allow_duplicates)
+        print(describe_import(result), file=sys.stderr)
+        return 0
+    finally:
+        await close_db()
+
+
+def cli(argv=None) -> int:
+    """`python bot.py export|import ...`: move memes in or out of MEMEBOT_DB without starting the bot."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="bot.py", description="Bulk export/import of the meme queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write pending or archived memes as JSONL or CSV")
+    exp.add_argument("what", nargs="?", choices=("pending", "archived"), default="pending")
+    exp.add_argument("-o", "--output", default="-", help="file to write (default: stdout)")
+    exp.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the file name, else jsonl")
+    exp.add_argument("--channel", type=int, help="only this channel id (default: all)")
+    imp = sub.add_parser("import", help="schedule the memes in a JSONL or CSV export")
+    imp.add_argument("input", help="file to read, or - for stdin")
+    imp.add_argument("--format", choices=EXPORT_FORMATS, help="default: from the file name, else jsonl")
+    imp.add_argument("--channel", type=int, default=DEFAULT_CHANNEL, help="channel id to schedule on (default: 1)")
+    imp.add_argument("--allow-duplicates", action="store_true", help="import memes the channel already has")
+    return asyncio.run(_run_cli(parser.parse_args(argv)))
+
+
+def build_application(token: str):
+    app = ApplicationBuilder().token(token).concurrent_updates(CONCURRENT_UPDATES).build()
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-    
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('help', helpcmd))
     app.add_handler(CommandHandler('postnow', postnow))
     app.add_handler(CommandHandler('scheduled', scheduled))
+    app.add_handler(CallbackQueryHandler(scheduled_page_button, pattern=r'^scheduled:'))
     app.add_handler(CommandHandler('unschedule', unschedule))
     app.add_handler(CommandHandler('preview', preview))
     app.add_handler(CommandHandler('log', logcmd))
     app.add_handler(CommandHandler('scheduleat', scheduleat))
+    app.add_handler(CommandHandler('channels', channelscmd))
+    app.add_handler(CommandHandler('channel', channelcmd))
+    app.add_handler(CommandHandler('addchannel', addchannel))
+    app.add_handler(CommandHandler('addowner', addowner))
+    app.add_handler(CommandHandler('setslots', setslots))
+    app.add_handler(CommandHandler('stats', stats))
+    app.add_handler(CommandHandler('backup', backup))
+    app.add_handler(CommandHandler('export', exportcmd))
+    app.add_handler(CommandHandler('import', importcmd))
     media_filter = filters.ChatType.PRIVATE & (filters.PHOTO | filters.VIDEO | filters.ANIMATION)
     app.add_handler(MessageHandler(media_filter, handle_media))
+    return app
+
+
+def main():
+    if sys.argv[1:2] in (["export"], ["import"]):
+        raise SystemExit(cli(sys.argv[1:]))
+    if "--profile-startup" in sys.argv[1:] or os.environ.get("MEMEBOT_PROFILE_STARTUP"):
+        print(asyncio.run(profile_startup()))
+        return
+    if "--restore" in sys.argv[1:]:
+        args = sys.argv[sys.argv.index("--restore") + 1:]
+        if not args:
+            raise SystemExit("Usage: python bot.py --restore <snapshot>")
+        saved = restore_snapshot(args[0])
+        print(f"Restored {DB_PATH} from {args[0]}" + (f"; the previous database is at {saved}" if saved else ""))
+        return
+    if CATCHUP_POLICY not in CATCHUP_POLICIES:
+        raise SystemExit(f"MEMEBOT_CATCHUP must be one of: {', '.join(CATCHUP_POLICIES)}")
+    if DUPLICATE_POLICY not in DUPLICATE_POLICIES:
+        raise SystemExit(f"MEMEBOT_DUPLICATE_POLICY must be one of: {', '.join(DUPLICATE_POLICIES)}")
+    if not BOT_TOKEN:
+        raise SystemExit("Please set TELEGRAM_BOT_TOKEN environment variable")
+    if not OWNER_ID or OWNER_ID == 0:
+        raise SystemExit("Please set OWNER_ID environment variable to your Telegram user id")
+    if not CHANNEL_ID:
+        raise SystemExit("Please set CHANNEL_ID to target channel (username or id)")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    app = build_application(BOT_TOKEN)
+
+    # open the shared DB pool (schema checks run here, once) and start the
+    # background poster using post_init hook
+    metrics_runner = None
 
-    # run background poster using post_init hook
     async def post_init(application):
-        asyncio.create_task(periodic_poster(application))
-    
+        nonlocal metrics_runner
+        await open_db()
+        asyncio.create_task(post_scheduler.run(application))
+        asyncio.create_task(maintenance.run())
+        asyncio.create_task(backups.run())
+        previews.start(application.bot)
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(METRICS_PORT)
+        startup_mark("ready")
+        logger.info("Ready %.0f ms after import began", (_startup_marks[-1][1] - _startup_marks[0][1]) * 1000)
+
+    async def post_stop(application):
+        # the bot can still reply here; post_shutdown runs after it is shut down
+        await ingest_batcher.close()
+
+    async def post_shutdown(application):
+        await previews.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_db()
+
     app.post_init = post_init
+    app.post_stop = post_stop
+    app.post_shutdown = post_shutdown
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise SystemExit("Webhook mode needs MEMEBOT_WEBHOOK_URL and MEMEBOT_WEBHOOK_SECRET")
+        logger.info("Starting bot in webhook mode on %s:%s%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        loop.run_until_complete(run_webhook(app))
+        return
 
     logger.info("Starting bot...")
     app.run_polling()
 
+
+startup_mark("module body")
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class FakeMessage:
+    """A command/upload message from user_id (the owner by default) that records replies."""
+
+    def __init__(self, user_id=None, chat_id=None, reply_to_message=None):
+        self.from_user = SimpleNamespace(id=bot.OWNER_ID if user_id is None else user_id)
+        self.chat_id = self.from_user.id if chat_id is None else chat_id
+        self.reply_to_message = reply_to_message
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def fake_update(msg):
+    return SimpleNamespace(message=msg, effective_user=msg.from_user)
+
+
+class FlakyBot:
+    """Fails the first ``failures`` API calls with copies of ``error``."""
+
+    def __init__(self, error=None, failures=0):
+        self.error = error
+        self.failures = failures
+        self.calls = []
+
+    async def _send(self, method, chat_id, file_id, caption=None):
+        self.calls.append((method, file_id))
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        await self._send("photo", chat_id, file_id, caption)
+
+    async def send_video(self, chat_id, file_id, caption=None):
+        await self._send("video", chat_id, file_id, caption)
+
+    async def send_animation(self, chat_id, file_id, caption=None):
+        await self._send("animation", chat_id, file_id, caption)
+
+    async def send_document(self, chat_id, file_id, caption=None):
+        await self._send("document", chat_id, file_id, caption)
+
+
+async def insert_due(*file_ids, **columns):
+    """Insert already-due photo memes, oldest first; extra columns apply to every row."""
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    names = "".join(", " + name for name in columns)
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            f"INSERT INTO memes (owner_file_id, mime_type, media_kind, scheduled_ts, created_ts{names})"
+            " VALUES (?, 'image', 'photo', ?, ?" + ", ?" * len(columns) + ")",
+            [(f, now_ts - 10 + i, now_ts, *columns.values()) for i, f in enumerate(file_ids)],
+        )
+        await db.commit()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """A fresh, fully migrated database in tmp_path, opened as the bot's shared pool."""
+    pool = run(bot.open_db(str(tmp_path / "memes.db"), size=2))
+    yield pool
+    run(bot.close_db())
+
+
+@pytest.fixture
+def unthrottled(monkeypatch):
+    """Opt-in: a rate limiter that never makes a test wait. Use with pytest.mark.usefixtures."""
+    monkeypatch.setattr(bot, "rate_limiter", bot.PostRateLimiter(1000, 60000, 100, 1000))
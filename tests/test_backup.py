@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sqlite3
+from time import perf_counter
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeMessage, run
+
+
+@pytest.fixture(autouse=True)
+def backup_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "OWNER_ID", 100)
+    monkeypatch.setattr(bot, "backups", bot.BackupJob(0, str(tmp_path / "backups"), 2))
+
+
+async def _insert(n, prefix="f"):
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES (?, 'image', ?, 0)",
+            [(f"{prefix}{i}", i) for i in range(n)],
+        )
+        await db.commit()
+
+
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM memes").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_does_not_stall_the_event_loop_or_writers(pool, monkeypatch):
+    monkeypatch.setattr(bot, "BACKUP_PAGES_PER_STEP", 10)
+    run(_insert(20000))
+
+    async def scenario():
+        gaps, writes = [], 0
+        done = False
+
+        async def heartbeat():
+            last = perf_counter()
+            while not done:
+                await asyncio.sleep(0.001)
+                now = perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        async def writer():
+            nonlocal writes
+            while not done:
+                await _insert(1, "w")
+                writes += 1
+                await asyncio.sleep(0.005)
+
+        tasks = [asyncio.ensure_future(heartbeat()), asyncio.ensure_future(writer())]
+        snapshot = await bot.backups.run_once()
+        done = True
+        await asyncio.gather(*tasks)
+        return snapshot, max(gaps), writes
+
+    snapshot, worst_gap, writes = run(scenario())
+    assert worst_gap < 0.25
+    assert writes > 0
+    assert _count(snapshot.path) >= 20000
+    assert not os.path.exists(snapshot.path + ".part")
+
+
+def test_old_snapshots_are_pruned(pool):
+    run(_insert(10))
+    paths = [run(bot.backups.run_once()).path for _ in range(3)]
+    assert [p for p, _, _ in bot.list_snapshots(bot.backups.directory)] == paths[:0:-1]
+
+
+def test_restore_replaces_the_database_and_keeps_the_old_one(pool, tmp_path):
+    run(_insert(5))
+    snapshot = run(bot.backups.run_once())
+    run(_insert(7, "late"))
+    run(bot.close_db())
+
+    db_path = str(tmp_path / "memes.db")
+    saved = bot.restore_snapshot(snapshot.path, db_path)
+    assert _count(saved) == 12
+    run(bot.open_db(db_path))
+    assert _count(db_path) == 5
+
+
+def test_restore_refuses_a_newer_schema(tmp_path):
+    newer = str(tmp_path / "newer.db")
+    conn = sqlite3.connect(newer)
+    conn.execute(f"PRAGMA user_version={bot.SCHEMA_VERSION + 1}")
+    conn.close()
+    with pytest.raises(ValueError):
+        bot.restore_snapshot(newer, str(tmp_path / "memes.db"))
+
+
+def test_backup_command_is_owner_only(pool):
+    for user_id in (100, 200):
+        msg = FakeMessage(user_id)
+        update = SimpleNamespace(message=msg, effective_user=msg.from_user, effective_chat=SimpleNamespace(id=user_id))
+        run(bot.backup(update, SimpleNamespace(args=[], bot=None)))
+        if user_id == 100:
+            assert msg.replies[0].startswith("Snapshot saved: memes-")
+        else:
+            assert msg.replies == ["Only the owner can use this command."]
+    assert "Last backup:" in run(bot.render_stats(bot.DEFAULT_CHANNEL))
@@ -0,0 +1,54 @@
+import importlib.util
+import json
+import os
+
+import pytest
+from telegram import Bot
+from telegram.error import RetryAfter
+
+import bot
+from conftest import run
+
+BENCH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "bench.py")
+spec = importlib.util.spec_from_file_location("bench", BENCH_PATH)
+bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench)
+
+
+def test_fake_api_injects_retry_after():
+    api = bench.FakeBotAPI(flood_rate=1.0, retry_after=7)
+
+    async def scenario():
+        base_url = await api.start()
+        api_bot = Bot(bench.TOKEN, base_url=base_url)
+        try:
+            with pytest.raises(RetryAfter) as excinfo:
+                await api_bot.send_photo(-1001, "file")
+            return excinfo.value
+        finally:
+            await api_bot.shutdown()
+            await api.stop()
+
+    assert run(scenario()).retry_after == 7
+
+
+def test_small_run_reports_every_op_and_checks_baseline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(bot, "rate_limiter", bot.rate_limiter)
+    out = tmp_path / "baseline.json"
+    argv = ["--rows", "2000", "--backlog", "20", "--iterations", "5", "--latency", "0", "--save", str(out)]
+    assert bench.main(argv) == 0
+    saved = json.loads(out.read_text())
+    assert [r["op"] for r in saved["results"]] == ["ingest", "scheduled_text", "scheduled_media", "drain"]
+    assert all(r["throughput"] > 0 for r in saved["results"])
+
+
+def test_find_regressions_flags_slower_ops():
+    baseline = {"results": [{"op": "drain", "throughput": 40.0, "p99_ms": 10.0}]}
+    assert bench.find_regressions([{"op": "drain", "throughput": 38.0, "p99_ms": 10.5}], baseline, 0.3) == []
+    problems = bench.find_regressions([{"op": "drain", "throughput": 20.0, "p99_ms": 30.0}], baseline, 0.3)
+    assert len(problems) == 2
+
+
+def test_find_regressions_ignores_sub_millisecond_jitter():
+    baseline = {"results": [{"op": "scheduled_text", "throughput": 1800.0, "p99_ms": 0.9}]}
+    assert bench.find_regressions([{"op": "scheduled_text", "throughput": 1000.0, "p99_ms": 1.8}], baseline, 0.3) == []
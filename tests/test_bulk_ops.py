@@ -0,0 +1,53 @@
+import pytest
+
+import bot
+from conftest import run
+
+
+async def _seed():
+    # ids 1-10; odd ids are videos, id 2 is already posted, id 4 is a legacy row
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, media_kind, scheduled_ts, posted, created_ts) VALUES (?, ?, ?, ?, ?, 0)",
+            [
+                (f"f{i}", "video" if i % 2 else "image", None if i == 4 else ("video" if i % 2 else "photo"),
+                 2_000_000_000 + i, 1 if i == 2 else 0)
+                for i in range(1, 11)
+            ],
+        )
+        await db.commit()
+
+
+async def _remaining():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT id FROM memes ORDER BY id") as cur:
+            return [r[0] for r in await cur.fetchall()]
+
+
+def test_parse_selection():
+    where, params = bot.parse_selection(["3", "5,7", "10-8", "Videos"])
+    assert where == f"(id IN (?,?,?) OR id BETWEEN ? AND ?) AND {bot.KIND_EXPR} IN (?)"
+    assert params == [3, 5, 7, 8, 10, "video"]
+    assert bot.parse_selection(["all"]) == ("1", [])
+    with pytest.raises(ValueError):
+        bot.parse_selection([])
+    with pytest.raises(ValueError):
+        bot.parse_selection(["3", "bananas"])
+
+
+def test_unschedule_range_reports_exact_ids(pool):
+    run(_seed())
+    deleted = run(bot.unschedule_selection(*bot.parse_selection(["1-4", "99"])))
+    assert sorted(deleted) == [1, 3, 4]  # 2 was posted, 99 never existed
+    assert run(_remaining()) == [2, 5, 6, 7, 8, 9, 10]
+
+
+def test_unschedule_by_kind(pool):
+    run(_seed())
+    deleted = run(bot.unschedule_selection(*bot.parse_selection(["photos"])))
+    assert sorted(deleted) == [4, 6, 8, 10]  # legacy 'image' row 4 counts as a photo
+
+
+def test_format_ids():
+    assert bot.format_ids([8, 1, 2, 3, 5]) == "1-3, 5, 8"
+    assert bot.format_ids(range(0, 20, 2), limit=2) == "0, 2, ... (8 more)"
@@ -0,0 +1,66 @@
+from datetime import date, datetime, time
+
+import pytest
+
+import bot
+from conftest import run
+
+
+def test_next_slots_span_days_and_skip_occupied():
+    cal = bot.SlotCalendar()
+    start = datetime(2025, 10, 18, 12, 0)  # a Saturday, after the first slot
+    taken = int(datetime(2025, 10, 19, 11, 0, tzinfo=bot.IST).timestamp())
+    slots = cal.next_slots(start, 4, occupied={taken})
+    assert [(s.day, s.hour) for s in slots] == [(18, 16), (18, 21), (19, 16), (19, 21)]
+
+
+def test_weekday_rules_and_blackouts():
+    cal = bot.SlotCalendar(
+        weekday_slots={5: [time(12, 0)], 6: []},  # Saturday: noon only, Sunday: off
+        blackout_dates={date(2025, 10, 20)},
+    )
+    slots = cal.next_slots(datetime(2025, 10, 18, 0, 0), 3)
+    assert [(s.day, s.hour) for s in slots] == [(18, 12), (21, 11), (21, 16)]
+
+
+def test_from_env():
+    cal = bot.SlotCalendar.from_env({
+        "MEMEBOT_SLOTS": "09:30, 18:00",
+        "MEMEBOT_SLOTS_SUN": "",
+        "MEMEBOT_BLACKOUT": "2025-12-25",
+    })
+    assert cal.weekday_slots[0] == [time(9, 30), time(18, 0)]
+    assert cal.weekday_slots[6] == []
+    assert cal.blackout_dates == {date(2025, 12, 25)}
+
+
+def test_calendar_without_slots_is_rejected():
+    with pytest.raises(ValueError):
+        bot.SlotCalendar(weekday_slots={d: [] for d in range(7)})
+
+
+def test_reschedule_selection_uses_consecutive_free_slots(pool):
+    async def scenario():
+        async with bot.acquire_db() as db:
+            await db.executemany(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES (?, 'image', ?, 0)",
+                [(f"f{i}", 2_000_000_000 + i) for i in range(8)],
+            )
+            # meme 8 already holds the second slot of the target day
+            busy = int(datetime(2025, 10, 19, 16, 0, tzinfo=bot.IST).timestamp())
+            await db.execute("UPDATE memes SET scheduled_ts=? WHERE id=8", (busy,))
+            await db.commit()
+        where, params = bot.parse_selection(["1-7"])
+        moved = await bot.reschedule_selection(where, params, datetime(2025, 10, 19))
+        slots = [dt for _, dt in moved]
+        async with bot.acquire_db() as db:
+            async with db.execute("SELECT scheduled_ts FROM memes ORDER BY id") as cur:
+                stored = [r[0] for r in await cur.fetchall()]
+        return slots, stored, busy
+
+    slots, stored, busy = run(scenario())
+    assert [(s.day, s.hour) for s in slots] == [
+        (19, 11), (19, 21), (20, 11), (20, 16), (20, 21), (21, 11), (21, 16),
+    ]
+    assert len(set(stored)) == 8
+    assert stored[7] == busy
@@ -0,0 +1,122 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+        self.messages = []
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        self.sent.append(file_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append((chat_id, text, list(self.sent)))
+
+
+@pytest.fixture(autouse=True)
+def catch_up_settings(monkeypatch):
+    monkeypatch.setattr(bot, "OWNER_ID", 100)
+    monkeypatch.setattr(bot, "CATCHUP_BURST", 1)
+
+
+def _slot_ts(n):
+    """Timestamp of the n-th default slot from now (0 = next)."""
+    return int(bot.slot_calendar.next_slots(None, n + 1)[n].timestamp())
+
+
+async def _seed(missed, upcoming):
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    rows = [(f"m{i}", now_ts - 86400 * (missed - i)) for i in range(missed)]
+    rows += [(f"u{i}", ts) for i, ts in enumerate(upcoming)]
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, media_kind, scheduled_ts, created_ts)"
+            " VALUES (?, 'image', 'photo', ?, 0)",
+            rows,
+        )
+        await db.commit()
+
+
+async def _schedule():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT owner_file_id, scheduled_ts FROM memes WHERE posted=0 ORDER BY scheduled_ts") as cur:
+            return await cur.fetchall()
+
+
+def _drain(policy, monkeypatch):
+    monkeypatch.setattr(bot, "CATCHUP_POLICY", policy)
+    fake = RecordingBot()
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    return fake
+
+
+def test_spread_posts_one_and_fills_free_slots(pool, monkeypatch):
+    run(_seed(4, [_slot_ts(1)]))
+    fake = _drain("spread", monkeypatch)
+    assert fake.sent == ["m0"]
+    (owner, report, sent_before), = fake.messages
+    assert owner == 100 and sent_before == []
+    assert "(spread): 4 meme(s) missed their slot" in report and "Moving 3 meme(s):" in report
+    assert run(_schedule()) == [
+        ("m1", _slot_ts(0)), ("u0", _slot_ts(1)), ("m2", _slot_ts(2)), ("m3", _slot_ts(3)),
+    ]
+
+
+def test_shift_pushes_the_queue_until_a_gap(pool, monkeypatch):
+    run(_seed(3, [_slot_ts(0), _slot_ts(1), _slot_ts(5)]))
+    fake = _drain("shift", monkeypatch)
+    assert fake.sent == ["m0"]
+    assert run(_schedule()) == [
+        ("m1", _slot_ts(0)), ("m2", _slot_ts(1)), ("u0", _slot_ts(2)), ("u1", _slot_ts(3)), ("u2", _slot_ts(5)),
+    ]
+
+
+def test_now_posts_everything_and_small_backlogs_are_left_alone(pool, monkeypatch):
+    run(_seed(3, []))
+    fake = _drain("now", monkeypatch)
+    assert fake.sent == ["m0", "m1", "m2"] and fake.messages == []
+
+    run(_seed(1, []))
+    fake = _drain("spread", monkeypatch)
+    assert fake.sent == ["m0"] and fake.messages == []
+
+
+def test_plan_moves_use_one_batched_update(pool, monkeypatch):
+    monkeypatch.setattr(bot, "CATCHUP_UPDATE_CHUNK", 2)
+    run(_seed(6, []))
+    statements = []
+
+    async def scenario():
+        async with bot.acquire_db() as db:
+            await db.set_trace_callback(statements.append)
+            missed = [(i, ts) for i, (_, ts) in enumerate(await _schedule(), start=1)]
+            plan = bot.plan_catch_up(bot.DEFAULT_CHANNEL, missed, [], "spread")
+            await bot.apply_catch_up(db, plan)
+            await db.set_trace_callback(None)
+        return plan
+
+    plan = run(scenario())
+    assert len(plan.moves) == 5
+    assert sum(s.lstrip().upper().startswith("WITH MOVED") for s in statements) == 3
+    assert [ts for _, ts in run(_schedule())][1:] == [_slot_ts(n) for n in range(5)]
+
+
+def test_owners_are_notified_outside_the_slot_lock(pool, monkeypatch):
+    run(_seed(4, []))
+    locked = []
+
+    class LockCheckingBot(RecordingBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            locked.append(bot._slot_lock.locked())
+
+    monkeypatch.setattr(bot, "CATCHUP_POLICY", "spread")
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=LockCheckingBot())))
+    assert locked == [False]
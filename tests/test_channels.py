@@ -0,0 +1,117 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeMessage, run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        self.sent.append((chat_id, file_id))
+
+
+def _call(handler, user_id, *args):
+    msg = FakeMessage(user_id)
+    update = SimpleNamespace(message=msg, effective_user=msg.from_user)
+    run(handler(update, SimpleNamespace(args=list(args), bot=None)))
+    return msg.replies
+
+
+@pytest.fixture(autouse=True)
+def owner_channels(monkeypatch):
+    monkeypatch.setattr(bot, "OWNER_ID", 100)
+    monkeypatch.setattr(bot, "CHANNEL_ID", "@main")
+    monkeypatch.setattr(bot, "channels", bot.ChannelRegistry())
+
+
+async def _pending(channel_id):
+    async with bot.acquire_db() as db:
+        async with db.execute(
+            "SELECT owner_file_id FROM memes WHERE posted=0 AND channel_id=? ORDER BY scheduled_ts", (channel_id,)
+        ) as cur:
+            return [row[0] for row in await cur.fetchall()]
+
+
+def test_default_channel_comes_from_env(pool):
+    assert bot.channels.chat_id(bot.DEFAULT_CHANNEL) == "@main"
+    assert bot.channels.owned(100) == [bot.DEFAULT_CHANNEL]
+    assert bot.channels.owned(200) == []
+
+
+def test_channel_owners_only_see_their_channels(pool):
+    second = run(bot.add_channel("@second", 200))
+    assert bot.channels.owned(200) == [second]
+    assert bot.channels.owned(100) == [bot.DEFAULT_CHANNEL, second]
+    assert bot.channels.current(200) == second
+    with pytest.raises(ValueError):
+        run(bot.add_channel("@second", 200))
+
+
+def test_each_channel_has_its_own_queue_and_slots(pool):
+    second = run(bot.add_channel("@second", 200, "09:30", "UTC"))
+    (_, main_dt), = run(bot.schedule_memes([bot.NewMeme("a", "image")]))
+    (_, second_dt), = run(bot.schedule_memes([bot.NewMeme("b", "image")], second))
+    (_, second_dt2), = run(bot.schedule_memes([bot.NewMeme("c", "image")], second))
+    assert main_dt.time() in bot.SLOTS
+    assert (second_dt.hour, second_dt.minute, second_dt.tzinfo.key) == (9, 30, "UTC")
+    assert (second_dt2 - second_dt).days == 1
+    assert run(_pending(bot.DEFAULT_CHANNEL)) == ["a"]
+    assert run(_pending(second)) == ["b", "c"]
+
+
+def test_listings_and_duplicate_notes_use_the_channel_timezone(pool):
+    second = run(bot.add_channel("@second", 200, "09:30", "UTC"))
+    run(bot.schedule_memes([bot.NewMeme("a", "image", file_unique_id="u1")], second))
+    text, _ = run(bot.render_scheduled_page(None, 200, page=1, compact=True, channel_id=second))
+    assert " 09:30 · " in text
+    reply = run(bot.ingest_memes([bot.NewMeme("again", "image", file_unique_id="u1")], second))
+    assert "09:30 UTC" in reply
+    assert "00:00:00 UTC" in bot._scheduled_caption(1, 0, "image", None, bot.ZoneInfo("UTC"))
+
+
+def test_due_memes_go_to_their_own_channel(pool):
+    second = run(bot.add_channel("@second", 200))
+    now_ts = int(datetime.now(bot.IST).timestamp())
+
+    async def seed():
+        async with bot.acquire_db() as db:
+            await db.executemany(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts, channel_id)"
+                " VALUES (?, 'image', ?, ?, ?)",
+                [("m1", now_ts - 5, now_ts, 1), ("s1", now_ts - 4, now_ts, second), ("m2", now_ts - 3, now_ts, 1)],
+            )
+            await db.commit()
+
+    run(seed())
+    fake = RecordingBot()
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    assert sorted(fake.sent) == [("@main", "m1"), ("@main", "m2"), ("@second", "s1")]
+    assert [f for chat, f in fake.sent if chat == "@main"] == ["m1", "m2"]
+
+
+def test_commands_are_scoped_to_the_current_channel(pool):
+    second = run(bot.add_channel("@second", 100))
+    run(bot.schedule_memes([bot.NewMeme("a", "image")]))
+    run(bot.schedule_memes([bot.NewMeme("b", "image")], second))
+
+    assert _call(bot.channelcmd, 100, "@second") == ["Now working on channel 2: @second."]
+    assert _call(bot.unschedule, 100, "all") == ["Unscheduled 1 meme(s): IDs 2."]
+    assert run(_pending(bot.DEFAULT_CHANNEL)) == ["a"]
+    assert _call(bot.unschedule, 300, "all") == ["Only the owner can use this command."]
+
+
+def test_addowner_and_setslots(pool):
+    second = run(bot.add_channel("@second", 200))
+    _call(bot.addowner, 200, "300")
+    assert bot.channels.owned(300) == [second]
+    _call(bot.setslots, 300, "08:00,20:00")
+    assert bot.channels.calendar(second).weekday_slots[0] == [bot.time(8, 0), bot.time(20, 0)]
+    assert bot.channels.calendar(bot.DEFAULT_CHANNEL) is bot.slot_calendar
+    assert _call(bot.addchannel, 200, "@third") == ["Only the owner can use this command."]
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeMessage, fake_update, insert_due, run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class SlowBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        await asyncio.sleep(0.05)
+        self.sent.append(file_id)
+
+
+async def _states():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT owner_file_id, posted, lease_until FROM memes ORDER BY id") as cur:
+            return await cur.fetchall()
+
+
+def test_poster_and_postnow_never_send_the_same_meme_twice(pool):
+    run(insert_due("only"))
+    fake = SlowBot()
+    msg = FakeMessage()
+    update = fake_update(msg)
+
+    async def race():
+        await asyncio.gather(
+            bot.postnow(update, SimpleNamespace(args=[], bot=fake)),
+            bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)),
+        )
+
+    run(race())
+    assert fake.sent == ["only"]
+    assert run(_states()) == [("only", 1, None)]
+
+
+def test_claimed_rows_are_skipped_until_the_lease_expires(pool):
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    run(insert_due("held", posted=bot.POSTING, lease_until=now_ts + 60))
+    run(insert_due("stale", posted=bot.POSTING, lease_until=now_ts - 1))
+    fake = SlowBot()
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    assert fake.sent == ["stale"]
+    assert run(_states()) == [("held", bot.POSTING, now_ts + 60), ("stale", 1, None)]
+
+
+def test_failed_postnow_releases_its_claim(pool):
+    run(insert_due("broken"))
+
+    class FailingBot:
+        async def send_photo(self, chat_id, file_id, caption=None):
+            raise RuntimeError("network down")
+
+        send_document = send_photo
+
+    msg = FakeMessage()
+    run(bot.postnow(fake_update(msg), SimpleNamespace(args=["1"], bot=FailingBot())))
+    assert msg.replies == ["Failed to post meme: network down"]
+    assert run(_states()) == [("broken", 0, None)]
+
+
+def test_concurrent_imports_from_two_processes_get_distinct_slots(tmp_path):
+    env = dict(os.environ, MEMEBOT_DB=str(tmp_path / "shared.db"))
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+    subprocess.run([sys.executable, script, "export", "-o", os.devnull], env=env, check=True, capture_output=True)
+    files = []
+    for name in ("a", "b"):
+        path = tmp_path / f"{name}.csv"
+        path.write_text("owner_file_id\n" + "".join(f"{name}{i}\n" for i in range(300)), encoding="utf-8")
+        files.append(path)
+    procs = [
+        subprocess.Popen([sys.executable, script, "import", str(path)], env=env, stderr=subprocess.PIPE, text=True)
+        for path in files
+    ]
+    outputs = [proc.communicate(timeout=60)[1] for proc in procs]
+    assert all("Imported 300 meme(s)" in out for out in outputs), outputs
+
+    import sqlite3
+    conn = sqlite3.connect(env["MEMEBOT_DB"])
+    slots = [row[0] for row in conn.execute("SELECT scheduled_ts FROM memes")]
+    conn.close()
+    assert len(slots) == 600 and len(set(slots)) == 600
+
+
+def _flaky_flush(monkeypatch, failures):
+    real = bot._flush_post_results
+    calls = []
+
+    async def flush(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise RuntimeError("database is locked")
+        return await real(*args, **kwargs)
+
+    monkeypatch.setattr(bot, "_flush_post_results", flush)
+    monkeypatch.setattr(bot, "POST_FLUSH_RETRY_DELAY", 0)
+    monkeypatch.setattr(bot, "_unflushed_results", [])
+    return calls
+
+
+def test_post_results_are_retried_until_written(pool, monkeypatch):
+    run(insert_due("sent"))
+    _flaky_flush(monkeypatch, 2)
+    fake = SlowBot()
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    assert fake.sent == ["sent"]
+    assert run(_states()) == [("sent", 1, None)]
+
+
+def test_a_sent_meme_is_never_handed_back_to_the_queue(pool, monkeypatch):
+    monkeypatch.setattr(bot, "POST_LEASE_SECONDS", -1)  # the claim is already expired
+    run(insert_due("sent"))
+    _flaky_flush(monkeypatch, bot.POST_FLUSH_RETRIES)
+    fake = SlowBot()
+    with pytest.raises(RuntimeError):
+        run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    assert run(_states())[0][1] == bot.POSTING
+
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=fake)))
+    assert fake.sent == ["sent"]
+    assert run(_states()) == [("sent", 1, None)]
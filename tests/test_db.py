@@ -0,0 +1,87 @@
+import aiosqlite
+import pytest
+
+import bot
+from conftest import run
+
+
+async def _fetch(sql, params=()):
+    async with bot.acquire_db() as db:
+        async with db.execute(sql, params) as cur:
+            return await cur.fetchall()
+
+
+def test_pool_uses_wal(pool):
+    rows = run(_fetch("PRAGMA journal_mode"))
+    assert rows[0][0] == "wal"
+
+
+def test_schedule_meme_reuses_pooled_connections(pool):
+    first = run(bot.schedule_meme("file-a", "image"))
+    second = run(bot.schedule_meme("file-b", "video", "hi"))
+    assert second > first
+    rows = run(_fetch("SELECT owner_file_id, caption FROM memes ORDER BY scheduled_ts"))
+    assert rows == [("file-a", None), ("file-b", "hi")]
+    assert len(pool._conns) == 2
+
+
+def test_acquire_rolls_back_unfinished_transaction(pool):
+    async def scenario():
+        async with bot.acquire_db() as db:
+            await db.execute(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES ('x', 'image', 1, 1)"
+            )
+        return await _fetch("SELECT COUNT(*) FROM memes")
+
+    assert run(scenario())[0][0] == 0
+
+
+def test_acquire_requires_open_pool():
+    with pytest.raises(RuntimeError):
+        bot.acquire_db()
+
+
+def test_fresh_db_is_migrated_to_latest(pool):
+    assert run(_fetch("PRAGMA user_version"))[0][0] == bot.SCHEMA_VERSION
+
+
+def test_legacy_db_without_user_version_is_adopted(tmp_path):
+    path = str(tmp_path / "legacy.db")
+
+    async def make_legacy():
+        async with aiosqlite.connect(path) as db:
+            await db.execute(
+                "CREATE TABLE memes (id INTEGER PRIMARY KEY AUTOINCREMENT, owner_file_id TEXT NOT NULL, "
+                "mime_type TEXT, scheduled_ts INTEGER NOT NULL, posted INTEGER DEFAULT 0, "
+                "created_ts INTEGER NOT NULL, preview_file_id TEXT)"
+            )
+            await db.execute(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES ('old', 'image', 5, 5)"
+            )
+            await db.commit()
+
+    run(make_legacy())
+    run(bot.open_db(path))
+    try:
+        assert run(_fetch("PRAGMA user_version"))[0][0] == bot.SCHEMA_VERSION
+        assert run(_fetch("SELECT owner_file_id, caption FROM memes")) == [("old", None)]
+    finally:
+        run(bot.close_db())
+
+
+def test_migrate_is_a_noop_when_current(pool):
+    async def scenario():
+        async with bot.acquire_db() as db:
+            return await bot.migrate(db)
+
+    assert run(scenario()) == bot.SCHEMA_VERSION
+
+
+def test_migrate_refuses_newer_schema(pool):
+    async def scenario():
+        async with bot.acquire_db() as db:
+            await db.execute(f"PRAGMA user_version={bot.SCHEMA_VERSION + 1}")
+            await bot.migrate(db)
+
+    with pytest.raises(RuntimeError):
+        run(scenario())
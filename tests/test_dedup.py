@@ -0,0 +1,80 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeMessage, fake_update, run
+
+
+class PhotoMessage(FakeMessage):
+    def __init__(self, unique_id, user_id=None):
+        super().__init__(user_id)
+        self.photo = [SimpleNamespace(file_id=f"id-{unique_id}", file_unique_id=unique_id)]
+        self.video = self.animation = None
+        self.caption = None
+
+
+async def _count():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT COUNT(*) FROM memes") as cur:
+            return (await cur.fetchone())[0]
+
+
+def test_find_duplicates_by_unique_id(pool):
+    run(bot.schedule_meme("a", "image", media_kind="photo", file_unique_id="u1"))
+    found = run(bot.find_duplicates([bot.NewMeme("x", "image", file_unique_id="u1"),
+                                     bot.NewMeme("y", "image", file_unique_id="u2"),
+                                     bot.NewMeme("z", "image")]))
+    assert list(found) == ["u1"]
+    assert found["u1"][:2] == (1, 0)
+
+
+def test_find_duplicates_by_phash(pool):
+    run(bot.schedule_meme("a", "image", media_kind="photo", file_unique_id="u1", phash="00ff"))
+    found = run(bot.find_duplicates([bot.NewMeme("x", "image", file_unique_id="other", phash="00ff")]))
+    assert found["00ff"][0] == 1
+
+
+def _ingest(msg):
+    async def go():
+        await bot.handle_media(fake_update(msg), SimpleNamespace(bot=None))
+        await bot.ingest_batcher.flush()
+
+    run(go())
+
+
+def test_reject_policy_does_not_schedule(pool, monkeypatch):
+    monkeypatch.setattr(bot, "DUPLICATE_POLICY", "reject")
+    _ingest(PhotoMessage("u1"))
+    msg = PhotoMessage("u1")
+    _ingest(msg)
+    assert run(_count()) == 1
+    assert msg.replies[0].startswith("Duplicate of meme 1, scheduled for")
+
+
+def test_warn_policy_schedules_with_warning(pool, monkeypatch):
+    monkeypatch.setattr(bot, "DUPLICATE_POLICY", "warn")
+    _ingest(PhotoMessage("u1"))
+    msg = PhotoMessage("u1")
+    _ingest(msg)
+    assert run(_count()) == 2
+    assert "Warning: duplicate of meme 1" in msg.replies[0]
+
+
+def test_dhash_survives_reencoding():
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("L", (64, 48))
+    img.putdata([(x * 4 + y * 2) % 256 for y in range(48) for x in range(64)])
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    img.save(png, format="PNG")
+    img.resize((32, 24)).save(jpeg, format="JPEG", quality=60)
+    assert bot.dhash(png.getvalue()) == bot.dhash(jpeg.getvalue())
+    assert len(bot.dhash(png.getvalue())) == 16
+
+
+def test_unknown_duplicate_policy_stops_startup(monkeypatch):
+    monkeypatch.setattr(bot, "DUPLICATE_POLICY", "rejcet")
+    monkeypatch.setattr(bot.sys, "argv", ["bot.py"])
+    with pytest.raises(SystemExit, match="MEMEBOT_DUPLICATE_POLICY must be one of: reject, warn, allow"):
+        bot.main()
@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeMessage, run
+
+
+class FileBot:
+    def __init__(self, content):
+        self.content = content
+        self.documents = []
+
+    async def get_file(self, file_id):
+        async def download_to_drive(path):
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(self.content)
+        return SimpleNamespace(download_to_drive=download_to_drive)
+
+    async def send_document(self, chat_id, document, caption=None):
+        self.documents.append((document.filename, caption))
+
+
+@pytest.fixture(autouse=True)
+def owner_channels(monkeypatch):
+    monkeypatch.setattr(bot, "OWNER_ID", 100)
+    monkeypatch.setattr(bot, "channels", bot.ChannelRegistry())
+
+
+async def _pending(channel_id):
+    async with bot.acquire_db() as db:
+        async with db.execute(
+            "SELECT owner_file_id, caption FROM memes WHERE posted=0 AND channel_id=? ORDER BY scheduled_ts", (channel_id,)
+        ) as cur:
+            return await cur.fetchall()
+
+
+@pytest.mark.parametrize("fmt", bot.EXPORT_FORMATS)
+def test_export_then_import_into_another_channel(pool, fmt):
+    run(bot.schedule_memes([
+        bot.NewMeme("a", "image", "first, with \"quotes\"", "photo", "ua"),
+        bot.NewMeme("b", "video", None, "video", "ub"),
+    ]))
+    second = run(bot.add_channel("@second", 100))
+    out = io.StringIO()
+    assert run(bot.export_memes(out, fmt)) == 2
+
+    result = run(bot.import_memes(io.StringIO(out.getvalue()), fmt, second))
+    assert (result.imported, result.duplicates, result.invalid) == (2, 0, 0)
+    assert run(_pending(second)) == [("a", "first, with \"quotes\""), ("b", None)]
+
+    again = run(bot.import_memes(io.StringIO(out.getvalue()), fmt, second))
+    assert (again.imported, again.duplicates) == (0, 2)
+
+
+def test_import_skips_bad_rows_and_duplicates_within_the_file(pool, monkeypatch):
+    monkeypatch.setattr(bot, "IMPORT_CHUNK", 2)
+    lines = [
+        {"owner_file_id": "x1", "file_unique_id": "u1"},
+        "not json",
+        {"owner_file_id": "x2", "file_unique_id": "u1"},
+        {"caption": "no file"},
+        {"owner_file_id": "x3"},
+    ]
+    text = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    result = run(bot.import_memes(io.StringIO(text)))
+    assert (result.imported, result.duplicates, result.invalid) == (2, 1, 2)
+    assert [f for f, _ in run(_pending(bot.DEFAULT_CHANNEL))] == ["x1", "x3"]
+    assert bot.describe_import(result).endswith("Skipped 1 duplicate(s). Ignored 2 invalid row(s) (no file id or a bad file_unique_id).")
+
+
+def test_import_rejects_file_unique_ids_that_are_paths(pool):
+    lines = [
+        {"owner_file_id": "bogus", "file_unique_id": "../secret.txt"},
+        {"owner_file_id": "fine", "file_unique_id": "AgAD-x_1"},
+    ]
+    result = run(bot.import_memes(io.StringIO("\n".join(json.dumps(line) for line in lines))))
+    assert (result.imported, result.invalid) == (1, 1)
+    assert [f for f, _ in run(_pending(bot.DEFAULT_CHANNEL))] == ["fine"]
+
+
+def test_export_pages_through_equal_slots_without_gaps(pool, monkeypatch):
+    monkeypatch.setattr(bot, "IMPORT_CHUNK", 2)
+
+    async def seed():
+        async with bot.acquire_db() as db:
+            await db.executemany(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES (?, 'image', ?, 0)",
+                [(f"f{i}", 1000 + i // 3) for i in range(7)],
+            )
+            await db.commit()
+
+    run(seed())
+    out = io.StringIO()
+    assert run(bot.export_memes(out, "jsonl")) == 7
+    assert [json.loads(line)["owner_file_id"] for line in out.getvalue().splitlines()] == [f"f{i}" for i in range(7)]
+
+
+def test_export_and_import_commands(pool):
+    run(bot.schedule_memes([bot.NewMeme("a", "image", None, "photo", "ua")]))
+    fake = FileBot(json.dumps({"owner_file_id": "b", "file_unique_id": "ub"}) + "\n")
+    msg = FakeMessage(100)
+    update = SimpleNamespace(message=msg, effective_user=msg.from_user, effective_chat=SimpleNamespace(id=100))
+    run(bot.exportcmd(update, SimpleNamespace(args=["csv"], bot=fake)))
+    assert fake.documents == [("memes-pending-1.csv", "1 pending meme(s)")]
+
+    doc = SimpleNamespace(document=SimpleNamespace(file_id="doc", file_name="queue.jsonl"))
+    msg = FakeMessage(100, reply_to_message=doc)
+    update = SimpleNamespace(message=msg, effective_user=msg.from_user, effective_chat=SimpleNamespace(id=100))
+    run(bot.importcmd(update, SimpleNamespace(args=[], bot=fake)))
+    assert msg.replies[-1].startswith("Imported 1 meme(s), scheduled ")
+    assert [f for f, _ in run(_pending(bot.DEFAULT_CHANNEL))] == ["a", "b"]
+
+
+def test_cli_round_trip(tmp_path):
+    src = tmp_path / "in.csv"
+    src.write_text("owner_file_id,media_kind,caption\nc1,photo,hello\nc2,video,\n", encoding="utf-8")
+    env = dict(os.environ, MEMEBOT_DB=str(tmp_path / "cli.db"))
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+
+    imported = subprocess.run([sys.executable, script, "import", str(src)], env=env, capture_output=True, text=True)
+    assert imported.returncode == 0 and "Imported 2 meme(s)" in imported.stderr
+    exported = subprocess.run([sys.executable, script, "export"], env=env, capture_output=True, text=True)
+    rows = [json.loads(line) for line in exported.stdout.splitlines()]
+    assert [(r["owner_file_id"], r["media_kind"], r["caption"]) for r in rows] == [("c1", "photo", "hello"), ("c2", "video", None)]
@@ -0,0 +1,85 @@
+import asyncio
+
+import bot
+from conftest import FakeMessage, run
+
+
+async def _slots():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT id, scheduled_ts FROM memes ORDER BY id") as cur:
+            return await cur.fetchall()
+
+
+def test_burst_is_scheduled_once_with_one_reply(pool):
+    batcher = bot.IngestBatcher(window=0.02, max_wait=1)
+    msgs = [FakeMessage() for _ in range(5)]
+
+    async def scenario():
+        for i, msg in enumerate(msgs):
+            batcher.add(bot.NewMeme(f"f{i}", "image", media_kind="photo", file_unique_id=f"u{i}"), msg)
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+
+    run(scenario())
+    assert [len(m.replies) for m in msgs] == [0, 0, 0, 0, 1]
+    assert msgs[-1].replies[0].startswith("Scheduled 5 of 5 memes:")
+    rows = run(_slots())
+    assert [r[0] for r in rows] == [1, 2, 3, 4, 5]
+    ts = [r[1] for r in rows]
+    assert ts == sorted(set(ts))
+
+
+def test_co_owners_in_one_window_each_get_a_summary(pool):
+    batcher = bot.IngestBatcher(window=0.02, max_wait=1)
+    alice, bob = FakeMessage(100), FakeMessage(200)
+
+    async def scenario():
+        batcher.add(bot.NewMeme("a", "image", media_kind="photo"), alice)
+        batcher.add(bot.NewMeme("b", "image", media_kind="photo"), bob)
+        await asyncio.sleep(0.1)
+
+    run(scenario())
+    assert alice.replies[0].startswith("Scheduled for: ")
+    assert bob.replies[0].startswith("Scheduled for: ")
+
+
+def test_close_schedules_memes_still_in_the_window(pool):
+    batcher = bot.IngestBatcher(window=60, max_wait=60)
+    msg = FakeMessage()
+
+    async def scenario():
+        batcher.add(bot.NewMeme("late", "image", media_kind="photo"), msg)
+        await batcher.close()
+
+    run(scenario())
+    assert len(run(_slots())) == 1 and len(msg.replies) == 1
+
+
+def test_schedule_memes_returns_ids_and_consecutive_slots(pool):
+    result = run(bot.schedule_memes([bot.NewMeme("a", "image"), bot.NewMeme("b", "video")]))
+    assert [mid for mid, _ in result] == [1, 2]
+    first, second = (dt for _, dt in result)
+    assert run(bot.compute_next_slot(first)) == second
+
+
+def test_concurrent_bursts_never_share_a_slot(pool):
+    async def scenario():
+        await asyncio.gather(*(
+            bot.schedule_memes([bot.NewMeme(f"{n}-{i}", "image") for i in range(4)]) for n in range(5)
+        ))
+
+    run(scenario())
+    ts = [r[1] for r in run(_slots())]
+    assert len(ts) == len(set(ts)) == 20
+
+
+def test_duplicates_inside_a_burst_are_rejected(pool, monkeypatch):
+    monkeypatch.setattr(bot, "DUPLICATE_POLICY", "reject")
+    text = run(bot.ingest_memes([
+        bot.NewMeme("a", "image", file_unique_id="u1"),
+        bot.NewMeme("a-again", "image", file_unique_id="u1"),
+        bot.NewMeme("b", "image", file_unique_id="u2"),
+    ]))
+    assert text.splitlines()[0] == "Scheduled 2 of 3 memes:"
+    assert text.splitlines()[-1] == "Skipped duplicate of item 1 of this batch"
+    assert len(run(_slots())) == 2
@@ -0,0 +1,89 @@
+import sqlite3
+from datetime import datetime
+
+
+import bot
+from conftest import run
+
+
+NOW = int(datetime.now(bot.IST).timestamp())
+
+
+async def _seed():
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, posted, created_ts, file_unique_id)"
+            " VALUES (?, 'image', ?, ?, ?, ?)",
+            [
+                ("old-posted", NOW - 90 * 86400, 1, NOW, "u-old"),
+                ("old-dead", NOW - 90 * 86400, bot.DEAD_LETTER, NOW, "u-dead"),
+                ("recent-posted", NOW - 86400, 1, NOW, "u-recent"),
+                ("pending", NOW + 3600, 0, NOW, "u-pending"),
+            ]
+            + [(f"bulk-{i}", NOW - 60 * 86400, 1, NOW, f"u-bulk-{i}") for i in range(1200)],
+        )
+        await db.commit()
+
+
+async def _ids(table):
+    async with bot.acquire_db() as db:
+        async with db.execute(f"SELECT owner_file_id FROM {table} WHERE owner_file_id NOT LIKE 'bulk-%'") as cur:
+            return sorted(row[0] for row in await cur.fetchall())
+
+
+def test_archive_moves_only_old_posted_rows(pool):
+    run(_seed())
+    moved = run(bot.archive_posted_memes(NOW - 30 * 86400, chunk=100))
+    assert moved == 1201
+    assert run(_ids("memes")) == ["old-dead", "pending", "recent-posted"]
+    assert run(_ids("memes_archive")) == ["old-posted"]
+
+
+def test_archived_memes_still_count_as_duplicates(pool):
+    run(_seed())
+    run(bot.archive_posted_memes(NOW - 30 * 86400))
+    found = run(bot.find_duplicates([bot.NewMeme("again", "image", file_unique_id="u-old")]))
+    assert found["u-old"][1] == 1
+
+
+def test_compact_frees_pages_and_reports_sizes(pool):
+    run(_seed())
+    run(bot.archive_posted_memes(NOW - 30 * 86400))
+
+    async def purge_archive():
+        async with bot.acquire_db() as db:
+            await db.execute("DELETE FROM memes_archive")
+            await db.commit()
+
+    run(purge_archive())
+    assert run(bot.compact_db()) > 0
+    sizes = {name: (rows, size) for name, rows, size in run(bot.table_sizes())}
+    assert sizes["memes"][0] == 3 and sizes["memes_archive"][0] == 0
+
+
+def test_archive_duplicate_lookup_is_indexed(pool):
+    async def plan():
+        async with bot.acquire_db() as db:
+            async with db.execute(
+                "EXPLAIN QUERY PLAN " + bot.SQL_DUPLICATES_BY_UNIQUE_ID.format("?"), ("x", 1) * 2
+            ) as cur:
+                return " | ".join(row[3] for row in await cur.fetchall())
+
+    assert "USING INDEX idx_memes_archive_file_unique_id" in run(plan())
+
+
+def test_open_db_switches_an_existing_file_to_incremental_vacuum(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE leftovers (x)")
+    conn.close()
+    run(bot.open_db(path))
+    try:
+        async def mode():
+            async with bot.acquire_db() as db:
+                async with db.execute("PRAGMA auto_vacuum") as cur:
+                    return (await cur.fetchone())[0]
+
+        assert run(mode()) == 2
+    finally:
+        run(bot.close_db())
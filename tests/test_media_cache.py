@@ -0,0 +1,143 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class FakeFile:
+    def __init__(self, unique_id, payload):
+        self.file_unique_id = unique_id
+        self.file_path = f"/var/lib/telegram-bot-api/{unique_id}"
+        self.payload = payload
+
+    async def download_to_drive(self, dest):
+        with open(dest, "wb") as fh:
+            fh.write(self.payload)
+
+
+class FakeBot:
+    def __init__(self, payload=b"x" * 100):
+        self.payload = payload
+        self.get_file_calls = 0
+        self.uploads = []
+
+    async def get_file(self, file_id):
+        self.get_file_calls += 1
+        return FakeFile(f"uniq-{file_id}", self.payload)
+
+    async def send_photo(self, chat_id, photo, caption=None):
+        if isinstance(photo, str):
+            raise BadRequest("wrong file identifier")
+        self.uploads.append(photo.filename)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id="fresh-id")])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = bot.MediaCache(str(tmp_path / "cache"), max_bytes=250)
+    monkeypatch.setattr(bot, "media_cache", cache)
+    return cache
+
+
+def test_hit_by_unique_id_skips_get_file(cache):
+    fake = FakeBot()
+    path = run(cache.fetch(fake, "a", "uniq-a"))
+    assert open(path, "rb").read() == fake.payload
+    assert run(cache.fetch(fake, "a", "uniq-a")) == path
+    assert fake.get_file_calls == 1
+
+
+def test_unknown_unique_id_still_avoids_redownload(cache):
+    fake = FakeBot()
+    first = run(cache.fetch(fake, "a"))
+    second = run(cache.fetch(fake, "a"))
+    assert first == second
+    assert fake.get_file_calls == 2
+    assert sorted(os.listdir(cache.directory)) == ["uniq-a"]
+
+
+def test_evicts_least_recently_used(cache):
+    fake = FakeBot()
+    run(cache.fetch(fake, "a"))
+    os.utime(cache._path("uniq-a"), (1, 1))
+    run(cache.fetch(fake, "b"))
+    os.utime(cache._path("uniq-b"), (2, 2))
+    assert cache.get("uniq-a")  # hit refreshes a
+    run(cache.fetch(fake, "c"))
+    assert sorted(os.listdir(cache.directory)) == ["uniq-a", "uniq-c"]
+
+
+def test_reupload_remembers_new_file_id(cache, tmp_path):
+    run(bot.open_db(str(tmp_path / "memes.db")))
+    try:
+        run(bot.schedule_meme("stale", "image", media_kind="photo", file_unique_id="uniq-stale"))
+
+        async def set_rendition():
+            async with bot.acquire_db() as db:
+                await db.execute("UPDATE memes SET preview_file_id='small-jpeg', preview_kind='photo' WHERE id=1")
+                await db.commit()
+
+        run(set_rendition())
+        fake = FakeBot()
+        assert run(bot.reupload_meme(fake, 1, 1, "stale", "uniq-stale", "image", "photo", "cap")) == "photo"
+        assert fake.uploads == ["meme_1.jpg"]
+
+        async def stored():
+            async with bot.acquire_db() as db:
+                async with db.execute("SELECT preview_file_id, preview_kind, send_method FROM memes WHERE id=1") as cur:
+                    return await cur.fetchone()
+
+        assert run(stored()) == ("fresh-id", None, "photo")
+    finally:
+        run(bot.close_db())
+
+
+def test_concurrent_fetches_of_one_file_do_not_clash(cache):
+    class SlowFile(FakeFile):
+        async def download_to_drive(self, dest):
+            with open(dest, "wb") as fh:
+                fh.write(self.payload[:50])
+                await asyncio.sleep(0.01)
+                fh.write(self.payload[50:])
+
+    class SlowBot(FakeBot):
+        async def get_file(self, file_id):
+            return SlowFile(f"uniq-{file_id}", self.payload)
+
+    fake = SlowBot()
+
+    async def race():
+        return await asyncio.gather(cache.fetch(fake, "a"), cache.fetch(fake, "a"))
+
+    first, second = run(race())
+    assert first == second and open(first, "rb").read() == fake.payload
+    assert os.listdir(cache.directory) == ["uniq-a"]
+
+
+def test_keys_that_are_not_file_unique_ids_never_become_paths(cache, tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_bytes(b"do not upload")
+    os.makedirs(cache.directory)
+    assert cache.get("../secret.txt") is None
+    fake = FakeBot()
+    path = run(cache.fetch(fake, "a", "../secret.txt"))
+    assert path == cache._path("uniq-a") and open(path, "rb").read() == fake.payload
+
+    class OddFile(FakeFile):
+        def __init__(self, payload):
+            super().__init__("../../escape", payload)
+
+    class OddBot(FakeBot):
+        async def get_file(self, file_id):
+            return OddFile(self.payload)
+
+    path = run(cache.fetch(OddBot(), "b"))
+    assert os.path.dirname(path) == cache.directory
+    assert not os.path.exists(tmp_path / "escape")
@@ -0,0 +1,106 @@
+import socket
+from datetime import datetime
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from telegram.error import BadRequest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class AnimationOnlyBot:
+    async def send_photo(self, chat_id, file_id, caption=None):
+        raise BadRequest("not a photo")
+
+    async def send_animation(self, chat_id, file_id, caption=None):
+        pass
+
+
+def test_histogram_renders_cumulative_buckets_and_estimates_quantiles():
+    hist = bot.Histogram("t_seconds", "test", ["op"], buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3):
+        hist.observe(value, op="x")
+    lines = hist.render()
+    assert 't_seconds_bucket{op="x",le="1"} 1' in lines
+    assert 't_seconds_bucket{op="x",le="2"} 3' in lines
+    assert 't_seconds_bucket{op="x",le="+Inf"} 4' in lines
+    assert 't_seconds_count{op="x"} 4' in lines
+    assert hist.quantile(0.5) == pytest.approx(1.5)
+    assert hist.quantile(0.5, op="other") is None
+
+
+def test_timed_works_as_decorator_and_context_manager():
+    hist = bot.Histogram("t_seconds", "test", ["op"], buckets=(1,))
+
+    @bot.timed(hist, op="call")
+    async def work():
+        return 42
+
+    assert run(work()) == 42
+    with bot.timed(hist, op="block"):
+        pass
+    assert hist.count(op="call") == 1 and hist.count(op="block") == 1
+
+
+def test_posting_records_lag_fallbacks_and_queue_depth(pool):
+    now_ts = int(datetime.now(bot.IST).timestamp())
+    fallbacks = bot.FALLBACKS.total(kind="send_method")
+    lag_count = bot.POST_LAG_SECONDS.count()
+
+    async def seed():
+        async with bot.acquire_db() as db:
+            await db.executemany(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES (?, 'image', ?, ?)",
+                [("gif", now_ts - 120, now_ts), ("later", now_ts + 3600, now_ts)],
+            )
+            await db.commit()
+
+    run(seed())
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=AnimationOnlyBot())))
+    assert bot.FALLBACKS.total(kind="send_method") == fallbacks + 1
+    assert bot.POST_LAG_SECONDS.count() == lag_count + 1
+
+    text = run(bot.metrics.render())
+    assert "# TYPE memebot_queue_depth gauge" in text
+    assert "memebot_queue_depth{channel=" in text and "} 1" in text
+    assert 'memebot_api_errors_total{method="send_photo",error="BadRequest"}' in text
+
+
+def test_metrics_endpoint_and_stats(pool):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def scenario():
+        runner = await bot.start_metrics_server(port)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                    return resp.status, await resp.text()
+        finally:
+            await runner.cleanup()
+
+    status, text = run(scenario())
+    assert status == 200
+    assert "# HELP memebot_posts_total" in text
+    stats = run(bot.render_stats(bot.DEFAULT_CHANNEL))
+    assert stats.startswith("Queue: 0 pending on 1:")
+    assert "Posting lag: p50" in stats
+
+
+def test_webhook_listener_does_not_expose_metrics():
+    async def scenario():
+        client = TestClient(TestServer(bot.build_webhook_app(SimpleNamespace(running=True), "s", "/telegram")))
+        await client.start_server()
+        try:
+            resp = await client.get("/metrics")
+            return resp.status
+        finally:
+            await client.close()
+
+    assert run(scenario()) == 404
@@ -0,0 +1,70 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+import bot
+from conftest import FakeMessage, FlakyBot, fake_update, insert_due, run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+def _log(*args):
+    msg = FakeMessage()
+    run(bot.logcmd(fake_update(msg), SimpleNamespace(args=list(args))))
+    return msg.replies[0]
+
+
+def test_post_attempts_are_recorded(pool):
+    run(insert_due("a", "b"))
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=FlakyBot(BadRequest("wrong file identifier"), failures=2))))
+    rows = run(bot.fetch_post_events(bot.DEFAULT_CHANNEL))
+    assert [(mid, outcome, method, attempt, error_class) for _, mid, outcome, method, _, attempt, error_class, _ in rows] == [
+        (2, "posted", "photo", 1, None),
+        (1, "failed", "photo", 1, "BadRequest"),
+    ]
+    assert all(latency is not None for _, _, _, _, latency, _, _, _ in rows)
+
+
+def test_log_filters_and_stats(pool):
+    run(insert_due("a", "b", "c"))
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=FlakyBot(BadRequest("wrong file identifier"), failures=2))))
+
+    failed = _log("failed", "24h")
+    assert "[FAILED] id=1" in failed and "[POSTED]" not in failed
+    assert _log().count("\n") == 3
+
+    stats = _log("stats")
+    assert stats.startswith("Posting stats, last 1d:\n3 attempt(s):")
+    assert "posted: 2 (66%)" in stats
+    assert "Top errors: BadRequest ×1" in stats
+    assert _log("sideways").startswith("Don't understand 'sideways'")
+
+
+def test_old_events_are_pruned(pool, monkeypatch):
+    monkeypatch.setattr(bot, "POST_EVENT_RETENTION_DAYS", 1)
+    old_ts = int(datetime.now(bot.IST).timestamp()) - 2 * 86400
+
+    async def seed_old():
+        async with bot.acquire_db() as db:
+            await db.execute(bot.SQL_INSERT_POST_EVENT, bot.PostEvent(old_ts, bot.DEFAULT_CHANNEL, 99, "posted"))
+            await db.commit()
+
+    run(seed_old())
+    run(insert_due("a"))
+    run(bot.pop_due_memes_and_post(SimpleNamespace(bot=FlakyBot())))
+    assert [row[1] for row in run(bot.fetch_post_events(bot.DEFAULT_CHANNEL))] == [1]
+
+
+def test_recent_events_query_uses_index(pool):
+    async def plan():
+        async with bot.acquire_db() as db:
+            async with db.execute(
+                "EXPLAIN QUERY PLAN " + bot.SQL_RECENT_POST_EVENTS.format(""), (1, 0, 10)
+            ) as cur:
+                return " | ".join(row[3] for row in await cur.fetchall())
+
+    text = run(plan())
+    assert "idx_post_events_channel_ts" in text
+    assert "TEMP B-TREE" not in text
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+import bot
+from conftest import FlakyBot, insert_due, run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class FakeApp:
+    def __init__(self, bot_):
+        self.bot = bot_
+
+
+async def _rows():
+    async with bot.acquire_db() as db:
+        async with db.execute("SELECT owner_file_id, posted, attempts, next_attempt_ts FROM memes ORDER BY id") as cur:
+            return await cur.fetchall()
+
+
+def test_token_bucket_paces_after_burst():
+    async def scenario():
+        bucket = bot.TokenBucket(rate=50, capacity=1)
+        start = bot.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return bot.monotonic() - start
+
+    assert run(scenario()) >= 0.035
+
+
+def test_private_chats_are_not_paced_like_channels():
+    limiter = bot.PostRateLimiter(30, 18, 3, private_per_second=1)
+    assert limiter.chat_bucket(123).rate == 1
+    for chat_id in (-1001234, "@memes"):
+        assert limiter.chat_bucket(chat_id).rate == 18 / 60
+
+
+def test_drains_backlog_in_order(pool):
+    fake = FlakyBot()
+    run(insert_due("a", "b", "c"))
+    assert run(bot.pop_due_memes_and_post(FakeApp(fake))) is None
+    assert [c[1] for c in fake.calls] == ["a", "b", "c"]
+    assert [r[1] for r in run(_rows())] == [1, 1, 1]
+
+
+def test_retry_after_is_waited_out_not_counted(pool):
+    fake = FlakyBot(RetryAfter(0), failures=1)
+    run(insert_due("a"))
+    assert run(bot.pop_due_memes_and_post(FakeApp(fake))) is None
+    # RetryAfter does not fall through to send_document
+    assert fake.calls == [("photo", "a"), ("photo", "a")]
+    assert run(_rows()) == [("a", 1, 0, None)]
+
+
+def test_failures_back_off_then_dead_letter(pool, monkeypatch):
+    monkeypatch.setattr(bot, "POST_MAX_ATTEMPTS", 2)
+    fake = FlakyBot(BadRequest("nope"), failures=100)
+    run(insert_due("a"))
+    retry_ts = run(bot.pop_due_memes_and_post(FakeApp(fake)))
+    (_, posted, attempts, next_ts), = run(_rows())
+    assert (posted, attempts) == (0, 1)
+    assert next_ts == retry_ts
+    assert retry_ts >= int(datetime.now(bot.IST).timestamp()) + bot.POST_BACKOFF_BASE - 1
+
+    # still backing off: nothing is due
+    calls = len(fake.calls)
+    run(bot.pop_due_memes_and_post(FakeApp(fake)))
+    assert len(fake.calls) == calls
+
+    async def expire_backoff():
+        async with bot.acquire_db() as db:
+            await db.execute("UPDATE memes SET next_attempt_ts=0")
+            await db.commit()
+
+    run(expire_backoff())
+    assert run(bot.pop_due_memes_and_post(FakeApp(fake))) is None
+    assert run(_rows()) == [("a", bot.DEAD_LETTER, 2, None)]
+
+
+def test_post_backoff_is_exponential_and_capped():
+    assert bot.post_backoff(1) == bot.POST_BACKOFF_BASE
+    assert bot.post_backoff(3) == bot.POST_BACKOFF_BASE * 4
+    assert bot.post_backoff(50) == bot.POST_BACKOFF_MAX
+
+
+def test_send_methods_for_known_kind_tries_it_first():
+    assert bot.send_methods_for("animation", "image") == ["animation", "document"]
+    assert bot.send_methods_for("document", None) == ["document"]
+    assert bot.send_methods_for(None, "video") == ["video", "photo", "document"]
+    assert bot.send_methods_for(None, "image") == ["photo", "animation", "document"]
+
+
+def test_learned_method_makes_one_call_per_item(pool):
+    async def seed():
+        now_ts = int(datetime.now(bot.IST).timestamp())
+        async with bot.acquire_db() as db:
+            # legacy GIF row: coarse 'image' mime, no media_kind
+            await db.execute(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES ('gif', 'image', ?, ?)",
+                (now_ts + 3600, now_ts),
+            )
+            await db.commit()
+
+    run(seed())
+    fake = FlakyBot(BadRequest("not a photo"), failures=1)
+    assert run(bot.send_meme(fake, 1, "gif", "image", mid=1)) == "animation"
+    run(bot.remember_send_method(1, "animation"))
+
+    async def learned_kind():
+        async with bot.acquire_db() as db:
+            async with db.execute("SELECT COALESCE(send_method, media_kind) FROM memes WHERE id=1") as cur:
+                return (await cur.fetchone())[0]
+
+    kind = run(learned_kind())
+    assert kind == "animation"
+    fake.calls.clear()
+    run(bot.send_meme(fake, 1, "gif", "image", mid=1, kind=kind))
+    assert fake.calls == [("animation", "gif")]
+
+
+def test_schedule_meme_stores_exact_kind(pool):
+    run(bot.schedule_meme("vid", "video", media_kind="video", file_unique_id="uniq-1"))
+
+    async def stored():
+        async with bot.acquire_db() as db:
+            async with db.execute("SELECT media_kind, file_unique_id FROM memes") as cur:
+                return await cur.fetchall()
+
+    assert run(stored()) == [("video", "uniq-1")]
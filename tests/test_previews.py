@@ -0,0 +1,111 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class UploadBot:
+    def __init__(self, fail_rendition=False):
+        self.fail_rendition = fail_rendition
+        self.calls = []
+
+    async def send_photo(self, chat_id, photo, caption=None, disable_notification=None):
+        if isinstance(photo, bot.InputFile):
+            self.calls.append(("upload", chat_id, disable_notification))
+            return SimpleNamespace(photo=[SimpleNamespace(file_id="small")], message_id=7)
+        self.calls.append(("photo", photo))
+        if self.fail_rendition and photo == "small":
+            raise BadRequest("wrong file identifier")
+
+    async def send_document(self, chat_id, document, caption=None):
+        raise BadRequest("wrong file identifier")
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", message_id))
+
+    async def send_media_group(self, chat_id, media):
+        self.calls.append(("media_group", [m.media for m in media]))
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "media_cache", bot.MediaCache(str(tmp_path / "cache"), 10 * 1024 * 1024))
+
+
+def _photo_bytes(size):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(out, "PNG")
+    return out.getvalue()
+
+
+def test_photo_rendition_is_a_small_jpeg(tmp_path):
+    src = tmp_path / "big.png"
+    src.write_bytes(_photo_bytes((1280, 960)))
+    data, kind = bot.render_preview(str(src), "photo")
+    assert kind == "photo" and data[:2] == b"\xff\xd8"
+    assert len(data) < src.stat().st_size
+    from PIL import Image
+    assert max(Image.open(io.BytesIO(data)).size) == bot.PREVIEW_MAX_SIDE
+
+
+def test_video_without_ffmpeg_keeps_the_original(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot.shutil, "which", lambda name: None)
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"\0" * 100)
+    assert bot.render_preview(str(src), "video") is None
+
+
+def test_rendition_is_uploaded_once_and_used_by_previews(pool, tmp_path):
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "cache" / "uniq").write_bytes(_photo_bytes((1280, 960)))
+    (mid, _), = run(bot.schedule_memes([bot.NewMeme("orig", "image", None, "photo", "uniq")]))
+    run(bot.schedule_memes([bot.NewMeme("other", "image", None, "photo")]))
+
+    fake = UploadBot()
+    renderer = bot.PreviewRenderer(1)
+    renderer.start(fake)
+    try:
+        assert run(renderer.build(42, mid, bot.NewMeme("orig", "image", None, "photo", "uniq"))) == "small"
+    finally:
+        run(renderer.shutdown())
+    assert fake.calls == [("upload", 42, True), ("delete", 7)]
+
+    fake.calls.clear()
+    run(bot.render_scheduled_page(fake, 1, page=1, compact=False))
+    assert fake.calls == [("media_group", ["small", "other"])]
+
+
+def test_broken_rendition_falls_back_to_the_original(pool):
+    (mid, _), = run(bot.schedule_memes([bot.NewMeme("orig", "image", None, "photo")]))
+
+    async def set_rendition():
+        async with bot.acquire_db() as db:
+            await db.execute("UPDATE memes SET preview_file_id='small', preview_kind='photo' WHERE id=?", (mid,))
+            await db.commit()
+
+    run(set_rendition())
+    fake = UploadBot(fail_rendition=True)
+    run(bot.render_scheduled_page(fake, 1, page=1, compact=False))
+    assert fake.calls == [("photo", "small"), ("photo", "orig")]
+
+
+def test_missing_tools_skip_the_download_and_the_pool(pool, monkeypatch):
+    monkeypatch.setattr(bot, "PREVIEWS_ENABLED", True)
+    monkeypatch.setattr(bot, "pil_image", lambda: None)
+    monkeypatch.setattr(bot.shutil, "which", lambda name: None)
+
+    async def fetch(*args):
+        raise AssertionError("should not download")
+
+    monkeypatch.setattr(bot.media_cache, "fetch", fetch)
+    renderer = bot.PreviewRenderer(1)
+    renderer.start(UploadBot())
+    renderer.submit(42, [(1, bot.NewMeme("p", "image", None, "photo")), (2, bot.NewMeme("v", "video", None, "video"))])
+    assert not renderer._tasks and renderer._executor is None
@@ -0,0 +1,64 @@
+import pytest
+
+import bot
+from conftest import run
+
+
+HOT_QUERIES = [
+    (bot.SQL_LAST_PENDING_TS, (1,), "idx_memes_channel_pending"),
+    (bot.SQL_DUE_MEMES, (0, 0), "idx_memes_pending"),
+    (bot.SQL_PENDING_PAGE, (1, 1, 10, 0), "idx_memes_channel_pending"),
+    (bot.SQL_CLAIM_MEME.format(bot.SQL_NEXT_PENDING), (0, 1), "idx_memes_channel_pending"),
+    # every pending row across channels: either partial pending index will do
+    (bot.SQL_PENDING_TS, (), ("idx_memes_pending", "idx_memes_channel_pending")),
+]
+
+
+async def _seed_history(posted_rows, pending_rows):
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, posted, created_ts) VALUES (?, 'image', ?, ?, ?)",
+            [(f"f{i}", i, 1, i) for i in range(posted_rows)]
+            + [(f"p{i}", posted_rows + i, 0, i) for i in range(pending_rows)],
+        )
+        await db.execute("ANALYZE")
+        await db.commit()
+
+
+def test_pending_timestamps_include_claim_expiry_by_index(pool):
+    plan = run(_plan(bot.SQL_PENDING_TS, ()))
+    assert "idx_memes_posting" in plan
+
+
+def _indexes(index):
+    return (index,) if isinstance(index, str) else index
+
+
+async def _plan(sql, params):
+    async with bot.acquire_db() as db:
+        async with db.execute("EXPLAIN QUERY PLAN " + sql, params) as cur:
+            return " | ".join(row[3] for row in await cur.fetchall())
+
+
+@pytest.mark.parametrize("sql,params,index", HOT_QUERIES)
+def test_hot_query_uses_pending_index(pool, sql, params, index):
+    run(_seed_history(posted_rows=2000, pending_rows=20))
+    plan = run(_plan(sql, params))
+    assert any(i in plan for i in _indexes(index))
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("sql,params,index", HOT_QUERIES)
+def test_hot_query_uses_pending_index_without_stats(pool, sql, params, index):
+    plan = run(_plan(sql, params))
+    assert any(i in plan for i in _indexes(index))
+
+
+@pytest.mark.parametrize("sql,index", [
+    (bot.SQL_DUPLICATES_BY_UNIQUE_ID, "idx_memes_file_unique_id"),
+    (bot.SQL_DUPLICATES_BY_PHASH, "idx_memes_phash"),
+])
+def test_duplicate_lookup_is_indexed(pool, sql, index):
+    run(_seed_history(posted_rows=2000, pending_rows=20))
+    plan = run(_plan(sql.format("?,?"), ("x", "y", 1) * 2))
+    assert f"USING INDEX {index}" in plan
@@ -0,0 +1,92 @@
+import pytest
+from telegram.error import BadRequest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class RecordingBot:
+    def __init__(self, album_error=None):
+        self.album_error = album_error
+        self.calls = []
+
+    async def send_media_group(self, chat_id, media):
+        self.calls.append(("media_group", [m.media for m in media]))
+        if self.album_error:
+            raise self.album_error
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        self.calls.append(("photo", file_id))
+
+    async def send_video(self, chat_id, file_id, caption=None):
+        self.calls.append(("video", file_id))
+
+    async def send_animation(self, chat_id, file_id, caption=None):
+        self.calls.append(("animation", file_id))
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.calls.append(("message", text))
+
+
+async def _seed(kinds):
+    async with bot.acquire_db() as db:
+        await db.executemany(
+            "INSERT INTO memes (owner_file_id, mime_type, media_kind, scheduled_ts, created_ts) VALUES (?, ?, ?, ?, 0)",
+            [
+                (f"f{i}", "video" if kind == "video" else "image", kind, 1_700_000_000 + i * 3600)
+                for i, kind in enumerate(kinds)
+            ],
+        )
+        await db.commit()
+
+
+def test_page_is_sent_as_one_album(pool):
+    run(_seed(["photo", "video"] * 11 + ["photo"]))
+    fake = RecordingBot()
+    text, keyboard = run(bot.render_scheduled_page(fake, 1, page=1, compact=False))
+    assert fake.calls == [("media_group", [f"f{i}" for i in range(10)])]
+    assert text == "Scheduled memes: page 1/3 (23 pending)"
+    assert [b.callback_data for b in keyboard.inline_keyboard[0]] == ["scheduled:2:media"]
+
+
+def test_animations_are_sent_outside_the_album(pool):
+    run(_seed(["photo", "animation", "photo"]))
+    fake = RecordingBot()
+    run(bot.render_scheduled_page(fake, 1, page=1, compact=False))
+    assert fake.calls == [("media_group", ["f0", "f2"]), ("animation", "f1")]
+
+
+def test_rejected_album_falls_back_per_item(pool):
+    run(_seed(["photo", "photo"]))
+    fake = RecordingBot(album_error=BadRequest("wrong file type"))
+    run(bot.render_scheduled_page(fake, 1, page=1, compact=False))
+    assert fake.calls[1:] == [("photo", "f0"), ("photo", "f1")]
+
+
+def test_compact_mode_makes_no_media_calls(pool):
+    run(_seed(["photo"] * 45))
+    fake = RecordingBot()
+    text, keyboard = run(bot.render_scheduled_page(fake, 1, page=2, compact=True))
+    assert fake.calls == []
+    lines = text.splitlines()
+    assert lines[0] == "Scheduled memes: page 2/2 (45 pending)"
+    assert len(lines) == 1 + 45 - bot.SCHEDULED_TEXT_PAGE_SIZE
+    assert [b.callback_data for b in keyboard.inline_keyboard[0]] == ["scheduled:1:text"]
+
+
+def test_page_past_the_end_shows_last_page(pool):
+    run(_seed(["photo"] * 3))
+    text, _ = run(bot.render_scheduled_page(RecordingBot(), 1, page=7, compact=True))
+    assert text.startswith("Scheduled memes: page 1/1 (3 pending)")
+
+
+def test_empty_queue(pool):
+    assert run(bot.render_scheduled_page(RecordingBot(), 1, page=1, compact=False)) == ("No scheduled memes.", None)
+
+
+def test_parse_scheduled_args():
+    assert bot._parse_scheduled_args(None) == (1, False)
+    assert bot._parse_scheduled_args(["3", "text"]) == (3, True)
+    assert bot._parse_scheduled_args(["compact"]) == (1, True)
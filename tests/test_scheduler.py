@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime
+
+
+import bot
+from conftest import run
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        self.sent.append(file_id)
+
+
+class FakeApp:
+    def __init__(self):
+        self.bot = FakeBot()
+
+
+async def _insert(file_id, ts):
+    async with bot.acquire_db() as db:
+        await db.execute(
+            "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts) VALUES (?, 'image', ?, ?)",
+            (file_id, ts, ts),
+        )
+        await db.commit()
+
+
+async def _wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_event_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def test_scheduler_posts_overdue_rows_on_start(pool):
+    async def scenario():
+        now_ts = int(datetime.now(bot.IST).timestamp())
+        await _insert("overdue", now_ts - 60)
+        await _insert("later", now_ts + 3600)
+        sched, app = bot.PostScheduler(), FakeApp()
+        task = asyncio.ensure_future(sched.run(app))
+        try:
+            assert await _wait_for(lambda: app.bot.sent == ["overdue"])
+            assert sched.next_due() == now_ts + 3600
+        finally:
+            task.cancel()
+
+    run(scenario())
+
+
+def test_scheduler_wakes_on_push(pool):
+    async def scenario():
+        sched, app = bot.PostScheduler(), FakeApp()
+        task = asyncio.ensure_future(sched.run(app))
+        try:
+            await asyncio.sleep(0.05)
+            assert sched.next_due() is None
+            now_ts = int(datetime.now(bot.IST).timestamp())
+            await _insert("fresh", now_ts)
+            sched.push(now_ts)
+            assert await _wait_for(lambda: app.bot.sent == ["fresh"])
+        finally:
+            task.cancel()
+
+    run(scenario())
+
+
+def test_scheduler_picks_up_rows_written_behind_its_back(pool, monkeypatch):
+    monkeypatch.setattr(bot, "POSTER_RESYNC", 0.1)
+
+    async def scenario():
+        sched, app = bot.PostScheduler(), FakeApp()
+        task = asyncio.ensure_future(sched.run(app))
+        try:
+            await asyncio.sleep(0.05)
+            # e.g. `bot.py import` in another process: no push(), no invalidate()
+            await _insert("imported", int(datetime.now(bot.IST).timestamp()))
+            assert await _wait_for(lambda: app.bot.sent == ["imported"])
+        finally:
+            task.cancel()
+
+    run(scenario())
+
+
+def test_scheduler_releases_a_claim_orphaned_by_a_crash(pool):
+    async def scenario():
+        now_ts = int(datetime.now(bot.IST).timestamp())
+        # left claimed by a process that died mid-post; nothing else is pending
+        async with bot.acquire_db() as db:
+            await db.execute(
+                "INSERT INTO memes (owner_file_id, mime_type, scheduled_ts, created_ts, posted, lease_until)"
+                " VALUES ('orphan', 'image', ?, ?, ?, ?)",
+                (now_ts - 60, now_ts - 60, bot.POSTING, now_ts + 1),
+            )
+            await db.commit()
+        sched, app = bot.PostScheduler(), FakeApp()
+        task = asyncio.ensure_future(sched.run(app))
+        try:
+            assert await _wait_for(lambda: app.bot.sent == ["orphan"], timeout=5)
+        finally:
+            task.cancel()
+
+    run(scenario())
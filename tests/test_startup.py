@@ -0,0 +1,60 @@
+import sys
+from datetime import date, datetime, time
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import bot
+from conftest import run
+
+pytestmark = pytest.mark.usefixtures("unthrottled")
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, file_id, caption=None):
+        self.sent.append(file_id)
+
+
+def test_overdue_memes_post_before_the_heap_is_restored(pool, monkeypatch):
+    now_ts = int(datetime.now(bot.IST).timestamp())
+
+    async def seed():
+        async with bot.acquire_db() as db:
+            await db.execute(
+                "INSERT INTO memes (owner_file_id, mime_type, media_kind, scheduled_ts, created_ts)"
+                " VALUES ('late', 'image', 'photo', ?, ?)",
+                (now_ts - 3600, now_ts),
+            )
+            await db.commit()
+
+    async def no_reload():
+        raise AssertionError("heap restored before the overdue post")
+
+    run(seed())
+    scheduler = bot.PostScheduler()
+    monkeypatch.setattr(scheduler, "reload", no_reload)
+    fake = RecordingBot()
+    run(scheduler.catch_up(SimpleNamespace(bot=fake)))
+    assert fake.sent == ["late"]
+
+
+def test_zoneinfo_slots_follow_dst():
+    cal = bot.SlotCalendar([time(11, 0)], ZoneInfo("America/New_York"))
+    (winter,), (summer,) = cal.slots_on(date(2025, 1, 15)), cal.slots_on(date(2025, 7, 15))
+    assert winter.utcoffset().total_seconds() == -5 * 3600
+    assert summer.utcoffset().total_seconds() == -4 * 3600
+    assert cal.aware(datetime(2025, 7, 15, 11, 0)) == summer
+
+
+def test_profile_startup_reports_init_without_lazy_modules(tmp_path):
+    report = run(bot.profile_startup(str(tmp_path / "memes.db")))
+    assert report.startswith("Startup profile:")
+    for label in ("import telegram", "build application", "open db, migrate", "restore scheduler heap (0)"):
+        assert label in report
+    assert bot.db_pool is None
+    if "PIL" not in sys.modules:
+        assert "PIL" in report.splitlines()[-1]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import signal
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Bot
+
+import bot
+from conftest import run
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "update_private_photo.json")
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = Bot("123456:TEST-TOKEN")
+        self.update_queue = asyncio.Queue()
+        self.running = True
+
+
+async def _with_client(application, scenario):
+    client = TestClient(TestServer(bot.build_webhook_app(application, "s3cret", "/telegram")))
+    await client.start_server()
+    try:
+        return await scenario(client)
+    finally:
+        await client.close()
+
+
+def _recorded_update():
+    with open(FIXTURE) as fh:
+        return json.load(fh)
+
+
+def test_recorded_update_is_queued():
+    application = FakeApplication()
+
+    async def scenario(client):
+        resp = await client.post(
+            "/telegram", json=_recorded_update(), headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        )
+        assert resp.status == 200
+        return application.update_queue.get_nowait()
+
+    update = run(_with_client(application, scenario))
+    assert update.update_id == 10001
+    assert update.message.photo[-1].file_unique_id == "AQADlarge"
+    assert update.message.caption == "monday mood"
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}])
+def test_bad_secret_is_rejected(headers):
+    application = FakeApplication()
+
+    async def scenario(client):
+        resp = await client.post("/telegram", json=_recorded_update(), headers=headers)
+        return resp.status
+
+    assert run(_with_client(application, scenario)) == 403
+    assert application.update_queue.empty()
+
+
+def test_health_and_readiness(monkeypatch):
+    application = FakeApplication()
+
+    async def scenario(client):
+        health = (await client.get("/healthz")).status
+        monkeypatch.setattr(bot, "db_pool", None)
+        not_ready = (await client.get("/readyz")).status
+        monkeypatch.setattr(bot, "db_pool", object())
+        ready = (await client.get("/readyz")).status
+        return health, not_ready, ready
+
+    assert run(_with_client(application, scenario)) == (200, 503, 200)
+
+
+class StubApplication:
+    def __init__(self):
+        self.calls = []
+        self.post_init = self.post_stop = self.post_shutdown = None
+        self.running = True
+        self.bot = self
+
+    async def initialize(self):
+        self.calls.append("initialize")
+
+    async def start(self):
+        self.calls.append("start")
+
+    async def stop(self):
+        self.calls.append("stop")
+
+    async def shutdown(self):
+        self.calls.append("shutdown")
+
+    async def set_webhook(self, url, secret_token=None, allowed_updates=None):
+        self.calls.append(("set_webhook", url, secret_token))
+        # stop the server the way a container stop would
+        asyncio.get_running_loop().call_soon(os.kill, os.getpid(), signal.SIGTERM)
+
+
+def test_run_webhook_starts_and_stops(monkeypatch):
+    monkeypatch.setattr(bot, "WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setattr(bot, "WEBHOOK_PORT", 0)
+    monkeypatch.setattr(bot, "WEBHOOK_URL", "https://example.test/")
+    monkeypatch.setattr(bot, "WEBHOOK_SECRET", "s3cret")
+    application = StubApplication()
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(asyncio.wait_for(bot.run_webhook(application), 10))
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+    assert application.calls == [
+        "initialize", "start", ("set_webhook", "https://example.test/telegram", "s3cret"), "stop", "shutdown",
+    ]